@@ -0,0 +1,363 @@
+"""Кеш-бэкенды, общие для нескольких процессов.
+
+``LocMemCache`` живёт внутри процесса: у каждого воркера gunicorn
+своя копия кеша, и сброс поколения в одном воркере не виден другим.
+
+* ``SQLiteCache`` - общий кеш для всех процессов одной машины
+  в отдельном файле SQLite (режим WAL: чтения не блокируют запись).
+* ``RedisCache`` - кеш для кластера поверх протокола Redis (RESP),
+  без сторонних клиентских библиотек.
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+def _dumps(value):
+    # Целые числа храним как есть, чтобы incr выполнялся на сервере.
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value).encode()
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(data):
+    if data[:1] == b'\x80':
+        return pickle.loads(data)
+    return int(data)
+
+
+def _prefix_bounds(key_prefix):
+    """Границы ключей ``<prefix>:...`` для сравнения строк: [от, до)."""
+    # ';' следует за ':' в ASCII.
+    return f'{key_prefix}:', f'{key_prefix};'
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для процессов одной машины.
+
+    LOCATION - путь к файлу базы; таблица создаётся при первом
+    подключении. Соединения держатся по одному на поток и процесс.
+    Файл могут делить кеши с разными KEY_PREFIX, поэтому clear()
+    удаляет только свои ключи.
+    """
+    # Чистка считает строки полным проходом по таблице, поэтому
+    # выполняется не на каждой записи, а раз в столько записей потока.
+    cull_interval = 100
+    schema = (
+        'CREATE TABLE IF NOT EXISTS cache ('
+        'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+        ') WITHOUT ROWID'
+    )
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(self.schema)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+            'AND (expires IS NULL OR expires > ?)',
+            [*keys, time.time()],
+        )
+        return {keys[key]: _loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version), _dumps(value), expires)
+            for key, value in data.items()
+        ]
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+            self._cull(connection)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, _dumps(value), self.get_backend_timeout(timeout)),
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = _loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (_dumps(value), key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        self._connection().executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+        )
+
+    def clear(self):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key >= ? AND key < ?',
+            _prefix_bounds(self.key_prefix),
+        )
+
+    def _cull(self, connection):
+        writes = getattr(self._local, 'writes', 0) + 1
+        self._local.writes = writes
+        if writes % self.cull_interval:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY expires LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
+
+
+class RedisError(Exception):
+    pass
+
+
+# EXISTS и INCRBY одной командой: между ними ключ не может истечь.
+INCR_SCRIPT = (
+    "if redis.call('EXISTS', KEYS[1]) == 1 then "
+    "return redis.call('INCRBY', KEYS[1], ARGV[1]) end"
+)
+
+
+def _glob_escape(text):
+    return ''.join('\\' + char if char in '*?[]\\' else char
+                   for char in text)
+
+
+class RedisCache(BaseCache):
+    """Кеш на сервере Redis (или совместимом: KeyDB, Dragonfly).
+
+    LOCATION - ``host:port`` или ``host:port/db``. Соединения держатся
+    по одному на поток и процесс. clear() удаляет только ключи своего
+    KEY_PREFIX (SCAN по шаблону), а не всю базу ``db``.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        address, _, db = location.partition('/')
+        host, _, port = address.rpartition(':')
+        self._address = (host or 'localhost', int(port or 6379))
+        self._db = int(db or 0)
+        self._local = threading.local()
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            sock = socket.create_connection(self._address, timeout=5)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+            self._local.reader = sock.makefile('rb')
+            self._local.pid = pid
+            if self._db:
+                self._command('SELECT', self._db)
+        return self._local.sock, self._local.reader
+
+    def _command(self, *args):
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply(reader)
+        except OSError:
+            self._local.pid = None
+            raise
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Redis закрыл соединение')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f'Неизвестный ответ: {line!r}')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expiry(self, timeout):
+        """Аргументы PX для SET; None - без срока, 0 - ключ не хранить."""
+        expires = self.get_backend_timeout(timeout)
+        if expires is None:
+            return ()
+        return ('PX', max(int((expires - time.time()) * 1000), 1))
+
+    def get(self, key, default=None, version=None):
+        value = self._command('GET', self._key(key, version))
+        return default if value is None else _loads(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        values = self._command('MGET', *keys)
+        return {
+            original: _loads(value)
+            for original, value in zip(keys.values(), values)
+            if value is not None
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        if timeout == 0:
+            self._command('DEL', key)
+            return
+        self._command('SET', key, _dumps(value), *self._expiry(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout == 0:
+            return False
+        reply = self._command(
+            'SET', self._key(key, version), _dumps(value),
+            'NX', *self._expiry(timeout)
+        )
+        return reply is not None
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expiry = self._expiry(timeout)
+        if not expiry:
+            return self._command('PERSIST', key) == 1 or self.has_key(key)
+        return self._command('PEXPIRE', key, expiry[1]) == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        value = self._command('EVAL', INCR_SCRIPT, 1, key, delta)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def has_key(self, key, version=None):
+        return self._command('EXISTS', self._key(key, version)) == 1
+
+    def delete(self, key, version=None):
+        self._command('DEL', self._key(key, version))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._command('DEL', *keys)
+
+    def clear(self):
+        pattern = _glob_escape(_prefix_bounds(self.key_prefix)[0]) + '*'
+        cursor = b'0'
+        while True:
+            cursor, keys = self._command(
+                'SCAN', cursor, 'MATCH', pattern, 'COUNT', 1000
+            )
+            if keys:
+                self._command('DEL', *keys)
+            if cursor == b'0':
+                break
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами.
+        pass
@@ -0,0 +1,129 @@
+"""Чтение лент с реплик базы.
+
+Реплики - псевдонимы из ``settings.DATABASE_REPLICAS``, копии основной
+базы ``default`` только для чтения. ``ReplicaRouter`` отправляет на
+реплику чтения view, помеченных ``@replica_reads``, а запись и все
+остальные чтения - на основную базу. Без реплик в настройках всё
+работает как раньше.
+
+Реплика отстаёт от основной базы, поэтому основная база читается:
+
+* после записи в том же запросе;
+* в окне ``REPLICA_PIN_SECONDS`` после записи пользователя - метка
+  хранится в его сессии (read-your-writes);
+* если ленты страницы менялись в последние ``REPLICA_PIN_SECONDS``
+  (``caching.bump``) - иначе страница с реплики без изменения попадёт
+  в кеш с новым поколением и ETag.
+
+Окно должно быть больше отставания реплик.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_SESSION_KEY = '_replica_pinned_until'
+
+_state = ContextVar('replica_state', default=None)
+
+
+class RequestState:
+    """Куда читает текущий запрос и писал ли он в базу."""
+
+    def __init__(self):
+        self.replica = None
+        self.primary_required = False
+        self.wrote = False
+
+
+def require_primary():
+    """Текущий запрос читает только основную базу."""
+    state = _state.get()
+    if state is not None:
+        state.primary_required = True
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and (
+        session.get(PIN_SESSION_KEY, 0) > time.time()
+    )
+
+
+def replica_reads(view):
+    """Чтения GET-запроса к view идут на случайную реплику."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        if (
+            state is None
+            or request.method not in ('GET', 'HEAD')
+            or state.primary_required
+            or is_pinned(request)
+        ):
+            return view(request, *args, **kwargs)
+        state.replica = random.choice(settings.DATABASE_REPLICAS)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica = None
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """Заводит состояние запроса и закрепляет писавшего за основной базой."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and hasattr(request, 'session'):
+            request.session[PIN_SESSION_KEY] = (
+                time.time() + settings.REPLICA_PIN_SECONDS
+            )
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        # Сессии всегда с основной базы: новая сессия могла ещё не
+        # доехать до реплики, и пользователь оказался бы разлогинен.
+        if (
+            state is not None
+            and state.replica
+            and not state.wrote
+            and model._meta.app_label != 'sessions'
+        ):
+            return state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Все базы проекта - основная и её копии с теми же данными.
+        databases = settings.DATABASES
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной базы вместе с данными.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,178 @@
+"""SQLite под конкурентной записью: ``ENGINE = 'core.db.sqlite3'``.
+
+Обёртка над стандартным бэкендом:
+
+* на каждом новом подключении (сигнал ``connection_created``)
+  выполняются PRAGMA из ``settings.SQLITE_PRAGMAS``: WAL, чтобы чтения
+  не ждали запись, ``synchronous=NORMAL``, ``mmap_size``,
+  ``cache_size`` и ``busy_timeout``;
+* записи процесса идут через очередь (``WriteQueue``): транзакция
+  ``atomic`` начинается обычным (отложенным) ``BEGIN`` и встаёт в
+  очередь на первой записи, после чего держит её до коммита или
+  отката; одиночная запись в autocommit - на время запроса. Чтения, в
+  том числе транзакции только на чтение, очередь не трогают и идут
+  параллельно.
+
+Первая запись превращает транзакцию чтения в пишущую. В WAL SQLite
+ждёт блокировку записи до busy_timeout, а очередь убирает конкуренцию
+за неё между потоками процесса. Сразу (SQLITE_BUSY, ``database is
+locked``) запись падает, только если транзакция уже читала, а другое
+подключение успело закоммитить после её первого чтения: снимок устарел.
+Транзакции, которые читают и затем пишут одни и те же строки, лучше
+начинать с записи.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+from django.dispatch import receiver
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class WriteQueue:
+    """Право записи в базу: потоки получают его по одному, по порядку."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._held = False
+        # Сколько раз выдано право записи и сколько секунд его ждали.
+        self.acquired = 0
+        self.waited = 0.0
+
+    def __len__(self):
+        """Число потоков в очереди."""
+        return len(self._waiting)
+
+    def acquire(self, timeout=None):
+        ticket = object()
+        started = time.perf_counter()
+        with self._condition:
+            self._waiting.append(ticket)
+            acquired = self._condition.wait_for(
+                lambda: not self._held and self._waiting[0] is ticket,
+                timeout,
+            )
+            self._waiting.remove(ticket)
+            if acquired:
+                self._held = True
+                self.acquired += 1
+                self.waited += time.perf_counter() - started
+            else:
+                # Следующий в очереди мог ждать, пока уйдёт этот поток.
+                self._condition.notify_all()
+            return acquired
+
+    def release(self):
+        with self._condition:
+            self._held = False
+            self._condition.notify_all()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(name):
+    """Очередь записи файла базы, общая для всех подключений процесса."""
+    with _queues_lock:
+        return _queues.setdefault(name, WriteQueue())
+
+
+def is_write(query):
+    return query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    def execute(self, query, params=None):
+        with self.db.writing(query):
+            return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        with self.db.writing(query):
+            return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.holds_write_queue = False
+
+    @property
+    def write_queue(self):
+        # Имя читается каждый раз: тесты подменяют его на тестовую базу.
+        return get_write_queue(self.settings_dict['NAME'])
+
+    def _acquire_write_queue(self):
+        if not settings.SQLITE_SERIALIZE_WRITES:
+            return False
+        timeout = settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000
+        if not self.write_queue.acquire(timeout):
+            raise OperationalError(
+                f'database is locked: очередь записи не подошла '
+                f'за {timeout:g} с'
+            )
+        return True
+
+    def _release_write_queue(self):
+        if self.holds_write_queue:
+            self.holds_write_queue = False
+            self.write_queue.release()
+
+    @contextmanager
+    def writing(self, query):
+        """Первая запись транзакции занимает очередь до её конца.
+
+        Одиночная запись вне транзакции держит очередь весь запрос.
+        """
+        if self.holds_write_queue or not is_write(query):
+            yield
+            return
+        acquired = self._acquire_write_queue()
+        if not self.get_autocommit():
+            self.holds_write_queue = acquired
+            yield
+            return
+        try:
+            yield
+        finally:
+            if acquired:
+                self.write_queue.release()
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.db = self
+        return cursor
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_queue()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_queue()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_queue()
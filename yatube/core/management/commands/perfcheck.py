@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.core.cache import caches
+from django.core.files.storage import get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+
+from posts import search
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+CACHED_SESSIONS = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.signed_cookies',
+)
+GZIP = 'django.middleware.gzip.GZipMiddleware'
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка при старте: какие настройки производительности '
+        'действуют в текущем профиле (YATUBE_ENV).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help='Завершиться с ошибкой, если есть '
+                                 'предупреждения.')
+
+    def checks(self):
+        """(успех, описание) по каждой настройке."""
+        yield not settings.DEBUG, f'DEBUG={settings.DEBUG}'
+        for alias in connections:
+            age = connections.databases[alias].get('CONN_MAX_AGE', 0)
+            yield age is None or age > 0, (
+                f'база {alias}: CONN_MAX_AGE={age}'
+                + ('' if age is None or age > 0
+                   else ' - подключение на каждый запрос')
+            )
+            if connections[alias].vendor == 'sqlite':
+                yield from self.check_sqlite(alias)
+        yield True, (
+            'чтение лент с реплик: '
+            + (', '.join(settings.DATABASE_REPLICAS) or 'нет реплик')
+        )
+        for alias in settings.CACHES:
+            yield from self.check_cache(alias)
+        yield settings.SESSION_ENGINE in CACHED_SESSIONS, (
+            f'сессии: {settings.SESSION_ENGINE}'
+        )
+        engine = engines['django'].engine
+        cached = any(isinstance(loader, CachedLoader)
+                     for loader in engine.template_loaders)
+        yield cached, (
+            'шаблоны: кеширующий загрузчик' if cached
+            else 'шаблоны: разбираются на каждый рендер'
+        )
+        yield settings.TEMPLATE_WARMUP, (
+            f'прогрев шаблонов при старте: {settings.TEMPLATE_WARMUP}'
+        )
+        yield from self.check_static()
+        yield settings.MIDDLEWARE[:1] == [GZIP], (
+            'сжатие ответов: ' + ('GZipMiddleware первым'
+                                  if settings.MIDDLEWARE[:1] == [GZIP]
+                                  else 'выключено')
+        )
+        yield settings.THUMBNAIL_WORKERS > 0, (
+            f'фоновых потоков миниатюр: {settings.THUMBNAIL_WORKERS}'
+        )
+        yield True, f'поиск: {type(search.get_index()).__name__}'
+
+    def check_sqlite(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            mode = cursor.fetchone()[0]
+        yield mode == 'wal', f'база {alias}: journal_mode={mode}'
+        serialized = settings.SQLITE_SERIALIZE_WRITES and hasattr(
+            connections[alias], 'write_queue'
+        )
+        yield serialized, (
+            f'база {alias}: очередь записи '
+            + ('включена' if serialized else 'выключена')
+        )
+
+    def check_cache(self, alias):
+        backend = settings.CACHES[alias]['BACKEND']
+        yield backend not in LOCAL_CACHES, (
+            f'кеш {alias}: {backend}'
+            + (' - у каждого процесса свой' if backend in LOCAL_CACHES
+               else '')
+        )
+        cache = caches[alias]
+        try:
+            cache.set('perfcheck', 1, 10)
+            alive = cache.get('perfcheck') == 1
+            cache.delete('perfcheck')
+        except Exception as error:
+            alive, detail = False, f'{type(error).__name__}: {error}'
+        else:
+            detail = 'отвечает' if alive else 'не сохраняет значения'
+        yield alive, f'кеш {alias}: {detail}'
+
+    def check_static(self):
+        storage = get_storage_class(settings.STATICFILES_STORAGE)
+        manifest = issubclass(storage, ManifestStaticFilesStorage)
+        yield manifest, f'статика: {storage.__name__}'
+        if manifest:
+            collected = staticfiles_storage.exists(
+                staticfiles_storage.manifest_name
+            )
+            yield collected, (
+                'манифест статики: ' + ('есть' if collected
+                                        else 'нет, запустите collectstatic')
+            )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Профиль: {settings.YATUBE_ENV}')
+        warnings = 0
+        for ok, message in self.checks():
+            if ok:
+                self.stdout.write(self.style.SUCCESS(f'  [OK]   {message}'))
+            else:
+                warnings += 1
+                self.stdout.write(self.style.WARNING(f'  [WARN] {message}'))
+        if warnings and options['strict']:
+            raise CommandError(f'Предупреждений: {warnings}')
@@ -0,0 +1,278 @@
+"""Замеры производительности каждого запроса.
+
+``PerfMiddleware`` заводит запись запроса и собирает в неё:
+
+* общее время;
+* число и время SQL-запросов ко всем базам (``execute_wrapper``);
+* события кеша (``count``: попадания и промахи лент и карточек);
+* время рендера шаблонов и поиска миниатюр (``timer``).
+
+Итог уходит в заголовок ``Server-Timing`` (видно во вкладке Network
+браузера) и в ``registry``: гистограммы времени по view считаются
+по всем запросам, а доля ``PERF_SAMPLE_RATE`` запросов целиком
+попадает в кольцевой буфер на ``PERF_RING_SIZE`` записей.
+Гистограммы отдаются страницей ``/admin/perf/`` для персонала и
+текстом для Prometheus на ``/metrics``.
+
+Данные живут в памяти процесса: у каждого воркера свои, Prometheus
+собирает их с каждого.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Верхние границы корзин гистограммы времени ответа, секунды.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Метки Server-Timing для замеров timer().
+TIMINGS = {'template': 'tpl', 'thumbnail': 'thumb'}
+
+_current = ContextVar('perf_record', default=None)
+
+
+class RequestRecord:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.status = None
+        self.total = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.events = Counter()
+        self.timings = Counter()
+        self._active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def as_dict(self):
+        return {
+            'view': self.view, 'status': self.status, 'total': self.total,
+            'db_queries': self.db_queries, 'db_time': self.db_time,
+            'events': dict(self.events), 'timings': dict(self.timings),
+        }
+
+    def server_timing(self):
+        entries = [
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.db_queries} queries"',
+        ]
+        for name, label in TIMINGS.items():
+            if name in self.timings:
+                entries.append(f'{label};dur={self.timings[name] * 1000:.1f}')
+        if self.events:
+            events = ' '.join(f'{event}={number}' for event, number
+                              in sorted(self.events.items()))
+            entries.append(f'cache;desc="{events}"')
+        return ', '.join(entries)
+
+
+def current():
+    """Запись текущего запроса или None вне запроса."""
+    return _current.get()
+
+
+def count(event, amount=1):
+    record = _current.get()
+    if record is not None:
+        record.events[event] += amount
+
+
+@contextmanager
+def timer(name):
+    """Добавляет время блока к замеру ``name`` текущего запроса.
+
+    Вложенные блоки с тем же именем не считаются дважды.
+    """
+    record = _current.get()
+    if record is None or name in record._active:
+        yield
+        return
+    record._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.timings[name] += time.perf_counter() - started
+        record._active.discard(name)
+
+
+class ViewStats:
+    """Накопленные замеры одного view."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.events = Counter()
+        self.timings = Counter()
+
+    def observe(self, record):
+        self.buckets[bisect_left(BUCKETS, record.total)] += 1
+        self.count += 1
+        self.total += record.total
+        self.db_queries += record.db_queries
+        self.db_time += record.db_time
+        self.events.update(record.events)
+        self.timings.update(record.timings)
+
+
+class Registry:
+    def __init__(self, ring_size=None):
+        self._lock = threading.Lock()
+        self.views = {}
+        self.ring = deque(maxlen=ring_size or settings.PERF_RING_SIZE)
+
+    def observe(self, record, sampled=True):
+        with self._lock:
+            stats = self.views.get(record.view)
+            if stats is None:
+                stats = self.views[record.view] = ViewStats()
+            stats.observe(record)
+            if sampled:
+                self.ring.append(record.as_dict())
+
+    def clear(self):
+        with self._lock:
+            self.views.clear()
+            self.ring.clear()
+
+    def samples(self):
+        with self._lock:
+            return list(self.ring)
+
+    def summary(self):
+        """Строки /admin/perf/ в мс: средние по view, перцентили по буферу."""
+        samples = self.samples()
+        rows = []
+        with self._lock:
+            for view, stats in sorted(self.views.items()):
+                totals = [sample['total'] for sample in samples
+                          if sample['view'] == view]
+                share = 1000 / stats.count
+                rows.append({
+                    'view': view,
+                    'count': stats.count,
+                    'mean': stats.total * share,
+                    'p50': percentile(totals, 0.5) * 1000,
+                    'p95': percentile(totals, 0.95) * 1000,
+                    'p99': percentile(totals, 0.99) * 1000,
+                    'queries': stats.db_queries / stats.count,
+                    'db': stats.db_time * share,
+                    'template': stats.timings['template'] * share,
+                    'thumbnail': stats.timings['thumbnail'] * share,
+                    'events': sorted(stats.events.items()),
+                })
+        return rows
+
+    def prometheus(self):
+        """Гистограммы и счётчики по view в текстовом формате Prometheus."""
+        with self._lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP yatube_request_duration_seconds Время ответа.',
+                '# TYPE yatube_request_duration_seconds histogram',
+            ]
+            for view, stats in views:
+                cumulative = 0
+                for bound, number in zip(BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += number
+                    lines.append(
+                        'yatube_request_duration_seconds_bucket'
+                        f'{{view="{view}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'yatube_request_duration_seconds_sum'
+                             f'{{view="{view}"}} {stats.total}')
+                lines.append(f'yatube_request_duration_seconds_count'
+                             f'{{view="{view}"}} {stats.count}')
+            counters = (
+                ('db_queries_total', 'SQL-запросов.',
+                 lambda stats: {'': stats.db_queries}),
+                ('db_seconds_total', 'Время SQL-запросов.',
+                 lambda stats: {'': stats.db_time}),
+                ('render_seconds_total',
+                 'Время рендера шаблонов и поиска миниатюр.',
+                 lambda stats: {f'stage="{name}"': value
+                                for name, value in stats.timings.items()}),
+                ('cache_events_total', 'События кеша лент и карточек.',
+                 lambda stats: {f'event="{event}"': value
+                                for event, value in stats.events.items()}),
+            )
+            for name, help_text, values in counters:
+                lines += [f'# HELP yatube_{name} {help_text}',
+                          f'# TYPE yatube_{name} counter']
+                for view, stats in views:
+                    for labels, value in sorted(values(stats).items()):
+                        labels = ','.join(filter(None, [f'view="{view}"',
+                                                        labels]))
+                        lines.append(f'yatube_{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def percentile(values, share):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry()
+        return _registry
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name
+
+
+class PerfMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PERF_ENABLED:
+            return self.get_response(request)
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record.total = time.perf_counter() - started
+        record.view = view_name(request)
+        record.status = response.status_code
+        get_registry().observe(
+            record, sampled=random.random() < settings.PERF_SAMPLE_RATE
+        )
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = record.server_timing()
+        return response
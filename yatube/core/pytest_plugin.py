@@ -0,0 +1,43 @@
+"""Плагин pytest: N+1 во views приложения posts роняет тест.
+
+Подключается через ``pytest_plugins = ['core.pytest_plugin']`` и
+включается флагом ``--nplusone`` или строкой ``nplusone = true``
+в pytest.ini. Каждый тест идёт внутри ``querylog.detecting()``;
+если хоть один запрос к view из posts/urls.py повторил один и тот же
+SQL из одного места ``NPLUSONE_THRESHOLD`` раз, тест получает ошибку
+со списком найденного.
+"""
+import pytest
+
+# Пространство имён posts/urls.py.
+NAMESPACE = 'posts:'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--nplusone', action='store_true',
+                     help='Ронять тесты, если во views posts есть N+1.')
+    parser.addini('nplusone', type='bool', default=False,
+                  help='Ронять тесты, если во views posts есть N+1.')
+
+
+@pytest.fixture(autouse=True)
+def nplusone_guard(request):
+    config = request.config
+    if not (config.getoption('nplusone') or config.getini('nplusone')):
+        yield
+        return
+    # Импорт здесь: модулю нужны настроенные settings.
+    from core import querylog
+
+    with querylog.detecting() as found:
+        yield
+    problems = [
+        item for item in found
+        if isinstance(item, querylog.NPlusOne)
+        and item.view.startswith(NAMESPACE)
+    ]
+    if problems:
+        pytest.fail('N+1 во views posts:\n' + '\n'.join(
+            f'{item.view}: {item.count} раз из {item.origin}: '
+            f'{item.fingerprint}' for item in problems
+        ), pytrace=False)
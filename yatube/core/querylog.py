@@ -0,0 +1,195 @@
+"""Журнал медленных SQL-запросов и поиск N+1.
+
+``QueryLogMiddleware`` для доли ``QUERYLOG_SAMPLE_RATE`` запросов
+(и для всех внутри ``detecting()``) записывает каждый SQL-запрос
+с отпечатком - текстом без литералов и списков параметров - и местом
+вызова: строкой шаблона или строкой кода проекта. После ответа:
+
+* отпечаток, повторённый ``NPLUSONE_THRESHOLD`` раз и больше, - это
+  N+1, например ленивое ``comment.author`` в цикле шаблона;
+* запрос дольше ``SLOW_QUERY_MS`` пишется в лог вместе с ``EXPLAIN``.
+
+Отчёты уходят в логгер ``core.querylog``; тесты собирают их через
+``detecting()`` (и плагин pytest ``core.pytest_plugin``).
+"""
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+from . import perf
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+_RENDER_ANNOTATED = Node.render_annotated.__code__
+# Обёртки запросов в core: место вызова ищется выше них. manage.py
+# есть в стеке любого запроса из runserver и тестов, это не место вызова.
+_WRAPPERS = tuple(
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ('db' + os.sep, 'perf.py', 'querylog.py')
+) + (os.path.join(settings.BASE_DIR, 'manage.py'),)
+
+NPlusOne = namedtuple('NPlusOne', 'view fingerprint count origin')
+SlowQuery = namedtuple('SlowQuery', 'view sql duration origin plan')
+
+_collectors = []
+_background = ContextVar('querylog_background', default=False)
+
+
+def fingerprint(sql):
+    """Запрос без литералов: у повторов N+1 отпечаток одинаковый."""
+    sql = _NUMBER.sub('?', _STRING.sub('?', sql))
+    return _SPACE.sub(' ', _LIST.sub('(...)', sql)).strip()
+
+
+def origin():
+    """Место запроса: строка кода проекта и строка шаблона, если есть.
+
+    Например ``posts/thumbnails.py:76 (lookup) < posts/index.html:6``
+    или просто ``posts/comments.html:21`` для ленивого поля в шаблоне.
+    """
+    code = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code is _RENDER_ANNOTATED:
+            node = frame.f_locals['self']
+            name = node.origin.template_name or node.origin.name
+            template = f'{name}:{node.token.lineno}'
+            return f'{code} < {template}' if code else template
+        filename = frame.f_code.co_filename
+        if (code is None and filename.startswith(settings.BASE_DIR)
+                and not filename.startswith(_WRAPPERS)):
+            code = (f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                    f'{frame.f_lineno} ({frame.f_code.co_name})')
+        frame = frame.f_back
+    return code or '?'
+
+
+def explain(connection, sql, params):
+    """План запроса или пустая строка для не-SELECT."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.explain_query_prefix()} {sql}', params
+        )
+        return '\n'.join(
+            ' '.join(str(column) for column in row)
+            for row in cursor.fetchall()
+        )
+
+
+class QueryLog:
+    """SQL-запросы одного HTTP-запроса."""
+
+    def __init__(self):
+        self.origins = defaultdict(Counter)
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if _background.get():
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            where = origin()
+            self.origins[fingerprint(sql)][where] += 1
+            if duration * 1000 >= settings.SLOW_QUERY_MS:
+                self.slow.append((context['connection'], sql, params,
+                                  duration, where))
+
+    @contextmanager
+    def recording(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def n_plus_one(self, view):
+        # Один запрос из разных мест (пользователь в middleware и
+        # в сигнале) - не N+1: считаются повторы из одного места.
+        return [
+            NPlusOne(view, sql, count, where)
+            for sql, origins in self.origins.items()
+            for where, count in origins.most_common()
+            if count >= settings.NPLUSONE_THRESHOLD
+        ]
+
+    def slow_queries(self, view):
+        return [
+            SlowQuery(view, sql, duration, where,
+                      explain(connection, sql, params))
+            for connection, sql, params, duration, where in self.slow
+        ]
+
+
+def report(log, view):
+    """Пишет найденное в лог и отдаёт собирающим ``detecting()``."""
+    reports = log.n_plus_one(view) + log.slow_queries(view)
+    for found in reports:
+        if isinstance(found, NPlusOne):
+            logger.warning('N+1 в %s: %d раз из %s: %s', found.view,
+                           found.count, found.origin, found.fingerprint)
+        else:
+            logger.warning('Медленный запрос в %s, %.0f мс, из %s: %s\n%s',
+                           found.view, found.duration * 1000, found.origin,
+                           found.sql, found.plan)
+        for collected in _collectors:
+            collected.append(found)
+    return reports
+
+
+@contextmanager
+def background():
+    """Не записывает запросы фоновой работы, выполненной прямо в запросе.
+
+    Например, миниатюр при ``THUMBNAIL_WORKERS = 0``: в пуле потоков
+    их запросы к view не относятся.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+@contextmanager
+def detecting():
+    """Записывает все запросы и собирает отчёты в список."""
+    collected = []
+    _collectors.append(collected)
+    try:
+        yield collected
+    finally:
+        _collectors.remove(collected)
+
+
+class QueryLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _collectors and (
+            random.random() >= settings.QUERYLOG_SAMPLE_RATE
+        ):
+            return self.get_response(request)
+        with QueryLog().recording() as log:
+            response = self.get_response(request)
+        report(log, perf.view_name(request))
+        return response
@@ -0,0 +1,61 @@
+"""Бэкенд шаблонов с замером рендера и прогрев кеширующего загрузчика.
+
+``DjangoTemplates`` - стандартный бэкенд, который добавляет время
+рендера к замерам запроса (``core.perf``).
+
+С ``django.template.loaders.cached.Loader`` шаблон читается с диска и
+разбирается один раз на процесс - при первом рендере. ``warm_up``
+компилирует все шаблоны заранее, при старте воркера: первые запросы не
+платят за разбор ``base.html``, ``header.html`` и остальных, а ошибка
+синтаксиса в шаблоне видна сразу, а не на редкой странице.
+"""
+import os
+
+from django.template import engines
+from django.template.backends import django as django_backend
+
+from . import perf
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with perf.timer('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def template_names(engine):
+    """Имена всех шаблонов в каталогах загрузчиков движка."""
+    names = set()
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for filename in files:
+                        if filename.startswith('.'):
+                            continue
+                        path = os.path.join(root, filename)
+                        names.add(os.path.relpath(path, directory).replace(
+                            os.sep, '/'
+                        ))
+    return sorted(names)
+
+
+def warm_up(engine=None):
+    """Компилирует все шаблоны движка (по умолчанию - из настроек).
+
+    Возвращает число шаблонов.
+    """
+    if engine is None:
+        engine = engines['django'].engine
+    names = template_names(engine)
+    for name in names:
+        engine.get_template(name)
+    return len(names)
@@ -1,5 +1,32 @@
+import fnmatch
+import importlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
 from http import HTTPStatus
-from django.test import Client, TestCase
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from . import perf, querylog
+from .cache_backends import RedisCache, SQLiteCache
+from .db.sqlite3.base import DatabaseWrapper, WriteQueue
+from .templates import template_names, warm_up
+from .views import csrf_failure, permission_denied
 
 
 class ViewTestClass(TestCase):
@@ -10,3 +37,446 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+    def test_forbidden_pages(self):
+        """Страницы 403 и ошибки CSRF рендерятся."""
+        request = RequestFactory().get('/')
+        self.assertEqual(permission_denied(request, None).status_code, 403)
+        self.assertContains(csrf_failure(request), 'CSRF')
+
+
+class TemplateWarmUpTest(TestCase):
+    def test_all_templates_compiled(self):
+        """Прогрев кладёт в кеш загрузчика все шаблоны проекта."""
+        backend = DjangoTemplates({
+            'NAME': 'warm',
+            'DIRS': [settings.TEMPLATES_DIR],
+            'APP_DIRS': False,
+            'OPTIONS': {'loaders': [(
+                'django.template.loaders.cached.Loader',
+                ['django.template.loaders.filesystem.Loader',
+                 'django.template.loaders.app_directories.Loader'],
+            )]},
+        })
+        loader = backend.engine.template_loaders[0]
+        names = template_names(backend.engine)
+        self.assertIn('posts/index.html', names)
+        self.assertIn('admin/base.html', names)
+        self.assertEqual(warm_up(backend.engine), len(names))
+        self.assertEqual(set(loader.get_template_cache), set(names))
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(location, {'KEY_PREFIX': 'posts'})
+        self.other_process_cache = SQLiteCache(location,
+                                               {'KEY_PREFIX': 'posts'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_values_are_shared(self):
+        """Значение видно через другое подключение к тому же файлу."""
+        self.cache.set('key', {'posts': [1, 2]})
+        self.assertEqual(self.other_process_cache.get('key'),
+                         {'posts': [1, 2]})
+        self.other_process_cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_incr_and_expiry(self):
+        """add не перезаписывает ключ, incr атомарен, TTL соблюдается."""
+        self.assertTrue(self.cache.add('gen', 1, None))
+        self.assertFalse(self.other_process_cache.add('gen', 5))
+        self.assertEqual(self.other_process_cache.incr('gen'), 2)
+        self.assertEqual(self.cache.get_many(['gen', 'missing']),
+                         {'gen': 2})
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'value', 0)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_key_prefix_namespaces(self):
+        """Префиксы приложений не пересекаются в общем хранилище."""
+        location = os.path.join(self.directory, 'cache.sqlite3')
+        default = SQLiteCache(location, {'KEY_PREFIX': 'yatube'})
+        self.cache.set('key', 'posts')
+        default.set('key', 'default')
+        self.assertEqual(self.cache.get('key'), 'posts')
+        self.assertEqual(default.get('key'), 'default')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(default.get('key'), 'default')
+
+    def test_cull_runs_periodically(self):
+        """Лишние записи удаляются раз в cull_interval записей."""
+        location = os.path.join(self.directory, 'cull.sqlite3')
+        small = SQLiteCache(location, {'OPTIONS': {'MAX_ENTRIES': 4}})
+        small.cull_interval = 5
+        for i in range(4):
+            small.set(f'key{i}', i)
+        small.set_many({f'more{i}': i for i in range(4)})
+        self.assertEqual(len(small.get_many(
+            [f'key{i}' for i in range(4)] + [f'more{i}' for i in range(4)]
+        )), 6)
+
+
+class FakeRedis(threading.Thread):
+    """Сервер RESP в памяти: записывает команды и хранит строки."""
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.location = '127.0.0.1:%d' % self.listener.getsockname()[1]
+        self.commands = []
+        self.data = {}
+
+    def run(self):
+        client, _ = self.listener.accept()
+        reader = client.makefile('rb')
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(reader.readline()[1:])
+                args.append(reader.read(length + 2)[:-2])
+            self.commands.append(args[0].decode())
+            client.sendall(self.reply(args[0].decode(), args[1:]))
+        client.close()
+
+    def encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(
+                self.encode(item) for item in value
+            )
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def reply(self, command, args):
+        if command == 'SET':
+            if b'NX' in args and args[0] in self.data:
+                return self.encode(None)
+            self.data[args[0]] = args[1]
+            return b'+OK\r\n'
+        if command == 'GET':
+            return self.encode(self.data.get(args[0]))
+        if command == 'EVAL':
+            # Сценарий INCR_SCRIPT.
+            if args[2] not in self.data:
+                return self.encode(None)
+            value = int(self.data[args[2]]) + int(args[3])
+            self.data[args[2]] = str(value).encode()
+            return self.encode(value)
+        if command == 'SCAN':
+            pattern = args[args.index(b'MATCH') + 1].decode()
+            keys = [key for key in self.data
+                    if fnmatch.fnmatchcase(key.decode(), pattern)]
+            return self.encode([b'0', keys])
+        if command == 'DEL':
+            return self.encode(sum(
+                self.data.pop(key, None) is not None for key in args
+            ))
+        return b'-ERR unknown command\r\n'
+
+
+class RedisCacheTest(TestCase):
+    def setUp(self):
+        self.server = FakeRedis()
+        self.server.start()
+        self.cache = RedisCache(self.server.location, {'KEY_PREFIX': 'posts'})
+
+    def tearDown(self):
+        self.cache._local.sock.close()
+        self.server.join(5)
+        self.server.listener.close()
+
+    def test_values_round_trip(self):
+        """Числа хранятся строкой, остальное - pickle."""
+        self.cache.set('key', {'posts': [1, 2]})
+        self.cache.set('gen', 7)
+        self.assertEqual(self.cache.get('key'), {'posts': [1, 2]})
+        self.assertEqual(self.server.data[b'posts:1:gen'], b'7')
+        self.assertTrue(self.cache.add('new', 1))
+        self.assertFalse(self.cache.add('new', 2))
+
+    def test_incr_is_one_command(self):
+        """incr - один сценарий на сервере; нет ключа - ValueError."""
+        self.cache.set('gen', 1)
+        self.assertEqual(self.cache.incr('gen', 2), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.assertEqual(self.server.commands, ['SET', 'EVAL', 'EVAL'])
+
+    def test_clear_keeps_other_prefixes(self):
+        """clear удаляет только ключи своего KEY_PREFIX."""
+        self.server.data[b'yatube:1:key'] = b'1'
+        self.cache.set('key', 1)
+        self.cache.clear()
+        self.assertEqual(list(self.server.data), [b'yatube:1:key'])
+        self.assertNotIn('FLUSHDB', self.server.commands)
+
+
+@skipUnless(os.environ.get('YATUBE_TEST_REDIS'),
+            'нужен сервер Redis: YATUBE_TEST_REDIS=host:port/db')
+class RedisServerTest(TestCase):
+    def setUp(self):
+        location = os.environ['YATUBE_TEST_REDIS']
+        self.cache = RedisCache(location, {'KEY_PREFIX': 'yatube-test'})
+        self.other = RedisCache(location, {'KEY_PREFIX': 'yatube-other'})
+        self.addCleanup(self.cache.clear)
+        self.addCleanup(self.other.clear)
+
+    def test_cache_operations(self):
+        """Операции кеша на настоящем сервере."""
+        self.assertTrue(self.cache.add('gen', 1, None))
+        self.assertEqual(self.cache.incr('gen', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'value', 0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.other.set('gen', 'other')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('gen'))
+        self.assertEqual(self.other.get('gen'), 'other')
+
+
+class SettingsProfilesTest(TestCase):
+    # perfcheck проверяет все базы из DATABASES.
+    databases = {'default', 'replica'}
+
+    def test_test_profile_selected(self):
+        """Под тестами выбирается профиль test."""
+        self.assertEqual(settings.YATUBE_ENV, 'test')
+        self.assertEqual(settings.THUMBNAIL_WORKERS, 0)
+
+    def test_prod_profile(self):
+        """Профиль prod включает настройки для работы под нагрузкой."""
+        with mock.patch.dict(os.environ, YATUBE_SECRET_KEY='prod-secret'):
+            prod = importlib.reload(
+                importlib.import_module('yatube.settings.prod')
+            )
+        self.assertEqual(prod.SECRET_KEY, 'prod-secret')
+        self.assertFalse(prod.DEBUG)
+        self.assertEqual(prod.DATABASES['default']['CONN_MAX_AGE'], 60)
+        self.assertNotIn('LocMemCache', prod.CACHES['posts']['BACKEND'])
+        self.assertEqual(prod.MIDDLEWARE[0],
+                         'django.middleware.gzip.GZipMiddleware')
+        for middleware in prod.INSTRUMENTATION:
+            self.assertNotIn(middleware, prod.MIDDLEWARE)
+        self.assertFalse(prod.PERF_SERVER_TIMING)
+        options = prod.TEMPLATES[0]['OPTIONS']
+        self.assertEqual(options['loaders'][0][0],
+                         'django.template.loaders.cached.Loader')
+        self.assertNotIn('django.template.context_processors.debug',
+                         options['context_processors'])
+        self.assertTrue(prod.TEMPLATE_WARMUP)
+        base = importlib.import_module('yatube.settings.base')
+        self.assertTrue(base.TEMPLATES[0]['APP_DIRS'])
+
+    def test_prod_requires_secret_key(self):
+        """Без YATUBE_SECRET_KEY профиль prod не загружается."""
+        environ = dict(os.environ)
+        environ.pop('YATUBE_SECRET_KEY', None)
+        with mock.patch.dict(os.environ, environ, clear=True):
+            with self.assertRaises(ImproperlyConfigured):
+                importlib.reload(
+                    importlib.import_module('yatube.settings.prod')
+                )
+
+    def test_perfcheck(self):
+        """perfcheck перечисляет настройки, --strict падает на WARN."""
+        out = StringIO()
+        call_command('perfcheck', stdout=out)
+        report = out.getvalue()
+        self.assertIn('Профиль: test', report)
+        self.assertIn('[WARN] кеш posts', report)
+        self.assertIn('[OK]   кеш posts: отвечает', report)
+        with self.assertRaises(CommandError):
+            call_command('perfcheck', '--strict', stdout=StringIO())
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = DatabaseWrapper(dict(
+            connection.settings_dict,
+            NAME=os.path.join(self.directory, 'db.sqlite3'),
+        ), 'tuned')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_pragmas(self):
+        """Новое подключение получает WAL и остальные PRAGMA."""
+        expected = {'journal_mode': 'wal', 'synchronous': 1,
+                    'busy_timeout': 5000, 'cache_size': -64 * 1024}
+        with self.db.cursor() as cursor:
+            for name, value in expected.items():
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], value, name)
+
+    def test_read_transaction_skips_write_queue(self):
+        """Транзакция только на чтение очередь записи не занимает."""
+        queue = self.db.write_queue
+        with self.db.cursor() as cursor:
+            cursor.execute('CREATE TABLE note (text TEXT)')
+        # Так транзакцию начинает atomic.
+        self.db.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        with self.db.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+        self.assertFalse(self.db.holds_write_queue)
+        self.assertTrue(queue.acquire(timeout=0.01))
+        queue.release()
+        self.db.commit()
+
+    def test_transaction_holds_write_queue(self):
+        """Первая запись занимает очередь до отката транзакции."""
+        queue = self.db.write_queue
+        with self.db.cursor() as cursor:
+            cursor.execute('CREATE TABLE note (text TEXT)')
+        # Так транзакцию начинает atomic.
+        self.db.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        with self.db.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+            self.assertFalse(self.db.holds_write_queue)
+            cursor.execute("INSERT INTO note VALUES ('x')")
+        self.assertTrue(self.db.holds_write_queue)
+        self.assertFalse(queue.acquire(timeout=0.01))
+        self.db.rollback()
+        self.assertFalse(self.db.holds_write_queue)
+        self.assertTrue(queue.acquire(timeout=0.01))
+        queue.release()
+
+    def test_write_queue_order(self):
+        """Право записи выдаётся в порядке очереди."""
+        queue = WriteQueue()
+        queue.acquire()
+        order = []
+
+        def write(number):
+            queue.acquire()
+            order.append(number)
+            queue.release()
+
+        threads = []
+        for number in range(3):
+            threads.append(threading.Thread(target=write, args=[number]))
+            threads[-1].start()
+            while len(queue) <= number:
+                pass
+        queue.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2])
+
+
+class PerfMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        perf.get_registry().clear()
+        self.staff = get_user_model().objects.create_user(
+            username='admin', is_staff=True
+        )
+
+    def test_server_timing(self):
+        """Заголовок Server-Timing: время, SQL, шаблоны и события кеша."""
+        response = self.client.get(reverse('posts:home'))
+        timing = response['Server-Timing']
+        for entry in ('total;dur=', 'db;dur=', 'queries"', 'tpl;dur=',
+                      'cache;desc="misses=1"'):
+            self.assertIn(entry, timing)
+        stats = perf.get_registry().views['posts:home']
+        self.assertEqual(stats.count, 1)
+        self.assertGreater(stats.db_queries, 0)
+        self.assertGreater(stats.timings['template'], 0)
+
+    def test_nested_timer_counted_once(self):
+        record = perf.RequestRecord()
+        token = perf._current.set(record)
+        try:
+            with perf.timer('template'):
+                with perf.timer('template'):
+                    pass
+        finally:
+            perf._current.reset(token)
+        self.assertEqual(len(record.timings), 1)
+        self.assertFalse(record._active)
+
+    def test_metrics_access(self):
+        """/metrics отдаётся персоналу или по токену."""
+        self.client.get(reverse('posts:home'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(PERF_METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics',
+                                       HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:home",le="+Inf"} 1',
+            response.content.decode(),
+        )
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_dashboard_staff_only(self):
+        self.client.get(reverse('posts:home'))
+        response = self.client.get(reverse('perf'))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('perf')), 'posts:home')
+
+
+class QueryLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint(self):
+        """Литералы и списки параметров не различают повторы."""
+        self.assertEqual(
+            querylog.fingerprint(
+                "SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s)\n"
+                "  AND c = 10"
+            ),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ?',
+        )
+
+    def test_n_plus_one_in_template(self):
+        """Ленивое поле в цикле шаблона - N+1 со строкой шаблона."""
+        author = get_user_model().objects.create_user(username='author')
+        Post.objects.bulk_create([
+            Post(text=f'Текст {i}', author=author) for i in range(3)
+        ])
+        template = Template(
+            '{% for post in posts %}\n'
+            '{{ post.author.username }}\n'
+            '{% endfor %}'
+        )
+        log = querylog.QueryLog()
+        with log.recording():
+            template.render(Context({'posts': Post.objects.all()}))
+        [found] = log.n_plus_one('test')
+        self.assertEqual(found.count, 3)
+        self.assertTrue(found.origin.endswith(':2'), found.origin)
+        self.assertIn('auth_user', found.fingerprint)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_query_explained(self):
+        """Медленные запросы view уходят в лог вместе с планом."""
+        with self.assertLogs('core.querylog', 'WARNING'):
+            with querylog.detecting() as found:
+                self.client.get(reverse('posts:home'))
+        slow = [item for item in found
+                if isinstance(item, querylog.SlowQuery)]
+        self.assertTrue(slow)
+        self.assertEqual(slow[0].view, 'posts:home')
+        self.assertTrue(any(item.plan for item in slow))
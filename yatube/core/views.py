@@ -1,4 +1,13 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import perf
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 def page_not_found(request, exception):
@@ -15,3 +24,31 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def perf_dashboard(request):
+    registry = perf.get_registry()
+    slowest = sorted(registry.samples(), key=lambda sample: sample['total'],
+                     reverse=True)[:20]
+    context = {
+        'title': 'Замеры запросов',
+        'rows': registry.summary(),
+        'slowest': slowest,
+        'sample_rate': settings.PERF_SAMPLE_RATE,
+        'ring_size': registry.ring.maxlen,
+    }
+    return render(request, 'core/perf.html', context)
+
+
+def metrics(request):
+    """Замеры для Prometheus: персоналу или по токену PERF_METRICS_TOKEN."""
+    token = settings.PERF_METRICS_TOKEN
+    authorized = request.user.is_staff or bool(token) and (
+        constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''),
+                              f'Bearer {token}')
+    )
+    if not authorized:
+        raise PermissionDenied
+    return HttpResponse(perf.get_registry().prometheus(),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
@@ -5,7 +5,11 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    # Тесты идут в своём профиле настроек (yatube/settings/test.py).
+    settings = 'yatube.settings.test' if sys.argv[1:2] == ['test'] else (
+        'yatube.settings'
+    )
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -0,0 +1,221 @@
+"""Read-only JSON API лент для мобильных клиентов.
+
+Ответы собираются из тех же querysets, что и HTML-страницы
+(``for_feed``, ``for_detail``, ``timeline.follow_page``), и листаются
+курсором ``KeysetPaginator``: параметры ``after``/``before``.
+
+Кеширование и условные ответы те же, что у HTML (``cache_feed``):
+строгий ETag из поколений лент и ``Last-Modified`` по самому свежему
+``pub_date``/``created``; совпавший ``If-None-Match`` получает 304 без
+запросов к базе.
+"""
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from . import search, threads, timeline
+from .caching import cache_feed, follow_feeds, set_last_modified
+from .models import Comment, Group, Post, ProfileStats, User
+from .paginators import KeysetPaginator
+
+PAGE_SIZE = 10
+
+
+def json_response(data, status=200, dates=()):
+    """Компактный JSON; ``dates`` дают заголовок Last-Modified."""
+    response = HttpResponse(
+        json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False,
+                   separators=(',', ':')),
+        content_type='application/json',
+        status=status,
+    )
+    return set_last_modified(response, dates)
+
+
+def feed_response(data):
+    return json_response(
+        data, dates=[post['pub_date'] for post in data['results']]
+    )
+
+
+def api_login_required(view):
+    """Как login_required, но вместо редиректа на форму входа - 401."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({'detail': 'Требуется авторизация'}, 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def post_data(post):
+    data = {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': post.author.username,
+    }
+    # Пустые поля не передаются.
+    if post.group_id:
+        data['group'] = post.group.slug
+    if post.image:
+        data['image'] = post.image.url
+    return data
+
+
+def comment_data(comment):
+    data = {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+    if comment.parent_id:
+        data['parent'] = comment.parent_id
+    if comment.children:
+        data['replies'] = [comment_data(reply) for reply in comment.children]
+    if getattr(comment, 'more_replies', None):
+        data['more_replies'] = comment.more_replies
+    return data
+
+
+def comments_data(page):
+    return {
+        'results': [comment_data(comment) for comment in page.tree],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def comments_dates(data):
+    for comment in data:
+        yield comment['created']
+        yield from comments_dates(comment.get('replies', ()))
+
+
+def keyset_page(request, queryset):
+    return KeysetPaginator(queryset, PAGE_SIZE).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+
+
+def page_data(request, queryset=None, page=None):
+    """Страница ленты; готовую страницу можно передать в ``page``."""
+    if page is None:
+        page = keyset_page(request, queryset)
+    return {
+        'results': [post_data(post) for post in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+@require_safe
+@cache_feed(lambda request: ['global'])
+def index(request):
+    return feed_response(page_data(request, Post.objects.for_feed()))
+
+
+@require_safe
+@cache_feed(lambda request, slug: [f'group:{slug}'])
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    data = page_data(request, group.posts.for_feed())
+    data['group'] = {
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+        'posts': group.post_count,
+    }
+    return feed_response(data)
+
+
+@require_safe
+@cache_feed(lambda request, username: [f'author:{username}'])
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    stats = ProfileStats.objects.for_user(author)
+    data = page_data(request, author.posts.for_feed())
+    data['author'] = {
+        'username': author.username,
+        'name': author.get_full_name(),
+        'posts': stats.posts_count,
+        'followers': stats.followers_count,
+        'following': stats.following_count,
+    }
+    return feed_response(data)
+
+
+@require_safe
+@cache_feed(lambda request, post_id: [f'post:{post_id}'])
+def post_detail(request, post_id):
+    post = get_object_or_404(Post.objects.for_detail(), pk=post_id)
+    data = post_data(post)
+    # Только здесь: ленты не сбрасываются при каждом комментарии.
+    data['comment_count'] = post.comment_count
+    # Первая страница комментариев; следующие - api_post_comments.
+    comments = comments_data(threads.root_page(post.pk))
+    data['comments'] = comments['results']
+    data['comments_next'] = comments['next']
+    return json_response(data, dates=[post.pub_date, *comments_dates(
+        data['comments']
+    )])
+
+
+@require_safe
+@cache_feed(lambda request, post_id: [f'post:{post_id}'])
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    data = comments_data(threads.root_page(
+        post.pk,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    ))
+    return json_response(data, dates=comments_dates(data['results']))
+
+
+@require_safe
+@cache_feed(lambda request, post_id, comment_id: [f'post:{post_id}'])
+def comment_thread(request, post_id, comment_id):
+    root = get_object_or_404(
+        Comment, post=post_id, thread=None, pk=comment_id
+    )
+    data = comments_data(threads.thread_page(
+        root,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    ))
+    return json_response(data, dates=comments_dates(data['results']))
+
+
+@require_safe
+@api_login_required
+@cache_feed(follow_feeds)
+def follow_index(request):
+    page = timeline.follow_page(
+        request.user,
+        lambda feed: keyset_page(request, feed),
+        Post.objects.for_feed(),
+    )
+    return feed_response(page_data(request, page=page))
+
+
+@require_safe
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page = search.SearchPaginator(query, PAGE_SIZE).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    results = []
+    for post in page:
+        data = post_data(post)
+        data['score'] = post.search_score
+        results.append(data)
+    return json_response({
+        'query': query,
+        'results': results,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
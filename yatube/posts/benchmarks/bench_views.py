@@ -0,0 +1,72 @@
+"""Бенчмарки views из posts/views.py (см. conftest.py)."""
+from django.urls import reverse
+
+from posts.models import Follow
+
+
+def test_index(benchmark, client):
+    benchmark('index', lambda: client.get(reverse('posts:home')))
+
+
+def test_group_posts(benchmark, client, dataset):
+    url = reverse('posts:group_list', args=[dataset.group.slug])
+    benchmark('group_posts', lambda: client.get(url))
+
+
+def test_profile(benchmark, client, dataset):
+    url = reverse('posts:profile', args=[dataset.author.username])
+    benchmark('profile', lambda: client.get(url))
+
+
+def test_post_detail(benchmark, client, dataset):
+    url = reverse('posts:post_detail', args=[dataset.post.pk])
+    benchmark('post_detail', lambda: client.get(url))
+
+
+def test_post_create_form(benchmark, client, dataset):
+    client.force_login(dataset.author)
+    benchmark('post_create_form',
+              lambda: client.get(reverse('posts:create')))
+
+
+def test_post_create(benchmark, client, dataset):
+    client.force_login(dataset.author)
+    benchmark('post_create', lambda: client.post(
+        reverse('posts:create'), {'text': 'Пост из бенчмарка'}
+    ))
+
+
+def test_add_comment(benchmark, client, dataset):
+    client.force_login(dataset.reader)
+    url = reverse('posts:add_comment', args=[dataset.post.pk])
+    benchmark('add_comment',
+              lambda: client.post(url, {'text': 'Комментарий'}))
+
+
+def test_follow_index(benchmark, client, dataset):
+    client.force_login(dataset.reader)
+    benchmark('follow_index',
+              lambda: client.get(reverse('posts:follow_index')))
+
+
+def test_profile_follow(benchmark, client, dataset):
+    client.force_login(dataset.reader)
+    url = reverse('posts:profile_follow', args=[dataset.stranger.username])
+
+    def unfollow():
+        Follow.objects.filter(
+            user=dataset.reader, author=dataset.stranger
+        ).delete()
+    benchmark('profile_follow', lambda: client.get(url), setup=unfollow)
+
+
+def test_profile_unfollow(benchmark, client, dataset):
+    client.force_login(dataset.reader)
+    url = reverse('posts:profile_unfollow',
+                  args=[dataset.followed.username])
+
+    def follow():
+        Follow.objects.get_or_create(
+            user=dataset.reader, author=dataset.followed
+        )
+    benchmark('profile_unfollow', lambda: client.get(url), setup=follow)
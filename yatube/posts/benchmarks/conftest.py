@@ -0,0 +1,241 @@
+"""Бенчмарки views приложения posts с базовыми замерами.
+
+Запуск из корня репозитория (в обычный прогон тестов не входят):
+
+    pytest yatube/posts/benchmarks
+    pytest yatube/posts/benchmarks --bench-update
+    pytest yatube/posts/benchmarks --bench-sizes=1000,10000
+    pytest yatube/posts/benchmarks --nplusone
+
+Каждый view замеряется на каждом объёме данных (``--bench-sizes`` -
+число постов, база заполняется командой ``generate_data``). Кеши
+очищаются перед каждым прогоном, так что замеряется сам view.
+Пишутся лучшее время из ``--bench-rounds`` прогонов (как в timeit:
+медленные прогоны - это шум машины, а не код), число SQL-запросов
+и пик выделенной памяти (tracemalloc, отдельным прогоном:
+трассировка замедляет код). Шаблоны рендерятся без тестовой
+подмены Django: с ней клиент копирует контекст каждого шаблона
+и include, и время с памятью растут от того, чего в продакшене нет.
+
+Тест падает, если время или память выросли больше чем на
+``--bench-threshold`` относительно ``baselines.json`` или запросов
+стало больше. ``--bench-update`` записывает замеры как новые базовые.
+Время зависит от машины: базовые замеры стоит снимать там же, где
+запускается сравнение, и с тем же ``--bench-rounds``: лучшее из
+меньшего числа прогонов хуже и на том же коде.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.template.base import Template
+from django.test.utils import CaptureQueriesContext, _TestState
+
+from posts.models import Follow, Group, Post, User
+
+pytest_plugins = ['core.pytest_plugin']
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+# Абсолютный допуск по времени: на быстрых views доли миллисекунды
+# шума машины дают десятки процентов.
+TIME_SLACK = 0.002
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench', 'бенчмарки views')
+    group.addoption('--bench-sizes', default='200,2000',
+                    help='Объёмы данных: число постов через запятую.')
+    group.addoption('--bench-rounds', type=int, default=30,
+                    help='Прогонов на замер времени.')
+    group.addoption('--bench-threshold', type=float, default=0.2,
+                    help='Допустимый рост времени и памяти, доля.')
+    group.addoption('--bench-update', action='store_true',
+                    help='Записать замеры в файл базовых замеров.')
+    group.addoption('--bench-baselines', default=BASELINES,
+                    help='Файл базовых замеров.')
+
+
+class Recorder:
+    def __init__(self, config):
+        self.path = config.getoption('bench_baselines')
+        self.threshold = config.getoption('bench_threshold')
+        self.update = config.getoption('bench_update')
+        self.baselines = {}
+        if os.path.exists(self.path):
+            with open(self.path) as baselines:
+                self.baselines = json.load(baselines)
+        self.results = {}
+
+    def regressions(self, key, result):
+        """Описания регрессий замера относительно базового."""
+        baseline = self.baselines.get(key)
+        if baseline is None or self.update:
+            return []
+        problems = []
+        for metric in ('time', 'memory'):
+            limit = baseline[metric] * (1 + self.threshold)
+            if metric == 'time':
+                limit = max(limit, baseline[metric] + TIME_SLACK)
+            if result[metric] > limit:
+                problems.append(
+                    f'{metric}: {result[metric]:.4g} > {limit:.4g} '
+                    f'(базовое {baseline[metric]:.4g})'
+                )
+        if result['queries'] > baseline['queries']:
+            problems.append(
+                f'queries: {result["queries"]} > {baseline["queries"]}'
+            )
+        return problems
+
+    def save(self):
+        baselines = dict(self.baselines, **self.results)
+        with open(self.path, 'w') as output:
+            json.dump(baselines, output, indent=2, sort_keys=True)
+            output.write('\n')
+
+
+def pytest_collect_file(path, parent):
+    # Бенчмарки названы bench_*.py, чтобы не попадать в обычный прогон.
+    if path.ext == '.py' and path.basename.startswith('bench_'):
+        return pytest.Module.from_parent(parent, fspath=path)
+
+
+def pytest_configure(config):
+    config.bench_recorder = Recorder(config)
+
+
+def pytest_generate_tests(metafunc):
+    if 'dataset' in metafunc.fixturenames:
+        sizes = [int(size) for size in
+                 metafunc.config.getoption('bench_sizes').split(',')]
+        metafunc.parametrize('dataset', sizes, indirect=True,
+                             scope='session')
+
+
+def pytest_sessionfinish(session):
+    recorder = session.config.bench_recorder
+    if recorder.update and recorder.results:
+        recorder.save()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    recorder = config.bench_recorder
+    if not recorder.results:
+        return
+    terminalreporter.section('бенчмарки views')
+    for key, result in sorted(recorder.results.items()):
+        baseline = recorder.baselines.get(key)
+        change = ''
+        if baseline:
+            change = f'{result["time"] / baseline["time"] - 1:+.0%}'
+        terminalreporter.write_line(
+            f'{key:<28}{result["time"] * 1000:>9.2f} мс{change:>7}'
+            f'{result["queries"]:>5} SQL'
+            f'{result["memory"] / 1024:>9.0f} КиБ'
+        )
+    if recorder.update:
+        terminalreporter.write_line(f'Записано в {recorder.path}')
+
+
+class Dataset:
+    """Заполненная база и участники сценариев."""
+
+    def __init__(self, size):
+        self.size = size
+        self.reader = User.objects.annotate(
+            total=Count('follower')
+        ).order_by('-total').first()
+        self.author = User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.group = Group.objects.order_by('-post_count').first()
+        self.post = Post.objects.order_by('-comment_count').first()
+        self.followed = Follow.objects.filter(
+            user=self.reader
+        ).first().author
+        # Подписку на него сценарий снимает перед каждым прогоном.
+        self.stranger = User.objects.exclude(
+            pk__in=[self.reader.pk, self.followed.pk]
+        ).first()
+
+
+@pytest.fixture(scope='session')
+def dataset(request, django_db_setup, django_db_blocker):
+    size = request.param
+    with django_db_blocker.unblock():
+        call_command(
+            'generate_data', posts=size, comments=size,
+            users=max(size // 20, 10), groups=max(size // 200, 3),
+            follows=10, seed=size, stdout=StringIO(),
+        )
+        yield Dataset(size)
+        call_command('flush', interactive=False, verbosity=0)
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@pytest.fixture
+def benchmark(request, dataset, db, monkeypatch):
+    """``benchmark(name, send, setup=None)`` замеряет ``send()``.
+
+    ``setup()`` выполняется перед каждым прогоном вне замера, например
+    чтобы вернуть подписку, снятую прошлым прогоном.
+    """
+    recorder = request.config.bench_recorder
+    rounds = request.config.getoption('bench_rounds')
+    # setup_test_environment() сохранил обычный рендер шаблонов.
+    monkeypatch.setattr(Template, '_render',
+                        _TestState.saved_data.template_render)
+
+    def run(name, send, setup=None):
+        def prepared():
+            clear_caches()
+            if setup is not None:
+                setup()
+
+        prepared()
+        response = send()
+        assert response.status_code < 400, response.status_code
+        timings = []
+        for _ in range(rounds):
+            prepared()
+            gc.collect()
+            started = time.perf_counter()
+            send()
+            timings.append(time.perf_counter() - started)
+        prepared()
+        with CaptureQueriesContext(connection) as queries:
+            send()
+        # Журнал запросов очищается следующим запросом клиента.
+        query_count = len(queries)
+        prepared()
+        # Иначе пик зависит от того, когда сборщик мусора сработает
+        # внутри запроса, а это зависит от прогонов перед замером.
+        gc.collect()
+        tracemalloc.start()
+        try:
+            send()
+            memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        key = f'{name}[{dataset.size}]'
+        result = {'time': min(timings),
+                  'queries': query_count, 'memory': memory}
+        recorder.results[key] = result
+        problems = recorder.regressions(key, result)
+        if problems:
+            pytest.fail(f'{key}: ' + '; '.join(problems))
+        return result
+    return run
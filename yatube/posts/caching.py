@@ -0,0 +1,277 @@
+"""Кеш страниц лент с поколениями (generation counters).
+
+У каждой ленты есть счётчик поколения в кеше: ``global``,
+``group:<slug>``, ``author:<username>``, ``follow:<user_id>``,
+``post:<id>``. Ключ закешированной страницы включает поколения всех
+лент, из которых она собрана, поэтому сигнал об изменении данных
+просто увеличивает нужные счётчики, а старые копии перестают
+находиться и вытесняются по TTL. Это позволяет держать страницы
+в кеше долго и при этом сразу показывать изменения.
+
+Так же версионируются множества подписчиков ``followers:<user_id>``
+графа подписок (posts/follow_graph.py).
+
+Рядом с поколением хранится время последнего изменения ленты:
+Last-Modified страницы не раньше него, поэтому правка и удаление
+поста, не меняющие дат на странице, не дают 304 по If-Modified-Since.
+Last-Modified точен до секунды, поэтому пока идёт секунда последнего
+изменения, он не отдаётся: следующее изменение в ту же секунду было
+бы неотличимо. Условные ответы в это время - только по ETag.
+"""
+import hashlib
+import math
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from core import perf
+from core.db import replicas
+
+from .models import Follow, Group, Post
+
+# Счётчики попаданий страниц в кеш в текущем процессе.
+stats = Counter()
+
+GENERATION_PREFIX = 'gen:'
+PAGE_PREFIX = 'page:'
+PIN_PREFIX = 'pin:'
+CHANGED_PREFIX = 'changed:'
+
+
+def record(event):
+    """Считает событие кеша в процессе и в замерах запроса."""
+    stats[event] += 1
+    perf.count(event)
+
+
+def get_cache():
+    return caches['posts']
+
+
+def _generation_key(feed):
+    return f'{GENERATION_PREFIX}{feed}'
+
+
+def _new_generation():
+    # Поколение, потерянное при вытеснении из кеша, не должно начинаться
+    # заново с 1: иначе найдутся старые страницы с тем же номером.
+    return time.time_ns()
+
+
+def generations(feeds):
+    """Текущие поколения лент; недостающие создаются."""
+    keys = [_generation_key(feed) for feed in feeds]
+    cache = get_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_generation(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*feeds):
+    """Инвалидирует все страницы, собранные из перечисленных лент."""
+    cache = get_cache()
+    for feed in set(feeds):
+        key = _generation_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+    cache.set_many(
+        {f'{CHANGED_PREFIX}{feed}': time.time() for feed in feeds}, None
+    )
+    if settings.DATABASE_REPLICAS:
+        # Пока реплики могут не знать об изменении, ленты читаются
+        # с основной базы (core/db/replicas.py).
+        cache.set_many(
+            {f'{PIN_PREFIX}{feed}': 1 for feed in feeds},
+            settings.REPLICA_PIN_SECONDS,
+        )
+
+
+def recently_changed(feeds):
+    """Менялась ли какая-то из лент в окне отставания реплик."""
+    if not settings.DATABASE_REPLICAS:
+        return False
+    return bool(get_cache().get_many(
+        [f'{PIN_PREFIX}{feed}' for feed in feeds]
+    ))
+
+
+def page_key(request, view_name, feeds):
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    versions = ':'.join(str(gen) for gen in generations(feeds))
+    digest = hashlib.md5(
+        f'{versions}|{request.get_full_path()}'.encode()
+    ).hexdigest()
+    return f'{PAGE_PREFIX}{view_name}:{viewer}:{digest}'
+
+
+def set_last_modified(response, dates):
+    """Last-Modified по самой свежей из дат страницы."""
+    newest = max(filter(None, dates), default=None)
+    if newest is not None:
+        response['Last-Modified'] = http_date(newest.timestamp())
+    return response
+
+
+def last_changed(feeds):
+    """Время последнего изменения лент.
+
+    Неизвестное время (лента не менялась с запуска кеша) считается
+    началом текущей секунды и запоминается.
+    """
+    keys = [f'{CHANGED_PREFIX}{feed}' for feed in feeds]
+    cache = get_cache()
+    stamps = cache.get_many(keys)
+    now = math.floor(time.time())
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, now, None)
+            stamps[key] = now
+    return max(stamps.values(), default=0)
+
+
+def _mark_changed(response, feeds):
+    """Last-Modified не раньше последнего изменения лент страницы."""
+    if response.status_code != 200:
+        return response
+    changed = last_changed(feeds)
+    if changed > math.floor(time.time()):
+        del response['Last-Modified']
+        return response
+    modified = parse_http_date_safe(response.get('Last-Modified', '')) or 0
+    response['Last-Modified'] = http_date(max(modified, math.ceil(changed)))
+    return response
+
+
+def _validate(request, response, etag):
+    """Отвечает 304 по If-None-Match/If-Modified-Since и ставит заголовки.
+
+    Анонимные страницы одинаковы для всех, поэтому их может хранить
+    CDN (``s-maxage``); браузер каждый раз перепроверяет страницу.
+    Страницы авторизованных только приватные.
+    """
+    if response.status_code == 200:
+        last_modified = response.get('Last-Modified')
+        if last_modified:
+            last_modified = parse_http_date_safe(last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+            response=response,
+        ) or response
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=0,
+                s_maxage=settings.FEED_PUBLIC_MAX_AGE,
+            )
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_feed(feeds, anonymous_only=False):
+    """Кеширует ответ view до смены поколения одной из лент.
+
+    ``feeds(request, *args, **kwargs)`` возвращает имена лент страницы.
+    Анонимные пользователи делят одну копию страницы, авторизованные
+    получают свою (в шапке их имя). ``anonymous_only`` отключает кеш
+    для авторизованных, например на страницах с формами и CSRF-токеном.
+
+    Ключ страницы служит и ETag: совпавший If-None-Match получает 304
+    до кеша и до view. Закешированная копия побайтно одинакова, поэтому
+    её ETag строгий; у страниц, которые рендерятся каждый раз (с
+    CSRF-токеном), - слабый.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            names = feeds(request, *args, **kwargs)
+            key = page_key(request, view.__name__, names)
+            cached = not (anonymous_only and request.user.is_authenticated)
+            etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+            if not cached:
+                etag = f'W/{etag}'
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                record('not_modified')
+                return _validate(request, response, etag)
+            if recently_changed(names):
+                replicas.require_primary()
+            if not cached:
+                response = view(request, *args, **kwargs)
+                return _validate(request, _mark_changed(response, names),
+                                 etag)
+            cache = get_cache()
+            response = cache.get(key)
+            if response is None:
+                record('misses')
+                response = _mark_changed(view(request, *args, **kwargs),
+                                         names)
+                if response.status_code == 200:
+                    cache.set(key, response, settings.FEED_CACHE_TIMEOUT)
+            else:
+                record('hits')
+            return _validate(request, response, etag)
+        return wrapper
+    return decorator
+
+
+def viewer_feeds(request):
+    """Кнопки подписки на лентах зависят от подписок читателя."""
+    if request.user.is_authenticated:
+        return [f'follow:{request.user.pk}']
+    return []
+
+
+def follow_feeds(request):
+    """Лента подписок зависит от набора подписок и от постов авторов."""
+    authors = Follow.objects.filter(
+        user=request.user
+    ).values_list('author__username', flat=True)
+    return [f'follow:{request.user.pk}'] + [
+        f'author:{username}' for username in authors
+    ]
+
+
+def post_feeds(request, post_id):
+    """Страница поста показывает и число постов его автора."""
+    authors = Post.objects.filter(
+        pk=post_id
+    ).values_list('author__username', flat=True)
+    return [f'post:{post_id}'] + [f'author:{username}' for username in authors]
+
+
+def feeds_of_post(post, author_groups=False):
+    """Ленты, в которых показывается пост (и прежняя группа при смене).
+
+    ``author_groups`` - у автора изменилось число постов: его показывают
+    страницы всех групп с постами автора (``for_viewer``), они тоже
+    сбрасываются.
+    """
+    feeds = ['global', f'post:{post.pk}', f'author:{post.author.username}']
+    group_ids = {post.group_id, getattr(post, '_previous_group_id', None)}
+    group_ids.discard(None)
+    groups = Q(pk__in=group_ids)
+    if author_groups:
+        groups |= Q(posts__author_id=post.author_id)
+    feeds.extend(
+        f'group:{slug}' for slug in Group.objects.filter(
+            groups
+        ).values_list('slug', flat=True).distinct()
+    )
+    return feeds
@@ -0,0 +1,61 @@
+"""Кеш отрендеренных карточек постов.
+
+Карточка (``posts/includes/post_text.html``) одинакова на всех лентах
+и у всех читателей, поэтому рендерится один раз и хранится в кеше
+``posts`` по ключу ``card:<id>:<версия>``. Версия - хеш всего, что
+карточка показывает: текста, даты, группы и имени автора. Правка поста,
+смена группы или её названия, смена имени автора дают новую версию,
+а старая копия просто перестаёт читаться и вытесняется по TTL -
+сигналы для этого не нужны.
+
+Страница собирается одним ``get_many``; недостающие карточки
+рендерятся и сохраняются одним ``set_many``. Так смена поколения ленты
+(новый пост) перерисовывает только новый пост, а не всю страницу.
+"""
+import hashlib
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import caching
+
+CARD_TEMPLATE = 'posts/includes/post_text.html'
+# Увеличивается при изменении шаблона карточки.
+CARD_VERSION = 2
+CARD_PREFIX = 'card:'
+
+
+def card_key(post):
+    group = (post.group.slug, post.group.title) if post.group_id else ()
+    version = hashlib.md5('|'.join((
+        post.text,
+        post.pub_date.isoformat(),
+        *group,
+        post.author.get_full_name(),
+    )).encode()).hexdigest()
+    return f'{CARD_PREFIX}{CARD_VERSION}:{post.pk}:{version}'
+
+
+def attach(posts):
+    """Проставляет постам страницы ``post.card`` - готовый HTML."""
+    posts = list(posts)
+    keys = {post.pk: card_key(post) for post in posts}
+    cache = caching.get_cache()
+    found = cache.get_many(keys.values())
+    missing = {}
+    template = None
+    for post in posts:
+        key = keys[post.pk]
+        if key in found:
+            caching.record('card_hits')
+            post.card = mark_safe(found[key])
+            continue
+        caching.record('card_misses')
+        if template is None:
+            template = get_template(CARD_TEMPLATE)
+        post.card = template.render({'post': post})
+        missing[key] = str(post.card)
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+    return posts
@@ -0,0 +1,273 @@
+"""Отложенная запись комментариев (write-behind).
+
+При ``COMMENT_WRITE_BEHIND`` ``add_comment`` не делает ``INSERT``
+в запросе: проверенный комментарий дописывается строкой JSON в журнал
+процесса и встаёт в очередь. Фоновый поток пишет очередь в базу одним
+``INSERT`` раз в ``COMMENT_FLUSH_INTERVAL_MS`` или как только
+набралось ``COMMENT_FLUSH_SIZE`` комментариев. Сигналы ``Comment``
+при этом не вызываются, их работа делается на всю пачку: счётчики
+постов одним ``UPDATE`` на пост, дописывание в поисковый индекс
+и сброс кеша ленты - по разу на пост.
+
+Журнал (``COMMENT_JOURNAL_DIR/comments-<pid>.jsonl``) хранит всё, что
+ещё не записано в базу, и переживает падение процесса (но не ОС: файл
+не синхронизируется на диск при каждой записи). Процесс держит на нём
+``flock``. Очередь, поток и журнал создаются в каждом процессе при
+первом ``submit`` (``get_queue``), а не при импорте: так их не делят
+процессы, форкнутые после импорта (``gunicorn --preload``). Тогда же
+журналы остановленных процессов проигрываются в базу и удаляются.
+Уже записанные комментарии (падение между коммитом и очисткой журнала)
+узнаются по автору и дате.
+
+Дата комментария - время приёма запроса: пачка вставляется
+``bulk_create`` с заданными ``created``, ``auto_now_add`` на это время
+выключен (``explicit_dates``). Пока пишется пачка, другие потоки
+процесса не должны создавать комментарии через ORM; при
+``COMMENT_WRITE_BEHIND`` все комментарии идут через очередь.
+
+Комментарий появляется на странице поста после записи пачки.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, counters, search, threads
+from .models import Comment, Post, User, explicit_dates
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATTERN = 'comments-*.jsonl'
+
+
+def to_record(comment):
+    return {
+        'post': comment.post_id,
+        'author': comment.author_id,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'parent': comment.parent_id,
+    }
+
+
+def from_record(record):
+    return Comment(
+        post_id=record['post'], author_id=record['author'],
+        text=record['text'], created=parse_datetime(record['created']),
+        parent_id=record['parent'],
+    )
+
+
+def _insert(comments):
+    with explicit_dates(Comment._meta.get_field('created')):
+        Comment.objects.bulk_create(comments)
+
+
+def persist(comments):
+    """Пишет пачку комментариев и делает работу их сигналов.
+
+    Комментарии к удалённым постам и от удалённых авторов пропускаются,
+    ответы на удалённые комментарии становятся корневыми. Возвращает
+    число записанных.
+    """
+    posts = set(Post.objects.filter(
+        pk__in={comment.post_id for comment in comments}
+    ).values_list('pk', flat=True))
+    authors = set(User.objects.filter(
+        pk__in={comment.author_id for comment in comments}
+    ).values_list('pk', flat=True))
+    comments = [comment for comment in comments
+                if comment.post_id in posts and comment.author_id in authors]
+    parents = Comment.objects.in_bulk(
+        {comment.parent_id for comment in comments} - {None}
+    )
+    for comment in comments:
+        if comment.parent_id is not None:
+            parent = parents.get(comment.parent_id)
+            if parent is not None and parent.post_id != comment.post_id:
+                parent = None
+            comment.parent = parent
+            threads.place_reply(comment)
+    with transaction.atomic():
+        _insert(comments)
+        added = {}
+        for comment in comments:
+            added.setdefault(comment.post_id, []).append(comment.text)
+        for post_id, texts in added.items():
+            counters.change_post(post_id, len(texts))
+            search.get_index().add_comments(post_id, texts)
+    caching.bump(*(f'post:{post_id}' for post_id in added))
+    return len(comments)
+
+
+def replay(path):
+    """Записывает в базу комментарии из журнала ``path``."""
+    with open(path) as journal:
+        comments = [from_record(json.loads(line))
+                    for line in journal if line.strip()]
+    if not comments:
+        return 0
+    stored = set(Comment.objects.filter(
+        author_id__in={comment.author_id for comment in comments},
+        created__in={comment.created for comment in comments},
+    ).values_list('author_id', 'created'))
+    return persist([
+        comment for comment in comments
+        if (comment.author_id, comment.created) not in stored
+    ])
+
+
+def replay_stale(directory):
+    """Проигрывает журналы остановленных процессов и удаляет их."""
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(directory, JOURNAL_PATTERN))):
+        with open(path, 'a') as journal:
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Журнал живого процесса.
+                continue
+            try:
+                replayed += replay(path)
+            except Exception:
+                # Журнал остаётся для разбора и следующего запуска.
+                logger.exception('Не удалось проиграть журнал %s', path)
+                continue
+            os.remove(path)
+    return replayed
+
+
+class CommentQueue:
+    def __init__(self, directory, flush_size, interval):
+        self.flush_size = flush_size
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f'comments-{self.pid}.jsonl')
+        self._condition = threading.Condition()
+        self._pending = []
+        self._flushing = []
+        self._closed = False
+        self._journal = open(self.path, 'a')
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending) + len(self._flushing)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='comment-queue', daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, comment):
+        """Ставит несохранённый комментарий в очередь."""
+        if comment.created is None:
+            comment.created = timezone.now()
+        line = json.dumps(to_record(comment), ensure_ascii=False)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Очередь комментариев закрыта')
+            self._journal.write(line + '\n')
+            self._journal.flush()
+            self._pending.append(comment)
+            if len(self._pending) >= self.flush_size:
+                self._condition.notify()
+
+    def flush(self):
+        """Пишет очередь в базу; возвращает число записанных."""
+        with self._condition:
+            batch, self._pending = self._pending, []
+            self._flushing = batch
+        if not batch:
+            return 0
+        try:
+            written = persist(batch)
+        except Exception:
+            with self._condition:
+                self._pending = batch + self._pending
+                self._flushing = []
+            raise
+        with self._condition:
+            self._flushing = []
+            self._rewrite_journal()
+        return written
+
+    def _rewrite_journal(self):
+        # В журнале остаётся только то, что пришло во время записи.
+        self._journal.seek(0)
+        self._journal.truncate()
+        for comment in self._pending:
+            self._journal.write(
+                json.dumps(to_record(comment), ensure_ascii=False) + '\n'
+            )
+        self._journal.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: (self._closed
+                             or len(self._pending) >= self.flush_size),
+                    self.interval,
+                )
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать комментарии')
+            finally:
+                close_old_connections()
+            if closed:
+                return
+
+    def close(self):
+        """Останавливает поток и пишет остаток очереди."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+        if not len(self):
+            os.remove(self.path)
+        self._journal.close()
+
+
+_queue = None
+_lock = threading.Lock()
+
+
+def get_queue():
+    """Очередь процесса; при создании проигрывает старые журналы.
+
+    Процесс, форкнутый от владельца очереди, заводит свою: поток
+    владельца в нём не работает.
+    """
+    global _queue
+    with _lock:
+        if _queue is None or _queue.pid != os.getpid():
+            directory = settings.COMMENT_JOURNAL_DIR
+            os.makedirs(directory, exist_ok=True)
+            replayed = replay_stale(directory)
+            if replayed:
+                logger.info('Из журналов записано комментариев: %d',
+                            replayed)
+            _queue = CommentQueue(
+                directory, settings.COMMENT_FLUSH_SIZE,
+                settings.COMMENT_FLUSH_INTERVAL_MS / 1000,
+            )
+            _queue.start()
+            atexit.register(_queue.close)
+        return _queue
@@ -0,0 +1,106 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются одним ``UPDATE ... SET n = n + 1`` через ``F()``,
+поэтому параллельные запросы не теряют изменения. Массовые операции
+(``bulk_create``, ``QuerySet.update``) сигналов не вызывают, и их
+последствия исправляет ``reconcile`` (команда ``reconcile_counters``).
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, ProfileStats, User
+
+
+def _add(queryset, **deltas):
+    for field, delta in deltas.items():
+        if delta < 0:
+            # Счётчик после bulk-операций может отставать: не уходим в минус.
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def change_profile(user_id, **deltas):
+    updated = _add(ProfileStats.objects.filter(user_id=user_id), **deltas)
+    if not updated and min(deltas.values()) > 0:
+        # Строки ещё нет: считаем её с нуля, изменение уже в базе.
+        ProfileStats.objects.for_user(User(pk=user_id))
+
+
+def change_profiles(user_ids, **deltas):
+    """``change_profile`` для многих пользователей одним ``UPDATE``."""
+    user_ids = set(user_ids)
+    updated = _add(ProfileStats.objects.filter(user_id__in=user_ids),
+                   **deltas)
+    if updated < len(user_ids) and min(deltas.values()) > 0:
+        existing = ProfileStats.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', flat=True)
+        for user_id in user_ids - set(existing):
+            ProfileStats.objects.for_user(User(pk=user_id))
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        _add(Group.objects.filter(pk=group_id), post_count=delta)
+
+
+def change_post(post_id, delta):
+    _add(Post.objects.filter(pk=post_id), comment_count=delta)
+
+
+def _count(model, field, outer='pk'):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef(outer)})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile():
+    """Пересчитывает все счётчики; возвращает число исправленных строк."""
+    repaired = {}
+    posts = Post.objects.annotate(real=_count(Comment, 'post'))
+    drifted = posts.exclude(comment_count=F('real')).values('pk')
+    repaired['post'] = Post.objects.filter(pk__in=drifted).update(
+        comment_count=_count(Comment, 'post')
+    )
+    groups = Group.objects.annotate(real=_count(Post, 'group'))
+    drifted = groups.exclude(post_count=F('real')).values('pk')
+    repaired['group'] = Group.objects.filter(pk__in=drifted).update(
+        post_count=_count(Post, 'group')
+    )
+    ProfileStats.objects.bulk_create(
+        [
+            ProfileStats(user_id=pk)
+            for pk in User.objects.filter(
+                stats__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        batch_size=500,
+    )
+    stats = ProfileStats.objects.annotate(
+        real_posts=_count(Post, 'author', 'user'),
+        real_followers=_count(Follow, 'author', 'user'),
+        real_following=_count(Follow, 'user', 'user'),
+    )
+    drifted = stats.filter(
+        ~Q(posts_count=F('real_posts'))
+        | ~Q(followers_count=F('real_followers'))
+        | ~Q(following_count=F('real_following'))
+    ).values('pk')
+    repaired['profile'] = ProfileStats.objects.filter(
+        pk__in=drifted
+    ).update(
+        posts_count=_count(Post, 'author', 'user'),
+        followers_count=_count(Follow, 'author', 'user'),
+        following_count=_count(Follow, 'user', 'user'),
+    )
+    return repaired
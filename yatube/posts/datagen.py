@@ -0,0 +1,183 @@
+"""Генератор данных для нагрузочных тестов (команда ``generate_data``).
+
+Строки пишутся пачками через ``bulk_create``, сигналы при этом не
+срабатывают, поэтому счётчики, ленты подписок и поисковый индекс
+пересобираются после генерации отдельно.
+
+Популярность распределена по закону Ципфа: немногие авторы пишут
+большую часть постов и собирают большую часть подписчиков, немногие
+группы и посты получают большую часть постов и комментариев.
+"""
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from .models import Comment, Follow, Group, Post, User, explicit_dates
+
+USERNAME_PREFIX = 'load'
+# Пароль всех сгенерированных пользователей, чтобы войти руками.
+PASSWORD = 'loadtest'
+# Строк на транзакцию.
+BATCH_SIZE = 5000
+# Faker медленный: тексты берутся из заранее созданного набора.
+TEXT_POOL_SIZE = 2000
+GROUPLESS_SHARE = 0.3
+
+
+def zipf_cum_weights(count, exponent=1.1):
+    """Накопленные веса Ципфа для ``random.choices(cum_weights=...)``."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def _max_pk(model):
+    return model.objects.aggregate(top=Max('pk'))['top'] or 0
+
+
+def _batches(count, size):
+    while count > 0:
+        yield min(count, size)
+        count -= size
+
+
+class Generator:
+    def __init__(self, seed=0, batch_size=BATCH_SIZE, days=365,
+                 locale='ru_RU'):
+        self.rng = random.Random(seed)
+        fake = Faker(locale)
+        fake.seed_instance(seed)
+        self.fake = fake
+        self.batch_size = batch_size
+        self.days = days
+        self.now = timezone.now()
+        self.texts = [
+            fake.paragraph(nb_sentences=self.rng.randint(1, 6))
+            for _ in range(TEXT_POOL_SIZE)
+        ]
+        self.comment_texts = [
+            fake.sentence()[:300] for _ in range(TEXT_POOL_SIZE)
+        ]
+
+    def _popular(self, ids):
+        """Перемешанные id и веса: популярность не зависит от pk."""
+        ids = list(ids)
+        self.rng.shuffle(ids)
+        return ids, zipf_cum_weights(len(ids))
+
+    def _date(self):
+        return self.now - timedelta(
+            seconds=self.rng.uniform(0, self.days * 24 * 3600)
+        )
+
+    def _create(self, model, build, count):
+        """Пишет ``count`` строк пачками, возвращает id новых строк."""
+        first = _max_pk(model)
+        for size in _batches(count, self.batch_size):
+            with transaction.atomic():
+                # Размер INSERT Django подбирает под лимиты базы.
+                model.objects.bulk_create(build(size))
+        return list(model.objects.filter(
+            pk__gt=first
+        ).values_list('pk', flat=True))
+
+    def users(self, count):
+        password = make_password(PASSWORD)
+        numbers = itertools.count(_max_pk(User) + 1)
+
+        def build(size):
+            return [
+                User(username=f'{USERNAME_PREFIX}{next(numbers)}',
+                     first_name=self.fake.first_name(),
+                     last_name=self.fake.last_name(), password=password)
+                for _ in range(size)
+            ]
+        return self._create(User, build, count)
+
+    def groups(self, count):
+        numbers = itertools.count(_max_pk(Group) + 1)
+
+        def build(size):
+            groups = []
+            for _ in range(size):
+                number = next(numbers)
+                groups.append(Group(
+                    title=f'{self.fake.word().capitalize()} {number}',
+                    slug=f'{USERNAME_PREFIX}-{number}',
+                    description=self.fake.sentence(),
+                ))
+            return groups
+        return self._create(Group, build, count)
+
+    def posts(self, count, author_ids, group_ids):
+        authors, author_weights = self._popular(author_ids)
+        groups, group_weights = self._popular(group_ids)
+
+        def build(size):
+            chosen_authors = self.rng.choices(
+                authors, cum_weights=author_weights, k=size
+            )
+            chosen_groups = self.rng.choices(
+                groups, cum_weights=group_weights, k=size
+            ) if groups else [None] * size
+            return [
+                Post(text=self.rng.choice(self.texts), author_id=author,
+                     pub_date=self._date(),
+                     group_id=(None if self.rng.random() < GROUPLESS_SHARE
+                               else group))
+                for author, group in zip(chosen_authors, chosen_groups)
+            ]
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            return self._create(Post, build, count)
+
+    def comments(self, count, post_ids, author_ids):
+        posts, post_weights = self._popular(post_ids)
+
+        def build(size):
+            return [
+                Comment(post_id=post, author_id=self.rng.choice(author_ids),
+                        text=self.rng.choice(self.comment_texts),
+                        created=self._date())
+                for post in self.rng.choices(posts, cum_weights=post_weights,
+                                             k=size)
+            ]
+        with explicit_dates(Comment._meta.get_field('created')):
+            return self._create(Comment, build, count)
+
+    def follows(self, user_ids, mean):
+        """Подписки: в среднем ``mean`` на читателя, авторы по Ципфу.
+
+        Число подписчиков автора распределено степенно, число подписок
+        читателя - экспоненциально. Возвращает число подписок.
+        """
+        authors, weights = self._popular(user_ids)
+        pending, created = [], 0
+        for user in user_ids:
+            wanted = min(int(self.rng.expovariate(1 / mean)),
+                         len(authors) - 1)
+            chosen = set()
+            # Популярных авторов выбирает много повторов: добираем.
+            for _ in range(10):
+                chosen.update(self.rng.choices(
+                    authors, cum_weights=weights, k=wanted - len(chosen)
+                ))
+                chosen.discard(user)
+                if len(chosen) >= wanted:
+                    break
+            pending.extend(Follow(user_id=user, author_id=author)
+                           for author in chosen)
+            if len(pending) >= self.batch_size:
+                created += self._flush_follows(pending)
+                pending = []
+        return created + self._flush_follows(pending)
+
+    def _flush_follows(self, follows):
+        with transaction.atomic():
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        return len(follows)
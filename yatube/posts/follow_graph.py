@@ -0,0 +1,242 @@
+"""Граф подписок: множества id пользователей в кеше.
+
+Для каждого пользователя в кеше ``posts`` лежат два отсортированных
+``array('I')`` (4 байта на id): на кого он подписан и кто подписан
+на него. Проверка подписки и выборка «на кого из этих авторов я
+подписан» для целой страницы не ходят в базу, а ищут двоичным поиском
+в массиве, прочитанном одним ``get_many``.
+
+Ключ массива включает поколение ленты (posts/caching.py):
+``follow:<id>`` для подписок и ``followers:<id>`` для подписчиков.
+Сигналы ``Follow`` сменяют их поколения, и массив собирается заново
+одним запросом при следующем чтении.
+
+``follow`` и ``unfollow`` меняют пачку подписок одного читателя
+несколькими запросами внутри ``batch()``: сигналы ``Follow`` при этом
+ничего не делают, их работа (счётчики, ленты, кеш) делается на всю
+пачку.
+"""
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import caching, counters, timeline
+from .models import Follow, User
+
+KEY_PREFIX = 'graph:'
+# Владелец множества и его элементы в строке Follow.
+DIRECTIONS = {
+    'following': ('user_id', 'author_id'),
+    'followers': ('author_id', 'user_id'),
+}
+
+_batch = ContextVar('follow_batch', default=False)
+
+
+@contextmanager
+def batch():
+    """Сигналы ``Follow`` пропускают свою работу: её делает пачка."""
+    token = _batch.set(True)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+
+
+def in_batch():
+    return _batch.get()
+
+
+def feed_of(direction, user_id):
+    """Лента, поколение которой версионирует множество."""
+    if direction == 'following':
+        return f'follow:{user_id}'
+    return f'followers:{user_id}'
+
+
+class IdSet:
+    """Отсортированный неизменяемый набор id."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=()):
+        self.ids = array('I', sorted(set(ids)))
+
+    @classmethod
+    def frombytes(cls, data):
+        id_set = cls()
+        id_set.ids.frombytes(data)
+        return id_set
+
+    def tobytes(self):
+        return self.ids.tobytes()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, pk):
+        i = bisect_left(self.ids, pk)
+        return i < len(self.ids) and self.ids[i] == pk
+
+    def intersection(self, ids):
+        return {pk for pk in ids if pk in self}
+
+
+def _load(direction, user_ids):
+    """Множества ``direction`` пользователей: {id: IdSet}."""
+    user_ids = list(dict.fromkeys(user_ids))
+    versions = caching.generations(
+        [feed_of(direction, user_id) for user_id in user_ids]
+    )
+    keys = {
+        user_id: f'{KEY_PREFIX}{direction}:{user_id}:{version}'
+        for user_id, version in zip(user_ids, versions)
+    }
+    cache = caching.get_cache()
+    found = cache.get_many(keys.values())
+    sets = {
+        user_id: IdSet.frombytes(found[key])
+        for user_id, key in keys.items() if key in found
+    }
+    missing = [user_id for user_id in user_ids if user_id not in sets]
+    if missing:
+        owner, member = DIRECTIONS[direction]
+        edges = defaultdict(list)
+        for owner_id, member_id in Follow.objects.filter(
+            **{f'{owner}__in': missing}
+        ).values_list(owner, member):
+            edges[owner_id].append(member_id)
+        for user_id in missing:
+            sets[user_id] = IdSet(edges[user_id])
+        cache.set_many(
+            {keys[user_id]: sets[user_id].tobytes() for user_id in missing},
+            settings.FOLLOW_GRAPH_CACHE_TIMEOUT,
+        )
+    return sets
+
+
+def following(user_id):
+    """На кого подписан пользователь."""
+    return _load('following', [user_id])[user_id]
+
+
+def followers(user_id):
+    """Кто подписан на пользователя."""
+    return _load('followers', [user_id])[user_id]
+
+
+def is_following(user_id, author_id):
+    return author_id in following(user_id)
+
+
+def followed_among(user_id, author_ids):
+    """На кого из ``author_ids`` подписан пользователь."""
+    return following(user_id).intersection(author_ids)
+
+
+def _invalidate(user, authors):
+    # То же, что сигнал invalidate_follow_feeds, на всю пачку.
+    caching.bump(
+        f'follow:{user.pk}',
+        f'author:{user.username}',
+        *(f'followers:{author_id}' for author_id in authors),
+        *(f'author:{username}' for username in authors.values()),
+    )
+
+
+def _create(user, author_ids):
+    """Создаёт подписки; возвращает id авторов действительно новых строк.
+
+    Параллельная подписка на того же автора могла успеть раньше: тогда
+    пачка откатывается к точке сохранения и строки вставляются по одной.
+    """
+    try:
+        with transaction.atomic():
+            Follow.objects.bulk_create(
+                [Follow(user=user, author_id=author_id)
+                 for author_id in author_ids]
+            )
+        return author_ids
+    except IntegrityError:
+        pass
+    created = []
+    for author_id in author_ids:
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=user, author_id=author_id)
+        except IntegrityError:
+            continue
+        created.append(author_id)
+    return created
+
+
+def follow(user, author_ids):
+    """Подписывает ``user`` на авторов; возвращает число новых."""
+    with transaction.atomic(), batch():
+        candidates = dict(
+            User.objects.filter(pk__in=author_ids)
+            .exclude(pk=user.pk)
+            .exclude(following__user=user)
+            .values_list('pk', 'username')
+        )
+        if not candidates:
+            return 0
+        new = {
+            author_id: candidates[author_id]
+            for author_id in _create(user, sorted(candidates))
+        }
+        if not new:
+            return 0
+        counters.change_profile(user.pk, following_count=len(new))
+        counters.change_profiles(new, followers_count=1)
+        timeline.backfill(user.pk, *new)
+    _invalidate(user, new)
+    return len(new)
+
+
+def unfollow(user, author_ids):
+    """Отписывает ``user`` от авторов; возвращает число удалённых.
+
+    ``author_ids`` может быть и запросом (``values('pk')``).
+    """
+    with transaction.atomic(), batch():
+        follows = Follow.objects.filter(user=user, author_id__in=author_ids)
+        gone = dict(follows.values_list('author_id', 'author__username'))
+        if not gone:
+            return 0
+        Follow.objects.filter(user=user, author_id__in=list(gone)).delete()
+        counters.change_profile(user.pk, following_count=-len(gone))
+        counters.change_profiles(gone, followers_count=-1)
+        timeline.trim(user.pk, *gone)
+        timeline.cool_down(*gone)
+    _invalidate(user, gone)
+    return len(gone)
+
+
+def export_edges():
+    """Все подписки парами (user_id, author_id) по читателям."""
+    return Follow.objects.order_by('user_id', 'author_id').values_list(
+        'user_id', 'author_id'
+    ).iterator()
+
+
+def import_edges(edges):
+    """Загружает пары (user_id, author_id); возвращает число новых.
+
+    Пары одного читателя должны идти подряд (как в ``export_edges``).
+    """
+    created = 0
+    for user_id, group in groupby(edges, key=lambda edge: edge[0]):
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            created += follow(user, [author_id for _, author_id in group])
+    return created
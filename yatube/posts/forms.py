@@ -1,6 +1,8 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 
-
+from . import uploads
 from .models import Comment, Post
 
 
@@ -14,6 +16,35 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение'
         }
 
+    def __init__(self, *args, oversized=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # ImageField открывает картинку в Pillow, поэтому лимиты
+        # проверяются по заголовку раньше, чем поле её увидит.
+        # ``oversized`` - поля, пропущенные ImageUploadHandler.
+        self.image_error = None
+        image = self.files.get(self.add_prefix('image'))
+        if self.add_prefix('image') in oversized:
+            self.image_error = uploads.too_large_error()
+        elif image is not None:
+            try:
+                uploads.check_image(image)
+            except ValidationError as error:
+                self.image_error = error
+                self.files = self.files.copy()
+                del self.files[self.add_prefix('image')]
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return uploads.strip_metadata(image)
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.image_error is not None:
+            self.add_error('image', self.image_error)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
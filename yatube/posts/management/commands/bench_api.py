@@ -0,0 +1,89 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from posts import caching
+from posts.management.commands.bench_cache import percentile
+from posts.models import Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает HTML-страницы лент и JSON API: размер ответа, '
+        'задержку и задержку повторного запроса с If-None-Match (304).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Запросов на каждый адрес.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш лент перед каждым запросом.')
+
+    def pages(self):
+        """(название, читатель, HTML-адрес, адрес API) для сравнения."""
+        post = Post.objects.order_by('-comment_count').first()
+        group = Group.objects.order_by('-post_count').first()
+        if post is None or group is None:
+            raise CommandError('Нужны посты и группы: заполните базу.')
+        pages = [
+            ('index', None, 'posts:home', 'posts:api_index', ()),
+            ('group', None, 'posts:group_list', 'posts:api_group_list',
+             (group.slug,)),
+            ('profile', None, 'posts:profile', 'posts:api_profile',
+             (post.author.username,)),
+            ('post', None, 'posts:post_detail', 'posts:api_post_detail',
+             (post.pk,)),
+        ]
+        reader = Follow.objects.values('user').annotate(
+            total=Count('author')
+        ).order_by('-total').first()
+        if reader is not None:
+            pages.append(('follow', User.objects.get(pk=reader['user']),
+                          'posts:follow_index', 'posts:api_follow_index', ()))
+        return [
+            (label, user, reverse(html, args=args), reverse(api, args=args))
+            for label, user, html, api, args in pages
+        ]
+
+    def measure(self, client, url, requests, cold, **headers):
+        latencies, size, status = [], 0, None
+        for _ in range(requests):
+            if cold:
+                caching.get_cache().clear()
+            started = time.perf_counter()
+            response = client.get(url, **headers)
+            latencies.append(time.perf_counter() - started)
+            size, status = len(response.content), response.status_code
+        return latencies, size, status
+
+    def report(self, label, latencies, size, status):
+        self.stdout.write(
+            f'  {label:>5}: {status} {size:>7} байт, '
+            f'p50 {percentile(latencies, 0.5) * 1000:.2f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.2f} мс, '
+            f'среднее {statistics.mean(latencies) * 1000:.2f} мс'
+        )
+
+    def handle(self, *args, **options):
+        requests, cold = options['requests'], options['cold']
+        for label, user, html_url, api_url in self.pages():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            self.stdout.write(f'{label}: {html_url} / {api_url}')
+            self.report('html', *self.measure(client, html_url, requests,
+                                              cold))
+            latencies, size, status = self.measure(client, api_url, requests,
+                                                   cold)
+            self.report('json', latencies, size, status)
+            if cold:
+                # Очистка кеша сбрасывает и поколения лент: ETag
+                # меняется на каждом запросе, 304 не бывает.
+                continue
+            etag = client.get(api_url)['ETag']
+            self.report('304', *self.measure(client, api_url, requests, cold,
+                                             HTTP_IF_NONE_MATCH=etag))
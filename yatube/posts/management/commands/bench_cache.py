@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from posts import caching
+from posts.models import Group
+
+
+def percentile(values, share):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает кеш-бэкенды: N процессов-воркеров запрашивают '
+        'index и group_posts, выводятся доля попаданий и задержки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на одного воркера.')
+        parser.add_argument('--backends', default='locmem,file,sqlite',
+                            help='Бэкенды из settings.CACHE_BACKENDS.')
+        parser.add_argument('--worker', action='store_true',
+                            help='Служебный режим: один воркер.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options['requests'], options['seed'])
+        for backend in options['backends'].split(','):
+            self.run_backend(backend, options['workers'],
+                             options['requests'])
+
+    def urls(self):
+        urls = [reverse('posts:home')]
+        for slug in Group.objects.values_list('slug', flat=True)[:10]:
+            urls.append(reverse('posts:group_list', kwargs={'slug': slug}))
+        return [f'{url}?page={page}' for url in urls for page in (1, 2, 3)]
+
+    def run_worker(self, requests, seed):
+        urls = self.urls()
+        rng = random.Random(seed)
+        client = Client()
+        latencies = []
+        for _ in range(requests):
+            url = rng.choice(urls)
+            started = time.perf_counter()
+            client.get(url)
+            latencies.append(time.perf_counter() - started)
+        self.stdout.write(json.dumps({
+            'latencies': latencies,
+            'hits': caching.stats['hits'],
+            'misses': caching.stats['misses'],
+        }))
+
+    def run_backend(self, backend, workers, requests):
+        config = settings.CACHE_BACKENDS[backend]
+        env = dict(os.environ, YATUBE_CACHE=backend)
+        with tempfile.TemporaryDirectory() as directory:
+            location = config['LOCATION']
+            if backend == 'file':
+                location = os.path.join(directory, 'cache')
+            elif backend == 'sqlite':
+                location = os.path.join(directory, 'cache.sqlite3')
+            env['YATUBE_CACHE_LOCATION'] = location
+            import_string(config['BACKEND'])(location, {}).clear()
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, sys.argv[0], 'bench_cache', '--worker',
+                     '--requests', str(requests), '--seed', str(number)],
+                    env=env, stdout=subprocess.PIPE,
+                )
+                for number in range(workers)
+            ]
+            results = [
+                json.loads(process.communicate()[0].splitlines()[-1])
+                for process in processes
+            ]
+        latencies = [value for result in results
+                     for value in result['latencies']]
+        hits = sum(result['hits'] for result in results)
+        total = hits + sum(result['misses'] for result in results)
+        self.stdout.write(
+            f'{backend:>8}: воркеров {workers}, '
+            f'попаданий {hits / (total or 1):.1%}, '
+            f'p50 {percentile(latencies, 0.5) * 1000:.2f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.2f} мс, '
+            f'среднее {statistics.mean(latencies or [0]) * 1000:.2f} мс'
+        )
@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import reverse
+
+from posts import caching, views
+from posts.management.commands.bench_cache import percentile
+from posts.models import Group, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Время рендера страницы ленты из карточек постов: с холодным '
+        'кешем карточек (все рендерятся) и с тёплым (один get_many). '
+        'Кеш целых страниц не используется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=5,
+                            help='Страниц каждой ленты.')
+        parser.add_argument('--rounds', type=int, default=20,
+                            help='Проходов по страницам в каждом режиме.')
+
+    def feeds(self, pages):
+        """(название, view без cache_feed, аргументы, адреса страниц)."""
+        group = Group.objects.order_by('-post_count').first()
+        post = Post.objects.order_by('-pub_date').first()
+        if group is None or post is None:
+            raise CommandError('Нужны посты и группы: заполните базу.')
+        feeds = [
+            ('index', views.index, (), reverse('posts:home')),
+            ('group', views.group_posts, (group.slug,),
+             reverse('posts:group_list', args=[group.slug])),
+            ('profile', views.profile, (post.author.username,),
+             reverse('posts:profile', args=[post.author.username])),
+        ]
+        return [
+            (label, view.__wrapped__, args, [
+                f'{url}?page={page}' for page in range(1, pages + 1)
+            ])
+            for label, view, args, url in feeds
+        ]
+
+    def measure(self, view, args, urls, rounds, cold):
+        factory = RequestFactory()
+        latencies = []
+        for _ in range(rounds):
+            for url in urls:
+                if cold:
+                    caching.get_cache().clear()
+                request = factory.get(url)
+                request.user = AnonymousUser()
+                started = time.perf_counter()
+                view(request, *args)
+                latencies.append(time.perf_counter() - started)
+        return latencies
+
+    def handle(self, *args, **options):
+        for label, view, args, urls in self.feeds(options['pages']):
+            self.stdout.write(f'{label}: {len(urls)} стр.')
+            for mode, cold in (('cold', True), ('warm', False)):
+                caching.stats.clear()
+                latencies = self.measure(view, args, urls,
+                                         options['rounds'], cold)
+                hits = caching.stats['card_hits']
+                total = hits + caching.stats['card_misses']
+                self.stdout.write(
+                    f'  {mode}: карточек из кеша {hits / (total or 1):.0%}, '
+                    f'p50 {percentile(latencies, 0.5) * 1000:.2f} мс, '
+                    f'p95 {percentile(latencies, 0.95) * 1000:.2f} мс, '
+                    f'среднее {statistics.mean(latencies) * 1000:.2f} мс'
+                )
@@ -0,0 +1,88 @@
+import copy
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from core.templates import warm_up
+from posts import cards
+from posts.management.commands.bench_cache import percentile
+from posts.models import Post
+
+TEMPLATE = 'posts/index.html'
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        f'Время рендера {TEMPLATE} с 10 постами при разных загрузчиках '
+        'шаблонов: без кеша (как при DEBUG), кеширующий с разбором '
+        'при первом рендере и кеширующий после прогрева.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=200)
+
+    def engine(self, name, cached):
+        params = copy.deepcopy(settings.TEMPLATES[0])
+        params.pop('BACKEND')
+        params['NAME'] = name
+        params['APP_DIRS'] = False
+        params['OPTIONS']['loaders'] = (
+            [('django.template.loaders.cached.Loader', LOADERS)]
+            if cached else LOADERS
+        )
+        return DjangoTemplates(params)
+
+    def context(self):
+        page = Paginator(Post.objects.for_feed(), 10).get_page(1)
+        if not page:
+            raise CommandError('Нужны посты: заполните базу.')
+        # Карточки берутся из кеша: сравниваются загрузчики, а не рендер
+        # карточек (его меряет bench_cards).
+        cards.attach(page)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return {'page_obj': page}, request
+
+    def measure(self, backend, renders, reset, context, request):
+        latencies = []
+        for _ in range(renders):
+            if reset:
+                backend.engine.template_loaders[0].reset()
+            started = time.perf_counter()
+            backend.get_template(TEMPLATE).render(context, request)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    def handle(self, *args, **options):
+        context, request = self.context()
+        warm = self.engine('warm', cached=True)
+        started = time.perf_counter()
+        count = warm_up(warm.engine)
+        self.stdout.write(
+            f'прогрев: {count} шаблонов за '
+            f'{(time.perf_counter() - started) * 1000:.1f} мс'
+        )
+        configs = [
+            ('без кеша', self.engine('uncached', cached=False), False),
+            ('кеш, холодный', self.engine('cold', cached=True), True),
+            ('кеш, прогретый', warm, False),
+        ]
+        for label, backend, reset in configs:
+            latencies = self.measure(backend, options['renders'], reset,
+                                     context, request)
+            self.stdout.write(
+                f'{label:>14}: '
+                f'p50 {percentile(latencies, 0.5) * 1000:.3f} мс, '
+                f'p95 {percentile(latencies, 0.95) * 1000:.3f} мс, '
+                f'среднее {statistics.mean(latencies) * 1000:.3f} мс'
+            )
@@ -0,0 +1,115 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.forms import modelform_factory
+from django.test import RequestFactory, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.models import Post
+
+MODES = {
+    # Как было: загрузка в память или на диск по умолчанию Django
+    # и обычный ModelForm с проверкой ImageField.
+    'before': (
+        [
+            'django.core.files.uploadhandler.MemoryFileUploadHandler',
+            'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+        ],
+        modelform_factory(Post, fields=('text', 'group', 'image')),
+    ),
+    'after': (['posts.uploads.ImageUploadHandler'], PostForm),
+}
+
+
+def reset_peak_rss():
+    """Сбрасывает пик RSS (VmHWM) процесса, если ядро это умеет."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пиковую память (RSS) процесса на одну загрузку '
+        'картинки поста до и после потоковой обработки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+        parser.add_argument('--modes', default='before,after')
+        parser.add_argument('--worker', metavar='PATH',
+                            help='Служебный режим: загрузить файл PATH.')
+        parser.add_argument('--mode', default='after')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options['worker'], options['mode'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'photo.jpg')
+            self.make_image(path, options['width'], options['height'])
+            self.stdout.write(
+                f'Картинка {options["width"]}×{options["height"]}, '
+                f'{os.path.getsize(path) / 1024 / 1024:.1f} МБ'
+            )
+            for mode in options['modes'].split(','):
+                process = subprocess.run(
+                    [sys.executable, sys.argv[0], 'bench_uploads',
+                     '--worker', path, '--mode', mode],
+                    stdout=subprocess.PIPE, check=True,
+                )
+                result = json.loads(process.stdout.splitlines()[-1])
+                self.stdout.write(
+                    f'{mode:>7}: прирост пиковой RSS '
+                    f'{result["peak_delta_kb"] / 1024:.1f} МБ, '
+                    f'форма валидна: {result["valid"]}'
+                )
+
+    def make_image(self, path, width, height):
+        # Шум не даёт JPEG сжаться: файл по размеру как у фотографии.
+        noise = Image.effect_noise((width, height), 48)
+        image = Image.merge('RGB', (
+            Image.effect_mandelbrot((width, height), (-2, -1.5, 1, 1.5), 64),
+            noise,
+            noise.transpose(Image.FLIP_LEFT_RIGHT),
+        ))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        image.save(path, 'JPEG', quality=90, exif=exif.tobytes())
+
+    def run_worker(self, path, mode):
+        handlers, form_class = MODES[mode]
+        with open(path, 'rb') as file:
+            body = encode_multipart(BOUNDARY, {'text': 'Пост', 'image': file})
+        request = RequestFactory().generic(
+            'POST', '/create/', body, content_type=MULTIPART_CONTENT
+        )
+        reset_peak_rss()
+        before = peak_rss_kb()
+        with override_settings(FILE_UPLOAD_HANDLERS=handlers):
+            form = form_class(request.POST, files=request.FILES)
+            valid = form.is_valid()
+        self.stdout.write(json.dumps({
+            'peak_delta_kb': peak_rss_kb() - before,
+            'valid': valid,
+        }))
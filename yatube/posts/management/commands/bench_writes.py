@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.signals import got_request_exception
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.utils import OperationalError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts.management.commands.bench_cache import percentile
+from posts.models import Post, User
+
+MODES = {
+    # Стандартный бэкенд Django: журнал отката, BEGIN DEFERRED.
+    'plain': 'django.db.backends.sqlite3',
+    # WAL, PRAGMA и очередь записи (core/db/sqlite3).
+    'tuned': 'core.db.sqlite3',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест записи в SQLite: потоки создают посты и '
+        'комментарии через views, параллельно читается главная. '
+        'Сравниваются стандартный бэкенд и core.db.sqlite3.'
+    )
+    # Проверки моделей открывают подключение до выбора бэкенда воркером.
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на один поток.')
+        parser.add_argument('--modes', default='plain,tuned')
+        parser.add_argument('--worker', choices=MODES,
+                            help='Служебный режим: один прогон.')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options['worker'], options)
+        for mode in options['modes'].split(','):
+            self.run_mode(mode, options)
+
+    def run_mode(self, mode, options):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, YATUBE_DB_NAME=os.path.join(
+                directory, 'db.sqlite3'
+            ))
+            output = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_writes',
+                 '--worker', mode,
+                 '--writers', str(options['writers']),
+                 '--readers', str(options['readers']),
+                 '--requests', str(options['requests'])],
+                env=env, stdout=subprocess.PIPE, check=True,
+            ).stdout
+        result = json.loads(output.splitlines()[-1])
+        writes, reads = result['writes'], result['reads']
+        self.stdout.write(
+            f'{mode:>6}: записей {len(writes)}, '
+            f'database is locked {result["locked"]}, '
+            f'других ошибок {len(result["errors"])}, '
+            f'запись p50 {percentile(writes, 0.5) * 1000:.1f} мс '
+            f'p99 {percentile(writes, 0.99) * 1000:.1f} мс, '
+            f'чтение p50 {percentile(reads, 0.5) * 1000:.1f} мс '
+            f'p99 {percentile(reads, 0.99) * 1000:.1f} мс, '
+            f'записей в секунду {len(writes) / result["elapsed"]:.0f}'
+        )
+        for error in sorted(set(result['errors'])):
+            self.stdout.write(f'        {error}')
+
+    def run_worker(self, mode, options):
+        connections.databases['default']['ENGINE'] = MODES[mode]
+        tuning = {} if mode == 'tuned' else {
+            'SQLITE_PRAGMAS': {}, 'SQLITE_SERIALIZE_WRITES': False,
+        }
+        with override_settings(**tuning):
+            call_command('migrate', verbosity=0)
+            users = [
+                User.objects.create_user(username=f'writer{number}')
+                for number in range(options['writers'])
+            ]
+            posts = [
+                Post.objects.create(text='Первый пост', author=user).pk
+                for user in users
+            ]
+            connection.close()
+            result = self.load(users, posts, options)
+        self.stdout.write(json.dumps(result))
+
+    def load(self, users, posts, options):
+        return WriteLoad(users, posts, options).run()
+
+
+class WriteLoad:
+    """Один прогон: потоки-писатели и потоки-читатели через views."""
+
+    def __init__(self, users, posts, options):
+        self.users = users
+        self.posts = posts
+        self.requests = options['requests']
+        self.readers = options['readers']
+        self.result = {'writes': [], 'reads': [], 'locked': 0, 'errors': []}
+        self.lock = threading.Lock()
+        # Client ловит исключения view через общий сигнал, и в потоках
+        # они достаются чужим клиентам; сигнал же приходит в том потоке,
+        # где view упала.
+        self.failures = threading.local()
+        self.barrier = threading.Barrier(len(users) + self.readers)
+        self.done = threading.Event()
+
+    def record(self, sender, **kwargs):
+        self.failures.error = sys.exc_info()[1]
+
+    def quiet_client(self):
+        client = Client()
+        client.store_exc_info = lambda **kwargs: None
+        return client
+
+    def writer(self, user, seed):
+        rng = random.Random(seed)
+        client = self.quiet_client()
+        client.force_login(user)
+        latencies, locked, errors = [], 0, []
+        self.barrier.wait()
+        for number in range(self.requests):
+            if number % 2:
+                url = reverse('posts:add_comment',
+                              args=[rng.choice(self.posts)])
+            else:
+                url = reverse('posts:create')
+            self.failures.error = None
+            started = time.perf_counter()
+            client.post(url, {'text': f'Текст {number}'})
+            latencies.append(time.perf_counter() - started)
+            error = self.failures.error
+            if isinstance(error, OperationalError) and 'locked' in str(error):
+                locked += 1
+            elif error is not None:
+                errors.append(repr(error))
+        connection.close()
+        with self.lock:
+            self.result['writes'] += latencies
+            self.result['locked'] += locked
+            self.result['errors'] += errors
+
+    def reader(self):
+        client = self.quiet_client()
+        latencies = []
+        self.barrier.wait()
+        while not self.done.is_set():
+            started = time.perf_counter()
+            client.get(reverse('posts:home'))
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        with self.lock:
+            self.result['reads'] += latencies
+
+    def run(self):
+        got_request_exception.connect(self.record, weak=False)
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        writers = [
+            threading.Thread(target=self.writer, args=(user, number))
+            for number, user in enumerate(self.users)
+        ]
+        readers = [threading.Thread(target=self.reader)
+                   for _ in range(self.readers)]
+        started = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        self.result['elapsed'] = time.perf_counter() - started
+        self.done.set()
+        for thread in readers:
+            thread.join()
+        self.result['reads'] = self.result['reads'] or [0.0]
+        return self.result
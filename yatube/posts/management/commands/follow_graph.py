@@ -0,0 +1,45 @@
+import csv
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from posts import follow_graph
+
+
+class Command(BaseCommand):
+    help = ('Выгружает подписки в CSV (user_id,author_id) или загружает '
+            'их из CSV вместе со счётчиками и лентами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['export', 'import'])
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл CSV; по умолчанию stdout/stdin.',
+        )
+
+    def handle(self, *args, action, path, **options):
+        if action == 'export':
+            with self._open(path, 'w') as stream:
+                writer = csv.writer(stream, lineterminator='\n')
+                count = 0
+                for edge in follow_graph.export_edges():
+                    writer.writerow(edge)
+                    count += 1
+            self.stderr.write(f'Выгружено подписок: {count}')
+            return
+        with self._open(path, 'r') as stream:
+            created = follow_graph.import_edges(
+                (int(user_id), int(author_id))
+                for user_id, author_id in csv.reader(stream)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано подписок: {created}'
+        ))
+
+    def _open(self, path, mode):
+        if path != '-':
+            return open(path, mode, newline='')
+        stream = self.stdout if mode == 'w' else sys.stdin
+        # Стандартные потоки не закрываются вместе с командой.
+        return nullcontext(stream)
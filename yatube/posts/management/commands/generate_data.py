@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import caching, counters, datagen, search, timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу данными для нагрузочных тестов: пользователи, '
+        'группы, посты, комментарии и подписки со степенным '
+        f'распределением популярности. Пароль пользователей - '
+        f'{datagen.PASSWORD!r}.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=float, default=20,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней разбросаны даты постов.')
+        parser.add_argument('--batch-size', type=int,
+                            default=datagen.BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересобирать счётчики, ленты '
+                                 'подписок и поисковый индекс.')
+
+    def stage(self, label, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        rows = result if isinstance(result, int) else len(result)
+        self.stdout.write(
+            f'{label}: {rows} за {elapsed:.1f} с '
+            f'({rows / (elapsed or 1):.0f} в секунду)'
+        )
+        return result
+
+    def handle(self, *args, **options):
+        generator = datagen.Generator(
+            seed=options['seed'], batch_size=options['batch_size'],
+            days=options['days'],
+        )
+        users = self.stage('пользователи', generator.users,
+                           options['users'])
+        groups = self.stage('группы', generator.groups, options['groups'])
+        posts = self.stage('посты', generator.posts, options['posts'],
+                           users, groups)
+        self.stage('комментарии', generator.comments, options['comments'],
+                   posts, users)
+        self.stage('подписки', generator.follows, users, options['follows'])
+        if options['skip_rebuild']:
+            self.stdout.write(self.style.WARNING(
+                'Счётчики, ленты и поиск не пересобраны: запустите '
+                'reconcile_counters, rebuild_timelines и '
+                'rebuild_search_index.'
+            ))
+        else:
+            self.stage('счётчики', lambda: sum(counters.reconcile().values()))
+            self.stage('ленты подписок', timeline.rebuild)
+            self.stage('поисковый индекс', search.get_index().rebuild)
+        caching.get_cache().clear()
+        self.stdout.write(self.style.SUCCESS('Готово.'))
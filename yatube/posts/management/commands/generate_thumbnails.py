@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит все варианты миниатюр для картинок существующих постов.'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').select_related('author')
+        done = failed = 0
+        for post in posts.iterator():
+            try:
+                thumbnails.generate(post.image.name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{post.image.name}: {error}')
+                continue
+            caching.bump(*caching.feeds_of_post(post))
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done}, с ошибками: {failed}'
+        ))
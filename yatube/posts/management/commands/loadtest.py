@@ -0,0 +1,331 @@
+import json
+import logging
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+import requests
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler)
+from django.core.signals import got_request_exception
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from posts import urls
+from posts.management.commands.bench_cache import percentile
+from posts.models import Comment, Group, Post, User
+
+# Вес адреса в смеси запросов: чтения лент преобладают над записью.
+MIX = {
+    'home': 20,
+    'group_list': 10,
+    'profile': 10,
+    'post_detail': 20,
+    'search': 3,
+    'follow_index': 10,
+    'create': 1,
+    'post_edit': 1,
+    'add_comment': 2,
+    'post_comments': 3,
+    'comment_thread': 2,
+    'profile_follow': 1,
+    'profile_unfollow': 1,
+    'api_index': 3,
+    'api_post_detail': 3,
+    'api_post_comments': 1,
+    'api_comment_thread': 1,
+    'api_group_list': 2,
+    'api_profile': 2,
+    'api_follow_index': 2,
+    'api_search': 1,
+}
+LOGIN_REQUIRED = {
+    'create', 'post_edit', 'add_comment', 'follow_index',
+    'profile_follow', 'profile_unfollow', 'api_follow_index',
+}
+POSTS = {'create', 'post_edit', 'add_comment'}
+QUERY_ID_HEADER = 'X-Loadtest-Id'
+
+
+class QueryCounter:
+    """Считает SQL-запросы ко всем базам в текущем потоке."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def counting(self):
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(self))
+            yield self
+
+
+class CountingApplication:
+    """WSGI-приложение, запоминающее число запросов к базе по id запроса.
+
+    Сервер работает в том же процессе, поэтому счётчики читаются из
+    словаря, а не передаются в ответе.
+    """
+
+    def __init__(self):
+        self.application = WSGIHandler()
+        self.queries = {}
+
+    def __call__(self, environ, start_response):
+        key = environ.get('HTTP_' + QUERY_ID_HEADER.upper().replace('-', '_'))
+        with QueryCounter().counting() as counter:
+            response = self.application(environ, start_response)
+        if key:
+            self.queries[key] = counter.count
+        return response
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Sample:
+    """Случайные аргументы адресов из данных в базе."""
+
+    def __init__(self, limit):
+        self.slugs = list(Group.objects.values_list('slug', flat=True)[:limit])
+        self.usernames = list(
+            User.objects.values_list('username', flat=True)[:limit]
+        )
+        self.post_ids = list(
+            Post.objects.order_by('-pub_date').values_list('pk', flat=True)
+            [:limit]
+        )
+        self.threads = list(
+            Comment.objects.filter(thread=None).order_by('-created')
+            .values_list('post', 'pk')[:limit]
+        )
+        words = ' '.join(Post.objects.filter(
+            pk__in=self.post_ids[:20]
+        ).values_list('text', flat=True)).split()
+        self.words = [word.strip('.,').lower() for word in words] or ['пост']
+        if not (self.slugs and self.usernames and self.post_ids
+                and self.threads):
+            raise CommandError(
+                'Нужны пользователи, группы, посты и комментарии: '
+                'запустите generate_data.'
+            )
+
+    def request(self, name, user, rng):
+        """(метод, адрес, данные POST) для адреса ``name``."""
+        args, query, data = [], '', None
+        if name in ('group_list', 'api_group_list'):
+            args = [rng.choice(self.slugs)]
+        elif name in ('profile', 'api_profile', 'profile_follow',
+                      'profile_unfollow'):
+            args = [rng.choice(self.usernames)]
+        elif name in ('post_detail', 'api_post_detail', 'add_comment',
+                      'post_comments', 'api_post_comments'):
+            args = [rng.choice(self.post_ids)]
+        elif name in ('comment_thread', 'api_comment_thread'):
+            args = list(rng.choice(self.threads))
+        elif name == 'post_edit':
+            args = [user.own_post_id or rng.choice(self.post_ids)]
+        elif name in ('search', 'api_search'):
+            query = f'?q={rng.choice(self.words)}'
+        if name in POSTS:
+            data = {'text': f'Нагрузочный текст {rng.random()}'}
+        method = 'POST' if name in POSTS else 'GET'
+        return method, reverse(f'posts:{name}', args=args) + query, data
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест всех адресов posts/urls.py: потоки-клиенты '
+        'шлют смесь чтений и записей через тестовый клиент или '
+        'локальный WSGI-сервер. Выводятся p50/p95/p99 и число '
+        'SQL-запросов на запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=4,
+                            help='Параллельных клиентов (потоков).')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на одного клиента.')
+        parser.add_argument('--anonymous', type=float, default=0.5,
+                            help='Доля анонимных запросов на чтение.')
+        parser.add_argument('--server', action='store_true',
+                            help='Слать HTTP-запросы на локальный '
+                                 'WSGI-сервер вместо тестового клиента.')
+        parser.add_argument('--sample', type=int, default=1000,
+                            help='Сколько групп, авторов и постов '
+                                 'брать для адресов.')
+        parser.add_argument('--json', help='Записать замеры в файл.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        missing = sorted(names - set(MIX))
+        if missing:
+            raise CommandError(
+                f'Нет сценария для адресов: {", ".join(missing)}'
+            )
+        self.rng = random.Random(options['seed'])
+        self.sample = Sample(options['sample'])
+        users = list(User.objects.order_by('?')[:options['clients']])
+        for user in users:
+            user.own_post_id = user.posts.values_list(
+                'pk', flat=True
+            ).first()
+        connection.close()
+        self.results = defaultdict(list)
+        self.errors = []
+        self.lock = threading.Lock()
+        with ExitStack() as stack:
+            self.server = None
+            if options['server']:
+                self.server = stack.enter_context(self.serve())
+            started = time.perf_counter()
+            self.run_clients(users, options)
+            elapsed = time.perf_counter() - started
+        self.report(elapsed)
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(self.results, output)
+
+    @contextmanager
+    def serve(self):
+        application = CountingApplication()
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(application)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        server.url = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def run_clients(self, users, options):
+        failures = threading.local()
+
+        def record(sender, **kwargs):
+            failures.error = sys.exc_info()[1]
+        got_request_exception.connect(record, weak=False)
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        names, weights = zip(*MIX.items())
+        threads = [
+            threading.Thread(target=self.client, args=(
+                user, random.Random(self.rng.random()), names, weights,
+                failures, options,
+            ))
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        got_request_exception.disconnect(record)
+
+    def client(self, user, rng, names, weights, failures, options):
+        transport = (self.http_transport(user) if self.server
+                     else self.client_transport(user))
+        results, errors = [], []
+        for _ in range(options['requests']):
+            name = rng.choices(names, weights)[0]
+            authorized = (name in LOGIN_REQUIRED
+                          or rng.random() >= options['anonymous'])
+            method, url, data = self.sample.request(name, user, rng)
+            failures.error = None
+            try:
+                status, elapsed, queries = transport(authorized, method, url,
+                                                     data)
+            except Exception as error:
+                status, elapsed, queries = 0, 0.0, 0
+                failures.error = error
+            if failures.error is not None:
+                errors.append(f'{name}: {failures.error!r}')
+            elif status >= 500:
+                errors.append(f'{name}: HTTP {status}')
+            results.append((name, elapsed, queries, status))
+        connection.close()
+        with self.lock:
+            for name, elapsed, queries, status in results:
+                self.results[name].append((elapsed, queries, status))
+            self.errors += errors
+
+    def client_transport(self, user):
+        anonymous, authorized = Client(), Client()
+        authorized.force_login(user)
+        for client in (anonymous, authorized):
+            # Исключение view достаётся тому потоку, где она упала.
+            client.store_exc_info = lambda **kwargs: None
+
+        def send(is_authorized, method, url, data):
+            client = authorized if is_authorized else anonymous
+            request = client.post if method == 'POST' else client.get
+            with QueryCounter().counting() as counter:
+                started = time.perf_counter()
+                response = request(url, data)
+                elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, counter.count
+        return send
+
+    def http_transport(self, user):
+        login = Client()
+        login.force_login(user)
+        csrf_token = get_random_string(32)
+        anonymous, authorized = requests.Session(), requests.Session()
+        authorized.cookies.set(
+            settings.SESSION_COOKIE_NAME,
+            login.cookies[settings.SESSION_COOKIE_NAME].value,
+        )
+        authorized.cookies.set(settings.CSRF_COOKIE_NAME, csrf_token)
+        queries = self.server.application.queries
+
+        def send(is_authorized, method, url, data):
+            session = authorized if is_authorized else anonymous
+            key = get_random_string(16)
+            headers = {QUERY_ID_HEADER: key, 'X-CSRFToken': csrf_token}
+            started = time.perf_counter()
+            response = session.request(method, self.server.url + url,
+                                       data=data, headers=headers,
+                                       allow_redirects=False)
+            elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, queries.pop(key, 0)
+        return send
+
+    def report(self, elapsed):
+        self.stdout.write(
+            f'{"адрес":<18}{"запросов":>9}{"ошибок":>8}'
+            f'{"p50 мс":>9}{"p95 мс":>9}{"p99 мс":>9}{"SQL":>7}'
+        )
+        rows = sorted(self.results.items())
+        everything = [sample for _, samples in rows for sample in samples]
+        for name, samples in rows + [('всего', everything)]:
+            latencies = [sample[0] for sample in samples]
+            failed = sum(1 for sample in samples
+                         if not sample[2] or sample[2] >= 500)
+            self.stdout.write(
+                f'{name:<18}{len(samples):>9}{failed:>8}'
+                f'{percentile(latencies, 0.5) * 1000:>9.1f}'
+                f'{percentile(latencies, 0.95) * 1000:>9.1f}'
+                f'{percentile(latencies, 0.99) * 1000:>9.1f}'
+                f'{statistics.mean(sample[1] for sample in samples):>7.1f}'
+            )
+        self.stdout.write(
+            f'запросов в секунду: {len(everything) / elapsed:.0f}'
+        )
+        for error in sorted(set(self.errors)):
+            self.stdout.write(self.style.ERROR(f'  {error}'))
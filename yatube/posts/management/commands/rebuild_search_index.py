@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов и комментариев.'
+
+    def handle(self, *args, **options):
+        index = search.get_index()
+        indexed = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(index).__name__}: проиндексировано постов: {indexed}'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок с нуля.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать ленты только этих пользователей.',
+        )
+
+    def handle(self, *args, usernames=(), **options):
+        users = None
+        if usernames:
+            users = User.objects.filter(username__in=usernames)
+        created = timeline.rebuild(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано записей в лентах: {created}'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет расхождения.'
+
+    def handle(self, *args, **options):
+        repaired = counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            'Исправлено строк: '
+            f'посты {repaired["post"]}, группы {repaired["group"]}, '
+            f'профили {repaired["profile"]}'
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:50
+
+from django.db import OperationalError, migrations, models
+import django.db.models.deletion
+
+FTS_TABLE = 'posts_search'
+
+
+def create_fts_table(apps, schema_editor):
+    # Индекс FTS5 есть только в SQLite; в остальных базах поиск
+    # работает по таблице SearchTerm.
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} '
+                f'USING fts5(text, comments)'
+            )
+        except OperationalError:
+            # SQLite собран без FTS5.
+            pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+            options={
+                'verbose_name': 'Слово поиска',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='search_term_post'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
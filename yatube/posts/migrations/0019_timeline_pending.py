@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_hot_authors(apps, schema_editor):
+    # Посты «тяжёлых» авторов могли не попасть в ленты: их раздаст
+    # фоновая задача, когда автор опустится ниже порога.
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if limit is None:
+        return
+    ProfileStats = apps.get_model('posts', 'ProfileStats')
+    ProfileStats.objects.filter(
+        followers_count__gte=limit
+    ).update(timeline_pending=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilestats',
+            name='timeline_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_hot_authors, migrations.RunPython.noop),
+    ]
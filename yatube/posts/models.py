@@ -1,8 +1,72 @@
+from contextlib import contextmanager
+
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Поля, которые читают шаблоны лент: остальные колонки не выбираются.
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__title',
+    'group__slug',
+)
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add: ``bulk_create`` сохранит заданные даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа в том же запросе."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_viewer(self, user):
+        """Подписка читателя на автора и число постов автора.
+
+        Считается в запросе страницы коррелированными подзапросами
+        (``EXISTS`` по ``Follow``, счётчик ``ProfileStats``), поэтому
+        кнопки подписки на ленте не добавляют запросов на пост.
+        Подзапросы вычисляются для каждой строки: аннотировать стоит
+        только посты страницы (``page_context`` во views). Группу
+        поста уже загружает ``for_feed``.
+        """
+        following = models.Value(False, output_field=models.BooleanField())
+        if user.is_authenticated:
+            following = models.Exists(Follow.objects.filter(
+                user=user, author=models.OuterRef('author')
+            ))
+        return self.annotate(
+            is_following_author=following,
+            author_post_count=Coalesce(models.Subquery(
+                ProfileStats.objects.filter(
+                    user=models.OuterRef('author')
+                ).values('posts_count')
+            ), 0),
+        )
+
+    def for_detail(self):
+        """Пост для отдельной страницы: автор и группа в том же запросе.
+
+        Комментарии листаются отдельно (``threads.root_page``).
+        """
+        return self.select_related('author', 'group')
+
 
 class Post(models.Model):
     text = models.TextField(
@@ -35,11 +99,26 @@ class Post(models.Model):
         blank=True,
         help_text='Картинка'
     )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Посты'
         verbose_name = 'Post'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date'],
+                         name='post_pub_date'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', '-pub_date'],
+                         name='post_group_pub_date'),
+        ]
 
     def __str__(self):
         # выводим текст поста
@@ -59,6 +138,11 @@ class Group(models.Model):
         max_length=500,
         verbose_name='Описание'
     )
+    post_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return self.title[:50]
@@ -83,11 +167,35 @@ class Comment(models.Model):
                             help_text='Напишите комментарий')
     created = models.DateTimeField(verbose_name='Дата публикации',
                                    auto_now_add=True,)
+    parent = models.ForeignKey('self',
+                               on_delete=models.CASCADE,
+                               related_name='replies',
+                               verbose_name='Ответ на',
+                               blank=True,
+                               null=True)
+    # Корень ветки и уровень вложенности проставляет сигнал
+    # thread_comment; у корневых комментариев thread пустой.
+    thread = models.ForeignKey('self',
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Ветка',
+                               blank=True,
+                               null=True,
+                               editable=False)
+    depth = models.PositiveSmallIntegerField(verbose_name='Уровень',
+                                             default=0,
+                                             editable=False)
 
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created'),
+            models.Index(fields=['post', 'thread', 'created'],
+                         name='comment_post_thread'),
+        ]
 
 
 class Follow(models.Model):
@@ -102,6 +210,113 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='user_author')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user'),
+        ]
 
     def __str__(self):
         return f'Пользователь:{self.user} подписан на {self.author}'
+
+
+class ProfileStatsManager(models.Manager):
+    def for_user(self, user):
+        """Счётчики пользователя; отсутствующая строка считается заново."""
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            stats, _ = self.get_or_create(
+                user=user, defaults=self.model.count_for(user)
+            )
+            return stats
+
+
+class ProfileStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Обновляются атомарно через F() в сигналах ``Post`` и ``Follow``,
+    расхождения исправляет команда ``reconcile_counters``.
+    """
+    user = models.OneToOneField(User, primary_key=True,
+                                related_name='stats',
+                                on_delete=models.CASCADE)
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Посты, написанные в гибридном режиме, ещё не разданы по лентам
+    # подписчиков (posts/timeline.py).
+    timeline_pending = models.BooleanField(default=False, editable=False)
+
+    objects = ProfileStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика профиля'
+        verbose_name_plural = 'Статистика профилей'
+
+    def __str__(self):
+        return f'Статистика {self.user_id}'
+
+    @staticmethod
+    def count_for(user):
+        return {
+            'posts_count': Post.objects.filter(author=user).count(),
+            'followers_count': Follow.objects.filter(author=user).count(),
+            'following_count': Follow.objects.filter(user=user).count(),
+        }
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост).
+
+    Заполняется при публикации поста (fan-out on write), поэтому лента
+    подписок читается одним проходом по индексу (user, -pub_date).
+    """
+    user = models.ForeignKey(User, related_name='timeline',
+                             on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries',
+                             on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='+',
+                               on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='timeline_user_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author'),
+        ]
+
+    def __str__(self):
+        return f'Лента {self.user}: пост {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    """Строка обратного индекса поиска: слово и его вес в посте.
+
+    Используется, когда база не умеет FTS5 (см. posts/search.py).
+    """
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, related_name='search_terms',
+                             on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = 'Слово поиска'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='search_term_post')
+        ]
+
+    def __str__(self):
+        return f'{self.term}: пост {self.post_id}'
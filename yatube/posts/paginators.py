@@ -0,0 +1,160 @@
+import base64
+import binascii
+import math
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(pub_date, pk):
+    """Упаковывает ключ (pub_date, id) в непрозрачный токен для URL."""
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def encode_rank_cursor(score, pk):
+    """Токен для ранжированной выдачи: ключ (score, id)."""
+    raw = f'{score!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rank_cursor(token):
+    """Распаковывает токен выдачи; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        score, pk = raw.decode().split('|')
+        score, pk = float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not math.isfinite(score):
+        return None
+    return score, pk
+
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации.
+
+    Номера страниц и общее количество не известны, поэтому наружу
+    отдаются только токены соседних страниц. Токены вычисляются сразу:
+    после этого ``object_list`` можно заменить (см. ``timeline.follow_page``).
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = None
+        self.previous_cursor = None
+        if has_next and object_list:
+            self.next_cursor = paginator.cursor_for(object_list[-1])
+        if has_previous and object_list:
+            self.previous_cursor = paginator.cursor_for(object_list[0])
+
+    def __repr__(self):
+        return '<Keyset page>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    # Номеров у курсорной страницы нет.
+    def next_page_number(self):
+        return None
+
+    def previous_page_number(self):
+        return None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Основа курсорных пагинаторов: записи не считаются."""
+    count = None
+    num_pages = None
+    page_range = range(0)
+
+
+class KeysetPaginator(CursorPaginator):
+    """Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Каждая страница - это один запрос
+    ``WHERE (pub_date, id) < (...) ORDER BY pub_date DESC, id DESC``
+    с лимитом на одну запись больше размера страницы: лишняя запись
+    говорит о наличии следующей страницы. С ``oldest_first`` порядок
+    и сравнения обратные: от старых записей к новым.
+    """
+    date_field = 'pub_date'
+
+    def __init__(self, object_list, per_page, date_field=None,
+                 oldest_first=False):
+        super().__init__(object_list, per_page)
+        if date_field is not None:
+            self.date_field = date_field
+        self.oldest_first = oldest_first
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.date_field), obj.pk)
+
+    def _seek(self, cursor, forward):
+        pub_date, pk = cursor
+        lookup = 'lt' if forward != self.oldest_first else 'gt'
+        return (
+            Q(**{f'{self.date_field}__{lookup}': pub_date})
+            | Q(**{self.date_field: pub_date, f'pk__{lookup}': pk})
+        )
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после токена ``after`` или перед ``before``.
+
+        Без токенов (или с битым токеном) отдаётся первая страница.
+        """
+        limit = self.per_page + 1
+        queryset = self.object_list
+        forward = [f'-{self.date_field}', '-pk']
+        backward = [self.date_field, 'pk']
+        if self.oldest_first:
+            forward, backward = backward, forward
+        after = decode_cursor(after)
+        before = None if after else decode_cursor(before)
+        if before:
+            rows = list(
+                queryset.filter(self._seek(before, forward=False))
+                .order_by(*backward)[:limit]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, True, has_previous)
+        if after:
+            queryset = queryset.filter(self._seek(after, forward=True))
+        rows = list(queryset.order_by(*forward)[:limit])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(rows[:self.per_page], self, has_next, bool(after))
@@ -0,0 +1,344 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Индекс один на пост: текст поста и тексты его комментариев. Выдача
+ранжирована, результаты листаются курсором по ключу (score, id), как
+ленты в ``KeysetPaginator``; меньший score - более релевантный пост.
+
+Реализации две:
+  ``FTS5Index`` - виртуальная таблица FTS5 и ранжирование bm25,
+  используется на SQLite;
+  ``TermIndex`` - обратный индекс в таблице ``SearchTerm`` и tf-idf,
+  считаемый в SQL, для баз без FTS5.
+
+Выбор задаёт ``settings.SEARCH_BACKEND``: ``'auto'``, ``'fts5'`` или
+``'terms'``. Индекс обновляется сигналами ``Post``/``Comment``: новый
+комментарий дописывается в документ поста (``add_comments``), правка
+поста или удаление комментария индексируют пост заново. Первичное
+заполнение - команда ``rebuild_search_index``.
+
+Запросы и документы обеих реализаций проходят одну свёртку ``fold``
+(ё → е).
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (Case, ExpressionWrapper, F, FloatField,
+                              IntegerField, Max, Q, Sum, Value, When)
+
+from . import caching
+from .models import Comment, Post, SearchTerm
+from .paginators import (CursorPaginator, KeysetPage, decode_rank_cursor,
+                         encode_rank_cursor)
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+TEXT_WEIGHT = 2
+COMMENT_WEIGHT = 1
+BATCH_SIZE = 500
+# Число постов в TermIndex для idf меняется медленно: оно кешируется.
+DOCUMENTS_KEY = 'search:documents'
+DOCUMENTS_TIMEOUT = 60 * 10
+
+
+def fold(text):
+    """Свёртка, общая для запросов и индекса: ё → е."""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def fold_sql(expression):
+    """``fold`` для выражения SQL."""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре."""
+    return [
+        token for token in TOKEN_RE.findall(fold(text.lower()))
+        if len(token) <= SearchTerm._meta.get_field('term').max_length
+    ]
+
+
+def query_terms(query):
+    """Уникальные слова запроса в исходном порядке, не больше MAX_TERMS."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+
+
+class FTS5Index:
+    """Индекс в виртуальной таблице FTS5 (rowid - id поста)."""
+    table = 'posts_search'
+
+    def __init__(self):
+        self.posts = Post._meta.db_table
+        self.comments = Comment._meta.db_table
+
+    def _document_sql(self, where=''):
+        comments = fold_sql('c.text')
+        return (
+            f'INSERT INTO {self.table} (rowid, text, comments) '
+            f"SELECT p.id, {fold_sql('p.text')}, COALESCE(("
+            f"  SELECT group_concat({comments}, ' ') FROM {self.comments} c"
+            f'  WHERE c.post_id = p.id'
+            f"), '') FROM {self.posts} p {where}"
+        )
+
+    # Удаление и вставка - одна транзакция: иначе параллельные
+    # комментарии к посту вставят документ дважды.
+    @transaction.atomic
+    def index_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post_id]
+            )
+            cursor.execute(self._document_sql('WHERE p.id = %s'), [post_id])
+
+    def add_comments(self, post_id, texts):
+        """Дописывает новые комментарии в документ поста."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET comments = comments || ' ' || %s "
+                f'WHERE rowid = %s',
+                [fold(' '.join(texts)), post_id],
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post_id]
+            )
+
+    @transaction.atomic
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(self._document_sql())
+            return cursor.rowcount
+
+    def ranked(self, terms, seek=None, reverse=False, limit=10):
+        # Каждое слово в кавычках: пользовательский ввод не становится
+        # синтаксисом FTS5. Последнее слово ищется по префиксу.
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        sql = (
+            f'SELECT score, id FROM ('
+            f'  SELECT bm25({self.table}, %s, %s) AS score, rowid AS id'
+            f'  FROM {self.table} WHERE {self.table} MATCH %s'
+            f')'
+        )
+        params = [TEXT_WEIGHT, COMMENT_WEIGHT, match]
+        if seek is not None:
+            sign = '<' if reverse else '>'
+            sql += f' WHERE score {sign} %s OR (score = %s AND id {sign} %s)'
+            params += [seek[0], seek[0], seek[1]]
+        order = 'DESC' if reverse else 'ASC'
+        sql += f' ORDER BY score {order}, id {order} LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+class TermIndex:
+    """Обратный индекс в таблице SearchTerm: слово, пост, вес."""
+
+    def _terms(self, text, comments):
+        weights = Counter()
+        for token in tokenize(text):
+            weights[token] += TEXT_WEIGHT
+        for comment in comments:
+            for token in tokenize(comment):
+                weights[token] += COMMENT_WEIGHT
+        return weights
+
+    def _entries(self, post_id, text, comments):
+        return [
+            SearchTerm(term=term, post_id=post_id, weight=weight)
+            for term, weight in self._terms(text, comments).items()
+        ]
+
+    @transaction.atomic
+    def index_post(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        text = Post.objects.filter(pk=post_id).values_list(
+            'text', flat=True
+        ).first()
+        if text is None:
+            return
+        comments = Comment.objects.filter(post_id=post_id).values_list(
+            'text', flat=True
+        )
+        SearchTerm.objects.bulk_create(
+            self._entries(post_id, text, comments), batch_size=BATCH_SIZE
+        )
+
+    @transaction.atomic
+    def add_comments(self, post_id, texts):
+        """Добавляет веса слов новых комментариев к словам поста."""
+        weights = self._terms('', texts)
+        # Сначала строки с нулевым весом, затем прибавка через F():
+        # параллельные комментарии не теряют веса друг друга.
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term, post_id=post_id, weight=0)
+             for term in weights],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        by_weight = {}
+        for term, weight in weights.items():
+            by_weight.setdefault(weight, []).append(term)
+        for weight, terms in by_weight.items():
+            SearchTerm.objects.filter(
+                post_id=post_id, term__in=terms
+            ).update(weight=F('weight') + weight)
+
+    def remove_post(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        caching.get_cache().delete(DOCUMENTS_KEY)
+        SearchTerm.objects.all().delete()
+        comments = {}
+        for post_id, text in Comment.objects.values_list('post_id', 'text'):
+            comments.setdefault(post_id, []).append(text)
+        entries, indexed = [], 0
+        for post_id, text in Post.objects.values_list('pk', 'text').iterator():
+            entries += self._entries(post_id, text, comments.get(post_id, ()))
+            indexed += 1
+            if len(entries) >= BATCH_SIZE:
+                SearchTerm.objects.bulk_create(entries)
+                entries = []
+        SearchTerm.objects.bulk_create(entries)
+        return indexed
+
+    def _lookup(self, term, prefix):
+        if prefix:
+            return Q(term__startswith=term)
+        return Q(term=term)
+
+    def _documents(self):
+        cache = caching.get_cache()
+        total = cache.get(DOCUMENTS_KEY)
+        if total is None:
+            total = SearchTerm.objects.values('post').distinct().count()
+            cache.set(DOCUMENTS_KEY, total, DOCUMENTS_TIMEOUT)
+        return total or 1
+
+    def _found(self, lookup, prefix):
+        """Число постов со словом (document frequency)."""
+        found = SearchTerm.objects.filter(lookup)
+        if prefix:
+            # По префиксу в одном посте совпадают разные слова.
+            found = found.values('post').distinct()
+        # Точное слово встречается в посте не больше одного раза
+        # (term, post уникальны): счёт идёт по индексу без DISTINCT.
+        return found.count()
+
+    def ranked(self, terms, seek=None, reverse=False, limit=10):
+        lookups = [
+            self._lookup(term, prefix=number == len(terms) - 1)
+            for number, term in enumerate(terms)
+        ]
+        total = self._documents()
+        # Вес слова - tf-idf; знак минус, чтобы лучший пост был первым,
+        # как у bm25 в FTS5.
+        score = Value(0.0, output_field=FloatField())
+        matched = {}
+        for number, lookup in enumerate(lookups):
+            found = self._found(lookup, prefix=number == len(terms) - 1)
+            if not found:
+                return []
+            idf = math.log(1 + total / found)
+            score = score - Sum(
+                Case(When(lookup, then=ExpressionWrapper(
+                    F('weight') * idf, output_field=FloatField()
+                )), default=0.0, output_field=FloatField())
+            )
+            matched[f'has_{number}'] = Max(
+                Case(When(lookup, then=1), default=0,
+                     output_field=IntegerField())
+            )
+        rows = (
+            SearchTerm.objects.filter(Q(*lookups, _connector=Q.OR))
+            .values('post')
+            .annotate(score=score, **matched)
+            .filter(**{name: 1 for name in matched})
+        )
+        if seek is not None:
+            lookup = 'lt' if reverse else 'gt'
+            rows = rows.filter(
+                Q(**{f'score__{lookup}': seek[0]})
+                | Q(score=seek[0], **{f'post_id__{lookup}': seek[1]})
+            )
+        # post_id, а не post: иначе сортировка по Post.Meta.ordering
+        # добавит join с постами.
+        order = ('-score', '-post_id') if reverse else ('score', 'post_id')
+        return [
+            (row['score'], row['post'])
+            for row in rows.order_by(*order)[:limit]
+        ]
+
+
+_fts_available = {}
+
+
+def fts5_available():
+    """Есть ли в базе таблица FTS5 (её создаёт миграция на SQLite)."""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_available:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = %s", [FTS5Index.table]
+            )
+            _fts_available[connection.alias] = cursor.fetchone() is not None
+    return _fts_available[connection.alias]
+
+
+def get_index():
+    backend = settings.SEARCH_BACKEND
+    if backend == 'fts5' or (backend == 'auto' and fts5_available()):
+        return FTS5Index()
+    return TermIndex()
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация ранжированной выдачи по ключу (score, id)."""
+
+    def __init__(self, query, per_page, queryset=None):
+        super().__init__([], per_page)
+        self.terms = query_terms(query)
+        if queryset is None:
+            queryset = Post.objects.for_feed()
+        self.queryset = queryset
+
+    def cursor_for(self, post):
+        return encode_rank_cursor(post.search_score, post.pk)
+
+    def get_page(self, after=None, before=None):
+        if not self.terms:
+            return KeysetPage([], self, False, False)
+        index = get_index()
+        limit = self.per_page + 1
+        after = decode_rank_cursor(after)
+        before = None if after else decode_rank_cursor(before)
+        if before:
+            rows = index.ranked(self.terms, before, reverse=True, limit=limit)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(self._posts(rows), self, True, has_previous)
+        rows = index.ranked(self.terms, after, limit=limit)
+        has_next = len(rows) > self.per_page
+        return KeysetPage(self._posts(rows[:self.per_page]), self,
+                          has_next, bool(after))
+
+    def _posts(self, rows):
+        posts = self.queryset.in_bulk([pk for _, pk in rows])
+        page = []
+        for score, pk in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.search_score = score
+                page.append(post)
+        return page
@@ -0,0 +1,159 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, follow_graph, search, threads, timeline
+from .models import Comment, Follow, Group, Post, User
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    # При смене группы меняются счётчик и лента прежней группы.
+    instance._previous_group_id = None
+    if instance.pk and not raw:
+        instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_profile(instance.author_id, posts_count=1)
+        counters.change_group(instance.group_id, 1)
+    elif instance._previous_group_id != instance.group_id:
+        counters.change_group(instance._previous_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_profile(instance.author_id, posts_count=-1)
+    counters.change_group(instance.group_id, -1)
+
+
+@receiver(pre_save, sender=Comment)
+def thread_comment(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.pk:
+        threads.place_reply(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not follow_graph.in_batch():
+        counters.change_profile(instance.user_id, following_count=1)
+        counters.change_profile(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    if follow_graph.in_batch():
+        return
+    counters.change_profile(instance.user_id, following_count=-1)
+    counters.change_profile(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not follow_graph.in_batch():
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    if follow_graph.in_batch():
+        return
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.cool_down(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_index().index_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_index().remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, raw=False, **kwargs):
+    if raw or instance.post_id is None:
+        return
+    if created:
+        search.get_index().add_comments(instance.post_id, [instance.text])
+    else:
+        # Прежний текст комментария уже в документе поста.
+        search.get_index().index_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    if instance.post_id is not None:
+        search.get_index().index_post(instance.post_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, created=True, **kwargs):
+    # Новый и удалённый пост меняют число постов автора.
+    caching.bump(*caching.feeds_of_post(instance, author_groups=created))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_post(sender, instance, **kwargs):
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, **kwargs):
+    if follow_graph.in_batch():
+        return
+    # Профили обоих показывают счётчики подписок. При удалении
+    # через QuerySet.delete() связи не загружены: имена берутся
+    # одним запросом, а не двумя ленивыми.
+    usernames = [
+        getattr(instance, name).username for name in ('user', 'author')
+        if Follow._meta.get_field(name).is_cached(instance)
+    ]
+    missing = [
+        getattr(instance, f'{name}_id') for name in ('user', 'author')
+        if not Follow._meta.get_field(name).is_cached(instance)
+    ]
+    if missing:
+        usernames += User.objects.filter(
+            pk__in=missing
+        ).values_list('username', flat=True)
+    caching.bump(
+        f'follow:{instance.user_id}',
+        f'followers:{instance.author_id}',
+        *(f'author:{username}' for username in usernames),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feed(sender, instance, **kwargs):
+    caching.bump(f'group:{instance.slug}')
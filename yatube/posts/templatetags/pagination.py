@@ -0,0 +1,28 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.simple_tag
+def page_links(page):
+    """Ссылки на номера всех страниц, текущая - без ссылки.
+
+    Тот же HTML, что цикл ``{% for %}`` по ``page_range``, но номер
+    не проходит через поиск переменной и ``localize``: на ленте
+    в сотни страниц это тысячи вызовов Python на запрос.
+    """
+    links = []
+    for number in page.paginator.page_range:
+        if number == page.number:
+            links.append(
+                '<li class="page-item active">'
+                f'<span class="page-link">{number}</span></li>'
+            )
+        else:
+            links.append(
+                '<li class="page-item">'
+                f'<a class="page-link" href="?page={number}">{number}</a>'
+                '</li>'
+            )
+    return mark_safe('\n'.join(links))
@@ -0,0 +1,15 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, kind):
+    """Готовая миниатюра картинки поста или заглушка.
+
+    В отличие от {% thumbnail %} из sorl никогда не обрабатывает
+    картинку в запросе: миниатюры строятся фоново (posts/thumbnails.py).
+    """
+    return thumbnails.rendition(image, kind)
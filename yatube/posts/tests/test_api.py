@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(12)
+        ])
+        cls.post = Post.objects.create(text='Последний', author=cls.author,
+                                       group=cls.group)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_feeds(self):
+        """Все ленты отдают JSON с постами и курсором."""
+        urls = {
+            reverse('posts:api_index'): self.client,
+            reverse('posts:api_group_list', args=['group']): self.client,
+            reverse('posts:api_profile', args=['Author']): self.client,
+            reverse('posts:api_follow_index'): self.authorized_client,
+        }
+        for url, client in urls.items():
+            with self.subTest(url=url):
+                data = client.get(url).json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(data['results'][0]['group'], 'group')
+                self.assertNotIn('image', data['results'][0])
+                self.assertNotIn('comment_count', data['results'][0])
+                data = client.get(url, {'after': data['next']}).json()
+                self.assertEqual(len(data['results']), 3)
+                self.assertIsNone(data['next'])
+
+    def test_post_detail(self):
+        """Пост отдаётся вместе с комментариями."""
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        data = self.client.get(
+            reverse('posts:api_post_detail', args=[self.post.pk])
+        ).json()
+        self.assertEqual(data['text'], 'Последний')
+        self.assertEqual(data['comment_count'], 1)
+        self.assertEqual(data['comments'][0]['author'], 'Name')
+
+    def test_comments(self):
+        """Комментарии листаются курсором, ответы вложены в ветку."""
+        root = Comment.objects.create(post=self.post, author=self.user,
+                                      text='Корень')
+        reply = Comment.objects.create(post=self.post, author=self.author,
+                                       text='Ответ', parent=root)
+        data = self.client.get(
+            reverse('posts:api_post_detail', args=[self.post.pk])
+        ).json()
+        self.assertIsNone(data['comments_next'])
+        self.assertEqual(data['comments'][0]['replies'][0]['id'], reply.pk)
+        data = self.client.get(
+            reverse('posts:api_comment_thread',
+                    args=[self.post.pk, root.pk])
+        ).json()
+        self.assertEqual([comment['id'] for comment in data['results']],
+                         [reply.pk])
+        response = self.client.get(
+            reverse('posts:api_comment_thread',
+                    args=[self.post.pk, reply.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_requires_login(self):
+        """Лента подписок без авторизации - 401, а не редирект."""
+        response = self.client.get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304 без выборки постов."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.text = 'Исправленный'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_comment_changes_post_etag(self):
+        """Новый комментарий меняет ETag поста."""
+        url = reverse('posts:api_post_detail', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_counts(self):
+        """Число запросов не зависит от длины ленты."""
+        urls = {
+            reverse('posts:api_index'): 1,
+            reverse('posts:api_group_list', args=['group']): 2,
+            reverse('posts:api_profile', args=['Author']): 3,
+            reverse('posts:api_post_detail', args=[self.post.pk]): 2,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import caching, cards
+from ..models import Group, Post, User
+
+
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name',
+                                            first_name='Имя')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        caching.stats.clear()
+        self.client = Client()
+
+    def page_card(self, url):
+        """Карточка поста со страницы ленты."""
+        response = self.client.get(url)
+        for post in response.context['page_obj']:
+            if post.pk == self.post.pk:
+                return post.card
+        self.fail(f'Пост не найден на {url}')
+
+    def test_card_shared_between_feeds(self):
+        """Карточка рендерится один раз и переиспользуется всеми лентами."""
+        urls = [
+            reverse('posts:home'),
+            reverse('posts:group_list', args=['group']),
+            reverse('posts:profile', args=['Name']),
+        ]
+        card = self.page_card(urls[0])
+        self.assertIn('Текст поста', card)
+        for url in urls[1:]:
+            with self.subTest(url=url):
+                self.assertEqual(self.page_card(url), card)
+        self.assertEqual(caching.stats['card_misses'], 1)
+        self.assertEqual(caching.stats['card_hits'], 2)
+
+    def test_new_post_renders_only_its_card(self):
+        """Новый пост сменяет поколение ленты, но не старые карточки."""
+        self.client.get(reverse('posts:home'))
+        Post.objects.create(text='Новый пост', author=self.user)
+        self.client.get(reverse('posts:home'))
+        self.assertEqual(caching.stats['card_misses'], 2)
+        self.assertEqual(caching.stats['card_hits'], 1)
+
+    def test_version_changes(self):
+        """Правка, смена группы, её названия и имени дают новую карточку."""
+        url = reverse('posts:home')
+        key = cards.card_key(Post.objects.for_feed().get(pk=self.post.pk))
+        other = Group.objects.create(title='Другая', slug='other')
+        changes = [
+            ('text', lambda: Post.objects.filter(pk=self.post.pk).update(
+                text='Исправленный текст')),
+            ('group', lambda: Post.objects.filter(pk=self.post.pk).update(
+                group=other)),
+            ('group title', lambda: Group.objects.filter(pk=other.pk).update(
+                title='Переименованная')),
+            ('author', lambda: User.objects.filter(pk=self.user.pk).update(
+                first_name='Новое')),
+        ]
+        for name, change in changes:
+            with self.subTest(change=name):
+                change()
+                post = Post.objects.for_feed().get(pk=self.post.pk)
+                new_key = cards.card_key(post)
+                self.assertNotEqual(new_key, key)
+                key = new_key
+        caching.bump('global')
+        card = self.page_card(url)
+        self.assertIn('Исправленный текст', card)
+        self.assertIn('other', card)
+        self.assertIn('все записи группы - Переименованная', card)
+        self.assertIn('Новое', card)
+
+    def test_card_keeps_line_breaks(self):
+        """Строки текста поста на карточке не сливаются в одну."""
+        Post.objects.filter(pk=self.post.pk).update(text='Первая\nВторая')
+        card = self.page_card(reverse('posts:profile', args=['Name']))
+        self.assertIn('Первая<br>Вторая', card)
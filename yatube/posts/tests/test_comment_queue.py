@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import comment_queue
+from ..models import Comment, Post, User
+
+
+class CommentQueueTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(text='Текст', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.queue = comment_queue.CommentQueue(self.directory, 100, 1)
+
+    def comment(self, text, post=None, parent=None):
+        return Comment(post=post or self.post, author=self.user, text=text,
+                       parent=parent)
+
+    def journal(self):
+        with open(self.queue.path) as journal:
+            return [json.loads(line) for line in journal]
+
+    def test_flush_writes_batch(self):
+        """Пачка пишется с ответами, счётчиком и без удалённых постов."""
+        root = Comment.objects.create(post=self.post, author=self.user,
+                                      text='Корень')
+        gone = Post.objects.create(text='Удалён', author=self.user)
+        first = self.comment('Первый')
+        self.queue.submit(first)
+        self.queue.submit(self.comment('Ответ', parent=root))
+        self.queue.submit(self.comment('В пустоту', post=gone))
+        gone.delete()
+        self.assertEqual(len(self.journal()), 3)
+        self.assertFalse(Comment.objects.filter(text='Первый').exists())
+        with self.assertNumQueries(8):
+            self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(Comment.objects.get(text='Ответ').thread, root)
+        self.assertEqual(Comment.objects.get(text='Первый').created,
+                         first.created)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_replay_stale_journal(self):
+        """Журнал остановленного процесса проигрывается без повторов."""
+        stored = Comment.objects.create(post=self.post, author=self.user,
+                                        text='Уже в базе')
+        lost = self.comment('Из журнала')
+        lost.created = timezone.now()
+        path = os.path.join(self.directory, 'comments-1.jsonl')
+        with open(path, 'w') as journal:
+            for comment in (stored, lost):
+                journal.write(
+                    json.dumps(comment_queue.to_record(comment)) + '\n'
+                )
+        self.assertEqual(comment_queue.replay_stale(self.directory), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(self.queue.path))
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 2)
+
+    def test_queue_per_process(self):
+        """Очередь создаётся при первом обращении, в форке - своя."""
+        queues = []
+        directory = os.path.join(self.directory, 'journal')
+
+        def start(queue):
+            queues.append(queue)
+
+        with override_settings(COMMENT_JOURNAL_DIR=directory), \
+                mock.patch.object(comment_queue, '_queue', None), \
+                mock.patch.object(comment_queue.CommentQueue, 'start',
+                                  start), \
+                mock.patch('atexit.register'):
+            first = comment_queue.get_queue()
+            self.assertIs(comment_queue.get_queue(), first)
+            with mock.patch('os.getpid', return_value=first.pid + 1):
+                forked = comment_queue.get_queue()
+        self.assertIsNot(forked, first)
+        self.assertEqual(queues, [first, forked])
+        for queue in queues:
+            queue._journal.close()
+
+    def test_add_comment_write_behind(self):
+        """В режиме очереди запрос не пишет комментарий в базу."""
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        client.get(url)
+        with override_settings(COMMENT_WRITE_BEHIND=True), \
+                mock.patch.object(comment_queue, '_queue', self.queue):
+            client.post(reverse('posts:add_comment', args=[self.post.pk]),
+                        {'text': 'Из очереди'})
+        self.assertNotContains(client.get(url), 'Из очереди')
+        self.queue.flush()
+        self.assertContains(client.get(url), 'Из очереди')
+
+
+class CommentQueueThreadTest(TransactionTestCase):
+    def test_background_flush(self):
+        """Поток пишет очередь по таймеру и остаток при закрытии."""
+        user = User.objects.create_user(username='Reader')
+        post = Post.objects.create(text='Текст', author=user)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        queue = comment_queue.CommentQueue(directory, 100, 0.01)
+        queue.start()
+        queue.submit(Comment(post=post, author=user, text='Первый'))
+        deadline = time.monotonic() + 5
+        while len(queue) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(Comment.objects.filter(text='Первый').exists())
+        queue.submit(Comment(post=post, author=user, text='Последний'))
+        queue.close()
+        self.assertTrue(Comment.objects.filter(text='Последний').exists())
+        self.assertFalse(os.path.exists(queue.path))
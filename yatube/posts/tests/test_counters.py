@@ -0,0 +1,87 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post, ProfileStats, User
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.group_2 = Group.objects.create(title='Группа 2', slug='group-2')
+
+    def stats(self, user):
+        return ProfileStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Создание и удаление постов и комментариев меняют счётчики."""
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   group=self.group)
+        Comment.objects.create(post=post, author=self.user, text='Первый')
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='Второй')
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        post.group = self.group_2
+        post.save()
+        self.group.refresh_from_db()
+        self.group_2.refresh_from_db()
+        self.assertEqual((self.group.post_count, self.group_2.post_count),
+                         (0, 1))
+        post.delete()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.group_2.post_count, 0)
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обеих сторон."""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.user).following_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+
+    def test_counters_never_go_negative(self):
+        """Удаление записей, созданных через bulk_create, не ломает счётчик."""
+        Post.objects.bulk_create([
+            Post(text='Текст', author=self.author, group=self.group)
+        ])
+        Post.objects.filter(author=self.author).delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        """Команда пересчитывает счётчики после bulk-операций."""
+        Post.objects.bulk_create([
+            Post(text=f'Текст {i}', author=self.author, group=self.group)
+            for i in range(3)
+        ])
+        post = Post.objects.first()
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.user, text='Комментарий')
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=self.user, author=self.author)
+        ])
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.group.post_count, 3)
+        author_stats = self.stats(self.author)
+        self.assertEqual(
+            (author_stats.posts_count, author_stats.followers_count), (3, 1)
+        )
+        self.assertEqual(self.stats(self.user).following_count, 1)
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import follow_graph
+from ..models import Follow, Post, ProfileStats, TimelineEntry, User
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.authors = [User.objects.create_user(username=f'Author{i}')
+                       for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self, user):
+        return ProfileStats.objects.for_user(user)
+
+    def test_id_set(self):
+        """Набор id хранится отсортированным массивом."""
+        ids = follow_graph.IdSet([5, 1, 3, 3])
+        self.assertEqual(list(ids), [1, 3, 5])
+        restored = follow_graph.IdSet.frombytes(ids.tobytes())
+        self.assertIn(3, restored)
+        self.assertNotIn(4, restored)
+        self.assertEqual(restored.intersection([1, 2, 5]), {1, 5})
+
+    def test_lookups_are_cached_and_invalidated(self):
+        """Повторная проверка без запросов, подписка видна сразу."""
+        author = self.authors[0]
+        self.assertFalse(follow_graph.is_following(self.user.pk, author.pk))
+        with self.assertNumQueries(0):
+            follow_graph.is_following(self.user.pk, author.pk)
+        Follow.objects.create(user=self.user, author=author)
+        self.assertTrue(follow_graph.is_following(self.user.pk, author.pk))
+        self.assertIn(self.user.pk, follow_graph.followers(author.pk))
+        ids = [a.pk for a in self.authors]
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                follow_graph.followed_among(self.user.pk, ids), {author.pk}
+            )
+
+    def test_batch_follow_and_unfollow(self):
+        """Пачка подписок меняет базу, счётчики, ленты и кеш вместе."""
+        post = Post.objects.create(text='Текст', author=self.authors[0])
+        ids = [a.pk for a in self.authors]
+        follow_graph.following(self.user.pk)
+        created = follow_graph.follow(self.user, ids + [self.user.pk, 0])
+        self.assertEqual(created, 3)
+        self.assertEqual(follow_graph.follow(self.user, ids), 0)
+        self.assertEqual(set(follow_graph.following(self.user.pk)),
+                         set(ids))
+        self.assertEqual(self.stats(self.user).following_count, 3)
+        self.assertEqual(self.stats(self.authors[0]).followers_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.assertEqual(follow_graph.unfollow(self.user, ids[:2]), 2)
+        self.assertEqual(list(follow_graph.following(self.user.pk)),
+                         ids[2:])
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.assertEqual(self.stats(self.authors[0]).followers_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user).exists())
+
+    def test_concurrent_follow_is_counted_once(self):
+        """Подписка, вставленная параллельно, не считается второй раз."""
+        author = self.authors[0]
+        create = follow_graph._create
+
+        def racing_create(user, author_ids):
+            # Другой запрос подписался между выборкой и вставкой.
+            with mock.patch.object(follow_graph, '_create', create):
+                follow_graph.follow(user, [author.pk])
+            return create(user, author_ids)
+
+        ids = [a.pk for a in self.authors]
+        with mock.patch.object(follow_graph, '_create', racing_create):
+            self.assertEqual(follow_graph.follow(self.user, ids), 2)
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.stats(self.user).following_count, 3)
+        self.assertEqual(self.stats(author).followers_count, 1)
+
+    def test_profile_shows_follow_state(self):
+        """Кнопка профиля читает граф и меняется после подписки."""
+        client = Client()
+        client.force_login(self.user)
+        username = self.authors[0].username
+        url = reverse('posts:profile', args=[username])
+        client.get(reverse('posts:profile_follow', args=[username]))
+        response = client.get(url)
+        self.assertTrue(response.context['following'])
+        client.get(reverse('posts:profile_unfollow', args=[username]))
+        response = client.get(url)
+        self.assertFalse(response.context['following'])
+
+    def test_export_import_command(self):
+        """Выгрузка и загрузка подписок восстанавливают граф."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'follows.csv')
+        follow_graph.follow(self.user, [a.pk for a in self.authors[:2]])
+        follow_graph.follow(self.authors[2], [self.user.pk])
+        edges = list(follow_graph.export_edges())
+        call_command('follow_graph', 'export', path, stderr=StringIO())
+        follow_graph.unfollow(self.user, [a.pk for a in self.authors])
+        follow_graph.unfollow(self.authors[2], [self.user.pk])
+        self.assertFalse(Follow.objects.exists())
+        call_command('follow_graph', 'import', path, stdout=StringIO())
+        self.assertEqual(list(follow_graph.export_edges()), edges)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertIn(self.user.pk,
+                      follow_graph.followers(self.authors[0].pk))
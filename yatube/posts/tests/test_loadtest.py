@@ -0,0 +1,59 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase, TransactionTestCase
+
+from .. import datagen
+from ..models import Comment, Follow, Group, Post, ProfileStats, User
+
+
+class DataGeneratorTest(TestCase):
+    def test_generate_data(self):
+        """Генератор пишет заданный объём и пересобирает счётчики."""
+        call_command('generate_data', users=30, groups=5, posts=300,
+                     comments=200, follows=5, batch_size=100,
+                     stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        author = Post.objects.values('author').annotate(
+            total=Count('pk')
+        ).order_by('-total').first()
+        self.assertEqual(
+            ProfileStats.objects.get(user=author['author']).posts_count,
+            author['total'],
+        )
+        self.assertTrue(User.objects.first().check_password(
+            datagen.PASSWORD
+        ))
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(dates)), 290)
+
+    def test_popularity_is_skewed(self):
+        """Самый популярный автор пишет заметно больше среднего."""
+        generator = datagen.Generator(seed=1, batch_size=500)
+        users = generator.users(50)
+        generator.posts(1000, users, [])
+        top = Post.objects.values('author').annotate(
+            total=Count('pk')
+        ).order_by('-total').first()['total']
+        self.assertGreater(top, 1000 / 50 * 5)
+        self.assertFalse(Post.objects.exclude(group=None).exists())
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    def test_all_urls_without_errors(self):
+        """Все адреса posts/urls.py отвечают без ошибок сервера."""
+        call_command('generate_data', users=10, groups=3, posts=100,
+                     comments=50, follows=3, stdout=StringIO())
+        out = StringIO()
+        call_command('loadtest', clients=1, requests=150, stdout=out)
+        report = out.getvalue()
+        total = next(line for line in report.splitlines()
+                     if line.startswith('всего'))
+        self.assertEqual(total.split()[1:3], ['150', '0'])
+        self.assertIn('post_detail', report)
@@ -0,0 +1,144 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core import querylog
+
+from ..models import Comment, Follow, Group, Post, User
+
+# SQLite помечает полный проход по таблице как «SCAN [TABLE] <имя>»
+# без «USING INDEX»: такой план для таблиц постов считаем ошибкой.
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>posts_\w+)( AS \w+)?$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Разбор планов SQLite')
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Name')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            text='Текст', author=cls.author, group=cls.group)
+        Post.objects.bulk_create([
+            Post(text=f'Текст {i}', author=cls.user, group=cls.group)
+            for i in range(15)
+        ])
+        Comment.objects.create(post=cls.post, author=cls.user, text='Ответ')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def capture(self, url):
+        queries = []
+
+        def wrapper(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            self.authorized_client.get(url)
+        return [(sql, params) for sql, params in queries
+                if sql.lstrip().upper().startswith('SELECT')]
+
+    def full_scans(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [line for line in plan if FULL_SCAN.match(line)], plan
+
+    def assert_no_full_scans(self, sql, params):
+        scans, plan = self.full_scans(sql, params)
+        self.assertEqual(
+            scans, [], f'Полный проход таблицы:\n{sql}\n' + '\n'.join(plan)
+        )
+
+    def test_views_use_indexes(self):
+        """Запросы лент и страницы поста не сканируют таблицы целиком."""
+        urls = [
+            reverse('posts:home'),
+            reverse('posts:home') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'Author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            for sql, params in self.capture(url):
+                with self.subTest(url=url, sql=sql):
+                    self.assert_no_full_scans(sql, params)
+
+    def test_comments_use_index(self):
+        """Комментарии поста читаются по индексу (post, -created)."""
+        sql, params = self.post.comments.all().query.sql_with_params()
+        self.assert_no_full_scans(sql, params)
+        scans, plan = self.full_scans(sql, params)
+        self.assertTrue(
+            any('comment_post_created' in line for line in plan), plan)
+
+
+class NPlusOneTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Name')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        # Картинки только по имени: миниатюры ищутся без чтения файла.
+        Post.objects.bulk_create([
+            Post(text=f'Текст {i}', author=cls.author, group=cls.group,
+                 image=f'posts/{i}.gif')
+            for i in range(12)
+        ])
+        cls.post = Post.objects.first()
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=user, text=f'Ответ {i}')
+            for i in range(3) for user in (cls.user, cls.author)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_posts_views_have_no_n_plus_one(self):
+        """Ни один адрес posts/urls.py не повторяет запрос на каждый пост."""
+        post = {'post_id': self.post.pk}
+        author = {'username': 'Author'}
+        urls = [
+            reverse('posts:home'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs=author),
+            reverse('posts:post_detail', kwargs=post),
+            reverse('posts:search') + '?q=Текст',
+            reverse('posts:create'),
+            reverse('posts:post_edit', kwargs=post),
+            reverse('posts:follow_index'),
+            reverse('posts:profile_unfollow', kwargs=author),
+            reverse('posts:profile_follow', kwargs=author),
+            reverse('posts:api_index'),
+            reverse('posts:api_post_detail', kwargs=post),
+            reverse('posts:api_group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:api_profile', kwargs=author),
+            reverse('posts:api_follow_index'),
+            reverse('posts:api_search') + '?q=Текст',
+        ]
+        with querylog.detecting() as found:
+            for url in urls:
+                self.assertLess(self.client.get(url).status_code, 400, url)
+            self.client.post(reverse('posts:add_comment', kwargs=post),
+                             {'text': 'Ещё'})
+        self.assertEqual(
+            [item for item in found if isinstance(item, querylog.NPlusOne)],
+            [],
+        )
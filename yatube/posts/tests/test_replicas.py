@@ -0,0 +1,81 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.db import replicas
+
+from .. import caching
+from ..models import Group, Post, User
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaReadsTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Name')
+        group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='С основной базы',
+                                        author=self.user, group=group)
+        self.sync_replica()
+        # Другой текст на реплике показывает, откуда читала страница.
+        Post.objects.using('replica').filter(pk=self.post.pk).update(
+            text='С реплики'
+        )
+        cache.clear()
+
+    def sync_replica(self):
+        """Копирует основную базу в реплику, как это делает репликация."""
+        for alias in ('default', 'replica'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(
+            connections['replica'].connection
+        )
+
+    def test_feeds_read_from_replica(self):
+        for url in (
+            reverse('posts:home'),
+            reverse('posts:profile', args=['Name']),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'С реплики')
+
+    def test_writer_reads_primary(self):
+        """После записи сессия пользователя читает основную базу."""
+        client = Client()
+        client.force_login(self.user)
+        client.post(reverse('posts:add_comment', args=[self.post.pk]),
+                    {'text': 'Комментарий'})
+        self.assertGreater(client.session[replicas.PIN_SESSION_KEY],
+                           time.time())
+        with mock.patch.object(caching, 'recently_changed',
+                               return_value=False):
+            response = client.get(reverse('posts:home'))
+        self.assertContains(response, 'С основной базы')
+
+    def test_changed_feed_reads_primary(self):
+        """Свежеизменённая лента не кешируется со старыми данными реплики."""
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('posts:home')),
+                            'Исправленный текст')
+
+    def test_writes_go_to_primary(self):
+        client = Client()
+        client.force_login(self.user)
+        client.post(reverse('posts:create'), {'text': 'Новый пост'})
+        self.assertTrue(Post.objects.filter(text='Новый пост').exists())
+        self.assertFalse(
+            Post.objects.using('replica').filter(text='Новый пост').exists()
+        )
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_primary(self):
+        self.assertContains(self.client.get(reverse('posts:home')),
+                            'С основной базы')
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import search
+from ..models import Comment, Group, Post, SearchTerm, User
+
+
+class SearchTestMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.cats = Post.objects.create(
+            text='Кошки спят. Кошки едят. Кошки гуляют.',
+            author=cls.user, group=cls.group,
+        )
+        cls.cat_and_dog = Post.objects.create(
+            text='Кошки и собаки живут дружно', author=cls.user,
+        )
+        cls.dogs = Post.objects.create(text='Собаки лают', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query, **params):
+        response = Client().get(reverse('posts:search'), {'q': query,
+                                                          **params})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_ranked_results(self):
+        """Частое слово в тексте поднимает пост выше."""
+        self.assertEqual(self.found('кошки'),
+                         [self.cats.pk, self.cat_and_dog.pk])
+        self.assertEqual(self.found('КОШКИ собаки'), [self.cat_and_dog.pk])
+        self.assertEqual(set(self.found('соба')),
+                         {self.dogs.pk, self.cat_and_dog.pk})
+        self.assertEqual(self.found('"*)('), [])
+
+    def test_index_follows_signals(self):
+        """Правка поста и комментарии сразу попадают в индекс."""
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text='А ещё попугаи')
+        self.assertEqual(self.found('попугаи'), [self.dogs.pk])
+        self.dogs.text = 'Хомяки'
+        self.dogs.save()
+        self.assertEqual(self.found('лают'), [])
+        self.assertEqual(self.found('хомяки'), [self.dogs.pk])
+        self.dogs.comments.all().delete()
+        self.assertEqual(self.found('попугаи'), [])
+
+    def test_yo_folded_in_queries_and_documents(self):
+        """ё и е не различаются ни в запросе, ни в тексте."""
+        tree = Post.objects.create(text='Новогодняя ёлка', author=self.user)
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text='Ёжик')
+        self.assertEqual(self.found('ёлка'), [tree.pk])
+        self.assertEqual(self.found('елка'), [tree.pk])
+        self.assertEqual(self.found('ежик'), [self.dogs.pk])
+
+    def test_comment_appended_to_document(self):
+        """Новый комментарий индексируется без чтения остальных."""
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text='А ещё попугаи')
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(post=self.dogs, author=self.user,
+                                   text='И хомяки')
+        self.assertFalse([
+            query['sql'] for query in queries
+            if '"posts_comment"."text"' in query['sql']
+            or 'group_concat' in query['sql']
+        ])
+        self.assertEqual(self.found('хомяки'), [self.dogs.pk])
+        self.assertEqual(self.found('попугаи'), [self.dogs.pk])
+
+    def test_keyset_pages(self):
+        """Выдача листается курсором вперёд и назад без пропусков."""
+        Post.objects.bulk_create([
+            Post(text=f'Попугай номер {i}', author=self.user)
+            for i in range(13)
+        ])
+        call_command('rebuild_search_index', stdout=StringIO())
+        paginator = search.SearchPaginator('попугай', 5)
+        seen, page = [], paginator.get_page()
+        while True:
+            seen += [post.pk for post in page]
+            if not page.has_next():
+                break
+            last = page
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertEqual(len(seen), 13)
+        self.assertEqual(len(set(seen)), 13)
+        previous = paginator.get_page(before=page.previous_cursor)
+        self.assertEqual([post.pk for post in previous],
+                         [post.pk for post in last])
+
+    def test_api(self):
+        """API отдаёт выдачу и курсор следующей страницы."""
+        response = Client().get(reverse('posts:api_search'), {'q': 'кошки'})
+        data = response.json()
+        self.assertEqual([post['id'] for post in data['results']],
+                         [self.cats.pk, self.cat_and_dog.pk])
+        self.assertEqual(data['results'][0]['group'], 'group')
+        self.assertIsNone(data['next'])
+
+
+@override_settings(SEARCH_BACKEND='fts5')
+class FTS5SearchTest(SearchTestMixin, TestCase):
+    pass
+
+
+@override_settings(SEARCH_BACKEND='terms')
+class TermSearchTest(SearchTestMixin, TestCase):
+    def test_terms_stored(self):
+        """Слова поста хранятся с весом: текст весит больше комментария."""
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text='лают')
+        self.assertEqual(
+            SearchTerm.objects.get(post=self.dogs, term='лают').weight,
+            search.TEXT_WEIGHT + search.COMMENT_WEIGHT,
+        )
@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import threads
+from ..models import Comment, Post, User
+
+
+class CommentThreadsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.post = Post.objects.create(text='Текст', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(post=self.post, author=self.user,
+                                      text=text, parent=parent)
+
+    def add_comments(self, count, replies=0):
+        for i in range(count):
+            root = self.comment(f'Комментарий {i}')
+            for j in range(replies):
+                self.comment(f'Ответ {i}.{j}', parent=root)
+
+    def test_reply_depth_is_bounded(self):
+        """Ответ глубже MAX_DEPTH прикрепляется к родителю родителя."""
+        root = parent = self.comment('Корень')
+        for i in range(threads.MAX_DEPTH + 2):
+            parent = self.comment(f'Ответ {i}', parent=parent)
+            self.assertEqual(parent.thread, root)
+        self.assertEqual(parent.depth, threads.MAX_DEPTH)
+        self.assertEqual(parent.parent.depth, threads.MAX_DEPTH - 1)
+
+    def test_post_detail_cost_is_constant(self):
+        """Страница поста не дороже с ростом числа комментариев."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        for count in (2, threads.COMMENTS_PER_PAGE + 5):
+            Comment.objects.all().delete()
+            self.add_comments(count, replies=threads.REPLIES_PER_THREAD + 2)
+            cache.clear()
+            with self.assertNumQueries(7):
+                response = self.authorized_client.get(url)
+        page = response.context['comments']
+        self.assertEqual(len(page), threads.COMMENTS_PER_PAGE)
+        self.assertEqual(len(page.tree[0].children),
+                         threads.REPLIES_PER_THREAD)
+        self.assertContains(response, 'Показать ещё')
+        self.assertContains(response, 'Ещё ответы')
+
+    def test_next_pages_are_fragments(self):
+        """Следующая страница и остаток ветки отдаются фрагментом."""
+        self.add_comments(threads.COMMENTS_PER_PAGE + 2,
+                          replies=threads.REPLIES_PER_THREAD + 2)
+        page = threads.root_page(self.post.pk)
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'after': page.next_cursor},
+        )
+        self.assertContains(response, 'Комментарий 0')
+        self.assertContains(response, 'Комментарий 1')
+        self.assertNotContains(response, 'Комментарий 21')
+        self.assertNotContains(response, '<html')
+        root = page.tree[0]
+        response = self.client.get(
+            reverse('posts:comment_thread', args=[self.post.pk, root.pk]),
+            {'after': root.more_replies},
+        )
+        last = threads.REPLIES_PER_THREAD
+        self.assertEqual(
+            [comment.text for comment in response.context['page']],
+            [f'{root.text.replace("Комментарий", "Ответ")}.{j}'
+             for j in (last, last + 1)],
+        )
+
+    def test_reply_form(self):
+        """Ответ из формы попадает в ветку своего поста."""
+        root = self.comment('Корень')
+        other = Post.objects.create(text='Другой', author=self.author)
+        stranger = Comment.objects.create(post=other, author=self.user,
+                                          text='Чужой')
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        self.authorized_client.post(url, {'text': 'Ответ',
+                                          'parent': root.pk})
+        self.authorized_client.post(url, {'text': 'Мимо',
+                                          'parent': stranger.pk})
+        self.assertEqual(Comment.objects.get(text='Ответ').thread, root)
+        self.assertIsNone(Comment.objects.get(text='Мимо').parent)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            {'reply_to': root.pk},
+        )
+        self.assertContains(response, f'value="{root.pk}"')
@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from .. import thumbnails
+from ..models import Group, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.user,
+            group=cls.group,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_placeholder_until_generated(self):
+        """Пока миниатюры нет, отдаётся заглушка нужного размера."""
+        image = SimpleUploadedFile('other.gif', SMALL_GIF, 'image/gif')
+        post = Post.objects.create(text='Текст', author=self.user,
+                                   image=image)
+        thumbnail = thumbnails.rendition(post.image, 'card')
+        self.assertTrue(thumbnail.is_placeholder)
+        self.assertEqual((thumbnail.width, thumbnail.height), (200, 200))
+        thumbnails.generate(post.image.name)
+        thumbnail = thumbnails.rendition(post.image, 'card')
+        self.assertFalse(hasattr(thumbnail, 'is_placeholder'))
+        self.assertTrue(thumbnail.url.startswith(settings.MEDIA_URL))
+
+    def test_lookup_matches_sorl_names(self):
+        """Поиск берёт те же файлы, что строит и регистрирует sorl.
+
+        ``LookupBackend`` повторяет разбор опций sorl без открытия
+        картинки; тест ловит расхождение после обновления sorl.
+        """
+        for preserve_format in (False, True):
+            for kind, (geometry, options) in thumbnails.RENDITIONS.items():
+                with self.subTest(kind=kind, preserve=preserve_format), \
+                        override_settings(
+                            THUMBNAIL_PRESERVE_FORMAT=preserve_format):
+                    generated = get_thumbnail(
+                        self.post.image.name, geometry, **options
+                    )
+                    found = thumbnails.backend.lookup(
+                        self.post.image.name, geometry, **options
+                    )
+                    self.assertEqual(
+                        thumbnails.backend.thumbnail_file(
+                            self.post.image.name, geometry, **options
+                        ).key,
+                        generated.key,
+                    )
+                    self.assertEqual(found.name, generated.name)
+
+    def test_pages_never_process_images(self):
+        """Страницы только ищут миниатюры и не открывают картинки."""
+        urls = [
+            reverse('posts:home'),
+            reverse('posts:profile', kwargs={'username': 'Name'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        with mock.patch('sorl.thumbnail.default.engine.get_image',
+                        side_effect=AssertionError):
+            for url in urls:
+                with self.subTest(url=url):
+                    response = Client().get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_generated_after_create(self):
+        """Создание поста с картинкой ставит её в очередь миниатюр."""
+        client = Client()
+        client.force_login(self.user)
+        # TestCase не фиксирует транзакцию: выполняем колбэк сразу.
+        with mock.patch.object(thumbnails, 'enqueue') as enqueue, \
+                mock.patch.object(thumbnails.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            client.post(reverse('posts:create'), {
+                'text': 'Новый пост',
+                'image': SimpleUploadedFile('new.gif', SMALL_GIF,
+                                            'image/gif'),
+            })
+        post = Post.objects.get(text='Новый пост')
+        enqueue.assert_called_once_with(post.pk, post.image.name)
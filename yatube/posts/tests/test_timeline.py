@@ -0,0 +1,122 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import timeline
+from ..models import Follow, Post, ProfileStats, TimelineEntry, User
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.other = User.objects.create_user(username='Other')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков, но не остальных."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.other).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка добавляет старые посты, отписка их убирает."""
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'Author'}))
+        self.assertEqual(self.feed(), [post])
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'Author'}))
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_hot_author_is_pulled_on_read(self):
+        """Посты автора с большим числом подписчиков читаются напрямую."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_rebuild_command(self):
+        """Команда пересобирает ленты по текущим подпискам."""
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [Post(text=f'Текст {i}', author=self.author)
+                 for i in range(3)]
+        Post.objects.bulk_create(posts)
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 3)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_cooled_author_is_fanned_out(self):
+        """Посты, написанные выше порога, раздаются после коммита отписки."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.assertTrue(ProfileStats.objects.get(
+            user=self.author).timeline_pending)
+        # TestCase не фиксирует транзакцию: колбэки копим и вызываем сами.
+        callbacks = []
+        with mock.patch.object(timeline.transaction, 'on_commit',
+                               side_effect=callbacks.append):
+            Follow.objects.get(user=self.other, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.assertFalse(ProfileStats.objects.get(
+            user=self.author).timeline_pending)
+        self.assertEqual(self.feed(), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3)
+    def test_cool_down_survives_counter_drift(self):
+        """Раздача срабатывает и при отставшем счётчике подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        ProfileStats.objects.filter(user=self.author).update(
+            followers_count=0, timeline_pending=True
+        )
+        TimelineEntry.objects.filter(post=post).delete()
+        with mock.patch.object(timeline.transaction, 'on_commit',
+                               side_effect=lambda func: func()):
+            timeline.cool_down(self.author.pk)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+
+    @override_settings(POSTS_KEYSET_PAGINATION=True)
+    def test_keyset_pages_over_timeline_entries(self):
+        """Курсоры ленты подписок берутся из записей ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [Post.objects.create(text=f'Текст {i}', author=self.author)
+                 for i in range(12)]
+        url = reverse('posts:follow_index')
+        first = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(list(first), posts[::-1][:10])
+        second = self.authorized_client.get(
+            url, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(second), posts[1::-1])
+        self.assertFalse(second.has_next())
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import Post, User
+from ..uploads import ORIENTATION
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def jpeg_file(name='photo.jpg', size=(40, 20), orientation=None):
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation is not None:
+        exif[ORIENTATION] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts:create'), {'text': 'Пост', 'image': image}
+        )
+
+    def test_exif_stripped_and_orientation_applied(self):
+        """EXIF удаляется, поворот из него применяется к пикселям."""
+        response = self.create(jpeg_file(orientation=6))
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_jpeg_metadata_stripped_without_decoding(self):
+        """JPEG без поворота очищается от EXIF без декодирования."""
+        original = jpeg_file()
+        with mock.patch('PIL.ImageFile.ImageFile.load',
+                        side_effect=AssertionError):
+            response = self.create(original)
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(len(image.getexif()), 0)
+            original.seek(0)
+            with Image.open(original) as source:
+                self.assertEqual(image.tobytes(), source.tobytes())
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100)
+    def test_too_large_file_rejected(self):
+        """Файл больше лимита отклоняется и не пишется на диск целиком."""
+        response = self.create(jpeg_file())
+        self.assertFormError(response, 'form', 'image',
+                             'Файл больше 100\xa0байт.')
+        self.assertEqual(response.context['form']['text'].value(), 'Пост')
+        self.assertFalse(Post.objects.exists())
+
+    def test_post_views_keep_csrf_check(self):
+        """Обработчик ставится до разбора тела, CSRF всё равно проверяется."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('posts:create'), {'text': 'Пост'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=799)
+    def test_too_many_pixels_rejected_before_decode(self):
+        """Лимит пикселей проверяется по заголовку, без декодирования."""
+        with mock.patch('PIL.ImageFile.ImageFile.load',
+                        side_effect=AssertionError):
+            response = self.create(jpeg_file())
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка 40×20 слишком большая.')
+        self.assertFalse(Post.objects.exists())
@@ -1,13 +1,17 @@
 import shutil
 import tempfile
+import time
 
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from ..models import Follow, Post, Group, User
+from django.utils.http import http_date
+from ..models import Comment, Follow, Post, Group, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -30,6 +34,7 @@ class PaginatorViewsTest(TestCase):
         Post.objects.bulk_create(post_list)
 
     def setUp(self):
+        cache.clear()
         self.unauthorized_client = Client()
 
     def test_paginator_on_pages(self):
@@ -53,6 +58,83 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  posts_on_second_page)
 
+    def test_page_links(self):
+        """Номер текущей страницы без ссылки, остальные - ссылки."""
+        response = self.client.get(reverse('posts:home'), {'page': 2})
+        self.assertContains(
+            response, '<a class="page-link" href="?page=1">1</a>', html=True
+        )
+        self.assertContains(
+            response, '<span class="page-link">2</span>', html=True
+        )
+
+
+@override_settings(POSTS_KEYSET_PAGINATION=True)
+class KeysetPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Name')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы',
+            slug='test_slug',
+            description='Тестовое описание группы',
+        )
+        post_list = [Post(text=f'Тестовый пост №{i}',
+                     group=cls.group, author=cls.user)
+                     for i in range(23)]
+        Post.objects.bulk_create(post_list)
+        cls.url_pages = [
+            reverse('posts:home'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'Name'}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_keyset_walks_all_posts(self):
+        """Курсоры проходят ленту вперёд и назад без пропусков."""
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for rev in self.url_pages:
+            with self.subTest(rev=rev):
+                seen = []
+                page_obj = self.client.get(rev).context['page_obj']
+                self.assertFalse(page_obj.has_previous())
+                pages = [page_obj]
+                while page_obj.has_next():
+                    page_obj = self.client.get(
+                        rev, {'after': page_obj.next_cursor}
+                    ).context['page_obj']
+                    pages.append(page_obj)
+                for page in pages:
+                    seen.extend(page)
+                self.assertEqual(seen, expected)
+                self.assertEqual([len(page) for page in pages], [10, 10, 3])
+                page_obj = self.client.get(
+                    rev, {'before': page_obj.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(page_obj), expected[10:20])
+                self.assertTrue(page_obj.has_previous())
+
+    def test_keyset_never_counts(self):
+        """Курсорная страница не выполняет COUNT(*) и OFFSET."""
+        first = self.client.get(self.url_pages[0]).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url_pages[0], {'after': first.next_cursor})
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+        self.assertIsNone(first.paginator.count)
+        self.assertIsNone(first.next_page_number())
+        self.assertIsNone(first.start_index())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый токен отдаёт первую страницу."""
+        response = self.client.get(self.url_pages[0], {'after': '!!!'})
+        self.assertFalse(response.context['page_obj'].has_previous())
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class PostPagesTests(TestCase):
     @classmethod
@@ -72,6 +154,7 @@ class PostPagesTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -149,6 +232,7 @@ class ViewsTest(TestCase):
         cls.user2 = User.objects.create_user(username='Name2')
 
     def setUp(self):
+        cache.clear()
         self.small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -208,16 +292,116 @@ class ViewsTest(TestCase):
         post = Post.objects.create(
             text='Пост попугая Кеши',
             author=self.user)
-        content_add = self.authorized_client.get(
+        content_add = self.guest_client.get(
             reverse('posts:home')).content
+        with self.assertNumQueries(0):
+            content_cached = self.guest_client.get(
+                reverse('posts:home')).content
+        self.assertEqual(content_add, content_cached)
         post.delete()
-        content_delete = self.authorized_client.get(
+        content_delete = self.guest_client.get(
             reverse('posts:home')).content
-        self.assertEqual(content_add, content_delete)
+        self.assertNotEqual(content_add, content_delete)
+        self.assertNotIn(post.text.encode(), content_delete)
+
+    def test_cache_invalidated_by_signals(self):
+        """Изменения сразу сбрасывают только затронутые ленты."""
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+        post_url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+        other_group = Group.objects.create(title='Другая группа',
+                                           slug='other_group')
+        other_url = reverse('posts:group_list',
+                            kwargs={'slug': other_group.slug})
+        for url in (group_url, post_url, other_url):
+            self.guest_client.get(url)
+        Comment.objects.create(post=self.post, author=self.user2,
+                               text='Новый комментарий')
+        self.assertContains(self.guest_client.get(post_url),
+                            'Новый комментарий')
+        with self.assertNumQueries(0):
+            self.guest_client.get(group_url)
+        new_post = Post.objects.create(text='Новый пост в группе',
+                                       author=self.user2,
+                                       group=self.group)
+        self.assertContains(self.guest_client.get(group_url),
+                            new_post.text)
+        with self.assertNumQueries(0):
+            self.guest_client.get(other_url)
+        new_post.group = other_group
+        new_post.save()
+        self.assertNotContains(self.guest_client.get(group_url),
+                               new_post.text)
+        self.assertContains(self.guest_client.get(other_url),
+                            new_post.text)
+
+
+class ConditionalViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
         cache.clear()
-        content_cache_clear = self.authorized_client.get(
-            reverse('posts:home')).content
-        self.assertNotEqual(content_add, content_cache_clear)
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_anonymous_pages_public(self):
+        """Анонимные страницы может кешировать CDN, 304 без запросов."""
+        url = reverse('posts:group_list', kwargs={'slug': 'group'})
+        response = self.guest_client.get(url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertFalse(response['ETag'].startswith('W/'))
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_and_delete_change_last_modified(self):
+        """Правка и удаление поста не дают 304 по If-Modified-Since."""
+        url = reverse('posts:group_list', kwargs={'slug': 'group'})
+        post = Post.objects.create(text='Ещё пост', author=self.user,
+                                   group=self.group)
+        for change in (lambda: post.save(), lambda: post.delete()):
+            # В секунду изменения Last-Modified не отдаётся.
+            last_modified = self.guest_client.get(url).get(
+                'Last-Modified', http_date(time.time())
+            )
+            change()
+            response = self.guest_client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_authorized_pages_private(self):
+        """Страницы авторизованных приватные и тоже отвечают 304."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        # Страница с CSRF-токеном рендерится заново: ETag слабый.
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.templates)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
 
 
 class FollowViewsTest(TestCase):
@@ -229,6 +413,7 @@ class FollowViewsTest(TestCase):
         cls.author = User.objects.create_user(username='somename')
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.unauthorized_client = Client()
         self.authorized_client = Client()
@@ -268,3 +453,120 @@ class FollowViewsTest(TestCase):
         self.assertFalse(Follow.objects.filter(user=self.user,
                                                author=self.user).exists())
         self.assertEqual(Follow.objects.count(), follow_count)
+
+
+class QueryCountViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Name')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Текст {i}',
+                                       author=self.author,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=self.user,
+                                   text='Комментарий')
+            Comment.objects.create(post=post, author=self.author,
+                                   text='Ответ')
+        return post
+
+    def test_views_query_count_does_not_grow(self):
+        """Число запросов не зависит от количества постов на странице."""
+        for posts_count in (1, 15):
+            post = self.add_posts(posts_count)
+            urls = {
+                reverse('posts:home'): 4,
+                reverse('posts:group_list',
+                        kwargs={'slug': self.group.slug}): 5,
+                reverse('posts:profile',
+                        kwargs={'username': 'Author'}): 7,
+                # +1: ленты поста нужны для ETag и без кеша страницы,
+                # +1: ответы веток первой страницы комментариев.
+                reverse('posts:post_detail',
+                        kwargs={'post_id': post.id}): 7,
+                # +1: посты страницы читаются после записей ленты.
+                reverse('posts:follow_index'): 7,
+            }
+            for url, queries in urls.items():
+                with self.subTest(url=url, posts_count=posts_count):
+                    cache.clear()
+                    with self.assertNumQueries(queries):
+                        self.authorized_client.get(url)
+
+    def test_feed_follow_state_costs_no_queries(self):
+        """Кнопки подписки на лентах не добавляют запросов на пост."""
+        authors = [User.objects.create_user(username=f'Author{i}')
+                   for i in range(10)]
+        for author in authors:
+            Post.objects.create(text='Текст', author=author, group=self.group)
+        Follow.objects.bulk_create(
+            [Follow(user=self.user, author=author) for author in authors[::2]]
+        )
+        urls = {
+            reverse('posts:home'): 4,
+            reverse('posts:group_list',
+                    kwargs={'slug': self.group.slug}): 5,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = self.authorized_client.get(url)
+                following = {
+                    post.author_id: post.is_following_author
+                    for post in response.context['page_obj']
+                }
+                self.assertEqual(following, {
+                    author.pk: i % 2 == 0 for i, author in enumerate(authors)
+                })
+                self.assertContains(response, 'Отписаться', count=5)
+                self.assertContains(response, 'Подписаться', count=5)
+        cache.clear()
+        response = self.authorized_client.get(reverse('posts:home'))
+        self.assertEqual(
+            response.context['page_obj'][0].author_post_count, 1
+        )
+        self.assertContains(response, 'Постов автора')
+        response = self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}))
+        self.assertContains(response, 'Постов автора: 1')
+        cache.clear()
+        response = self.client.get(reverse('posts:home'))
+        self.assertNotContains(response, 'Подписаться')
+        self.assertContains(response, 'Тестовый заголовок')
+
+    def test_author_post_in_other_group_refreshes_group_page(self):
+        """Пост автора в другой группе меняет число на странице группы."""
+        author = User.objects.create_user(username='Counted')
+        Post.objects.create(text='Текст', author=author, group=self.group)
+        other = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertContains(self.client.get(url), 'Постов автора: 1')
+        Post.objects.create(text='Текст', author=author, group=other)
+        self.assertContains(self.client.get(url), 'Постов автора: 2')
+
+    def test_follow_refreshes_cached_feed_buttons(self):
+        """Подписка сразу меняет кнопку на закешированной ленте."""
+        other = User.objects.create_user(username='Other')
+        Post.objects.create(text='Текст', author=other)
+        url = reverse('posts:home')
+        self.assertContains(self.authorized_client.get(url), 'Подписаться')
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'Other'}))
+        self.assertNotContains(self.authorized_client.get(url),
+                               'Подписаться')
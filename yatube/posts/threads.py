@@ -0,0 +1,124 @@
+"""Ветки комментариев с курсорной пагинацией.
+
+Страница поста показывает первую страницу корневых комментариев
+(новые сверху) и по ``REPLIES_PER_THREAD`` первых ответов в каждой
+ветке; следующие страницы и ответы целиком отдаёт отдельный адрес.
+Стоимость страницы не зависит от числа комментариев: два запроса -
+корни по индексу (post, thread, created) и ответы всех веток страницы
+одним запросом с коррелированным подзапросом ``LIMIT`` на ветку.
+
+Ответ хранит корень ветки (``thread``) и уровень (``depth``); глубже
+``MAX_DEPTH`` ответ не уходит (``place_reply``).
+"""
+from django.db.models import OuterRef, Subquery
+
+from .models import Comment
+from .paginators import KeysetPaginator, encode_cursor
+
+COMMENTS_PER_PAGE = 20
+REPLIES_PER_THREAD = 3
+MAX_DEPTH = 3
+
+
+def place_reply(comment):
+    """Проставляет ответу корень ветки и уровень.
+
+    Ответ глубже ``MAX_DEPTH`` уходит к родителю своего родителя:
+    так ветку можно выбрать одним запросом по ``thread``.
+    """
+    if comment.parent_id is None:
+        return
+    parent = comment.parent
+    if parent.depth >= MAX_DEPTH:
+        parent = comment.parent = parent.parent
+    comment.post_id = parent.post_id
+    comment.thread_id = parent.thread_id or parent.pk
+    comment.depth = parent.depth + 1
+
+
+def _comments():
+    return Comment.objects.select_related('author', 'parent__author')
+
+
+def nest(comments, parents=()):
+    """Раскладывает комментарии по ``comment.children``.
+
+    Возвращает те, чьих родителей нет среди ``comments``
+    и ``parents``: они показываются верхним уровнем.
+    """
+    by_pk = {parent.pk: parent for parent in parents}
+    for comment in comments:
+        comment.children = []
+        by_pk[comment.pk] = comment
+    top = []
+    for comment in comments:
+        parent = by_pk.get(comment.parent_id)
+        if parent is None:
+            top.append(comment)
+        else:
+            parent.children.append(comment)
+    return top
+
+
+def walk(comments):
+    """Все комментарии дерева ``nest`` по порядку показа."""
+    for comment in comments:
+        yield comment
+        yield from walk(getattr(comment, 'children', ()))
+
+
+def attach_replies(roots):
+    """Первые ответы каждой ветки страницы одним запросом.
+
+    Ответы берутся от старых к новым: родитель старше ответа, поэтому
+    первые ответы ветки всегда показываются вместе с родителями.
+    ``root.more_replies`` - курсор ``after`` для остальных ответов
+    ветки (``thread_page``) или None, если показаны все.
+    """
+    roots = list(roots)
+    for root in roots:
+        root.children = []
+        root.more_replies = None
+    if not roots:
+        return roots
+    first = Comment.objects.filter(
+        post=OuterRef('post'), thread=OuterRef('thread')
+    ).order_by('created', 'pk').values('pk')[:REPLIES_PER_THREAD + 1]
+    replies = _comments().filter(
+        post=roots[0].post_id,
+        thread__in=[root.pk for root in roots],
+        pk__in=Subquery(first),
+    ).order_by('created', 'pk')
+    shown = {root.pk: [] for root in roots}
+    for reply in replies:
+        shown[reply.thread_id].append(reply)
+    for root in roots:
+        thread = shown[root.pk]
+        if len(thread) > REPLIES_PER_THREAD:
+            last = thread[REPLIES_PER_THREAD - 1]
+            root.more_replies = encode_cursor(last.created, last.pk)
+        nest(thread[:REPLIES_PER_THREAD], [root])
+    return roots
+
+
+def root_page(post_id, after=None, before=None):
+    """Страница корневых комментариев поста, новые сверху."""
+    page = KeysetPaginator(
+        Comment.objects.select_related('author').filter(
+            post=post_id, thread=None
+        ),
+        COMMENTS_PER_PAGE, date_field='created',
+    ).get_page(after=after, before=before)
+    page.tree = attach_replies(page)
+    return page
+
+
+def thread_page(root, after=None, before=None):
+    """Страница ответов ветки ``root``, от старых к новым."""
+    page = KeysetPaginator(
+        _comments().filter(post=root.post_id, thread=root),
+        COMMENTS_PER_PAGE, date_field='created', oldest_first=True,
+    ).get_page(after=after, before=before)
+    # Ответы на комментарии с прошлых страниц идут верхним уровнем.
+    page.tree = nest(list(page))
+    return page
@@ -0,0 +1,194 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Шаблоны раньше вызывали ``{% thumbnail %}`` из sorl, и первый просмотр
+страницы декодировал и уменьшал оригинал прямо в запросе. Теперь все
+нужные шаблонам варианты (``RENDITIONS``) строятся в пуле потоков
+после сохранения поста, а тег ``{% post_thumbnail %}`` только ищет
+готовую миниатюру в хранилище ключей sorl и, пока её нет, отдаёт
+заглушку нужного размера.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+
+from core import perf, querylog
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Все варианты миниатюр, которые используют шаблоны.
+RENDITIONS = {
+    'card': ('200x200', {'crop': 'center'}),
+    'card_upscale': ('200x200', {'crop': 'center', 'upscale': True}),
+    'detail': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">'
+    '<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+)
+
+
+class Placeholder:
+    """Заглушка с интерфейсом ImageFile: url, width, height."""
+    is_placeholder = True
+
+    def __init__(self, geometry):
+        width, _, height = geometry.partition('x')
+        self.width = int(width)
+        self.height = int(height or width)
+        self.url = 'data:image/svg+xml,' + quote(
+            PLACEHOLDER_SVG.format(self.width, self.height)
+        )
+
+
+class LookupBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет только искать готовые миниатюры.
+
+    Опции и имя файла собираются как в ``ThumbnailBackend.get_thumbnail``
+    sorl 12.7 (версия закреплена в requirements.txt); совпадение имён
+    проверяет ``test_lookup_matches_sorl_names``.
+    """
+
+    def _options(self, source, options):
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None; картинку не открывает."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+
+backend = LookupBackend()
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def generate(name):
+    """Строит все варианты миниатюр для файла ``name``."""
+    with perf.timer('thumbnail'):
+        for geometry, options in RENDITIONS.values():
+            backend.get_thumbnail(name, geometry, **options)
+
+
+def _generate_for_post(post_id, name):
+    try:
+        generate(name)
+        post = Post.objects.select_related('author').filter(
+            pk=post_id
+        ).first()
+        if post is not None:
+            # Закешированные страницы ещё показывают заглушку.
+            caching.bump(*caching.feeds_of_post(post))
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        close_old_connections()
+
+
+def enqueue(post_id, name):
+    """Ставит картинку в очередь, если она ещё не ждёт обработки."""
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if not settings.THUMBNAIL_WORKERS:
+        with querylog.background():
+            _generate_for_post(post_id, name)
+        return
+    _get_executor().submit(_generate_for_post, post_id, name)
+
+
+def schedule(post):
+    """Запускает подготовку миниатюр после фиксации транзакции."""
+    if post.image:
+        post_id, name = post.pk, post.image.name
+        transaction.on_commit(lambda: enqueue(post_id, name))
+
+
+def prefetch(posts, kind):
+    """Загружает в кеш sorl записи миниатюр страницы одним запросом.
+
+    Иначе каждая карточка ленты при холодном кеше ищет свою миниатюру
+    отдельным запросом к ``thumbnail_kvstore``. Отсутствие миниатюры
+    кешируется так же, как это делает сам sorl.
+    """
+    geometry, options = RENDITIONS[kind]
+    keys = [
+        add_prefix(backend.thumbnail_file(
+            post.image.name, geometry, **options
+        ).key)
+        for post in posts if post.image
+    ]
+    if not keys:
+        return
+    cache = default.kvstore.cache
+    missing = set(keys) - set(cache.get_many(keys))
+    if not missing:
+        return
+    values = dict(KVStore.objects.filter(
+        key__in=missing
+    ).values_list('key', 'value'))
+    cache.set_many(
+        {key: values.get(key, EMPTY_VALUE) for key in missing},
+        sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+    )
+
+
+def rendition(image, kind):
+    """Готовая миниатюра варианта ``kind`` или заглушка.
+
+    Миниатюры старых постов строит команда ``generate_thumbnails``.
+    """
+    if not image:
+        return None
+    geometry, options = RENDITIONS[kind]
+    with perf.timer('thumbnail'):
+        thumbnail = backend.lookup(image.name, geometry, **options)
+    if thumbnail is None:
+        return Placeholder(geometry)
+    return thumbnail
@@ -0,0 +1,255 @@
+"""Лента подписок с раздачей постов при записи (fan-out on write).
+
+Каждый новый пост копируется ссылкой в ``TimelineEntry`` всех
+подписчиков автора, поэтому ``follow_index`` читает готовую ленту
+по индексу (user, -pub_date) вместо join через ``Follow``.
+
+Авторы, у которых подписчиков не меньше ``TIMELINE_FANOUT_LIMIT``,
+не раздаются: их посты подмешиваются в ленту при чтении (гибридный
+режим), иначе одна публикация порождала бы миллионы вставок. Такой
+автор помечается ``ProfileStats.timeline_pending``; когда он опускается
+ниже порога, его посты раздаются подписчикам в фоне (``cool_down``).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from core import querylog
+
+from .models import Follow, Post, ProfileStats, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_executor = None
+_lock = threading.Lock()
+
+
+def is_hot_author(author_id):
+    """Автор раздаётся при чтении, а не при записи."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if limit is None:
+        return False
+    return ProfileStats.objects.filter(
+        user_id=author_id, followers_count__gte=limit
+    ).exists()
+
+
+def hot_authors(author_ids=None):
+    """id «тяжёлых» авторов среди ``author_ids`` (по умолчанию всех)."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if limit is None:
+        return set()
+    stats = ProfileStats.objects.filter(followers_count__gte=limit)
+    if author_ids is not None:
+        stats = stats.filter(user_id__in=author_ids)
+    return set(stats.values_list('user_id', flat=True))
+
+
+def hot_authors_followed_by(user):
+    """id «тяжёлых» авторов среди подписок пользователя."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if limit is None:
+        return []
+    return list(
+        user.follower
+        .filter(author__stats__followers_count__gte=limit)
+        .values_list('author', flat=True)
+    )
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+        for user_id in user_ids
+        for post_id, author_id, pub_date in posts
+    ]
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_hot_author(post.author_id):
+        ProfileStats.objects.filter(
+            user_id=post.author_id, timeline_pending=False
+        ).update(timeline_pending=True)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        _entries(followers, [(post.pk, post.author_id, post.pub_date)]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, *author_ids):
+    """Добавляет в ленту подписчика уже опубликованные посты авторов."""
+    author_ids = set(author_ids) - hot_authors(author_ids)
+    if not author_ids:
+        return
+    posts = Post.objects.filter(
+        author_id__in=author_ids
+    ).values_list('id', 'author_id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        _entries([user_id], posts.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TIMELINE_WORKERS,
+                thread_name_prefix='timeline',
+            )
+        return _executor
+
+
+def _fan_out_author(author_id):
+    """Раздаёт все посты автора всем его подписчикам."""
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'author_id', 'pub_date'))
+    if not posts:
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator()
+    chunk_size = max(BATCH_SIZE // len(posts), 1)
+    while True:
+        chunk = list(islice(followers, chunk_size))
+        if not chunk:
+            break
+        TimelineEntry.objects.bulk_create(
+            _entries(chunk, posts),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def _cool_down_author(author_id):
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    try:
+        # Метку снимает тот, кто раздаёт: повторная задача ничего не делает.
+        claimed = ProfileStats.objects.filter(
+            user_id=author_id, timeline_pending=True,
+            followers_count__lt=limit,
+        ).update(timeline_pending=False)
+        if claimed:
+            _fan_out_author(author_id)
+    except Exception:
+        logger.exception('Не удалось раздать посты автора %s', author_id)
+        ProfileStats.objects.filter(
+            user_id=author_id
+        ).update(timeline_pending=True)
+    finally:
+        close_old_connections()
+
+
+def enqueue(author_id):
+    if not settings.TIMELINE_WORKERS:
+        with querylog.background():
+            _cool_down_author(author_id)
+        return
+    _get_executor().submit(_cool_down_author, author_id)
+
+
+def cool_down(*author_ids):
+    """Ставит в фон раздачу постов авторов, опустившихся ниже порога.
+
+    Вызывается после уменьшения ``followers_count``. Раздаются только
+    помеченные ``timeline_pending`` авторы: посты, написанные в
+    гибридном режиме, ещё не лежат в лентах подписчиков. Сама раздача
+    (до ``TIMELINE_FANOUT_LIMIT`` подписчиков на каждый пост) идёт
+    после коммита в пуле потоков, а не в запросе отписки.
+    """
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if limit is None:
+        return
+    cooled = list(ProfileStats.objects.filter(
+        user_id__in=author_ids, timeline_pending=True,
+        followers_count__lt=limit,
+    ).values_list('user_id', flat=True))
+    for author_id in cooled:
+        transaction.on_commit(
+            lambda author_id=author_id: enqueue(author_id)
+        )
+
+
+def trim(user_id, *author_ids):
+    """Убирает посты авторов из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+@transaction.atomic
+def rebuild(users=None):
+    """Пересобирает ленты с нуля; ``users`` ограничивает набор читателей.
+
+    Возвращает количество созданных записей.
+    """
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        follows = follows.filter(user__in=users)
+    entries.delete()
+    created = 0
+    hot = hot_authors()
+    for user_id, author_id in follows.values_list('user_id', 'author_id'):
+        if author_id in hot:
+            continue
+        posts = Post.objects.filter(
+            author_id=author_id
+        ).values_list('id', 'author_id', 'pub_date')
+        created += len(TimelineEntry.objects.bulk_create(
+            _entries([user_id], posts.iterator()),
+            batch_size=BATCH_SIZE,
+        ))
+    if users is None:
+        # Посты всех авторов ниже порога теперь разданы.
+        ProfileStats.objects.filter(timeline_pending=True).exclude(
+            user_id__in=hot
+        ).update(timeline_pending=False)
+    return created
+
+
+def follow_page(user, paginate, posts=None):
+    """Страница ленты подписок пользователя.
+
+    ``paginate(queryset)`` возвращает страницу (``page_context`` во
+    views, курсоры в API). Листаются лёгкие строки: сама
+    ``TimelineEntry`` по индексу (user, -pub_date), а в гибридном
+    режиме, где подписки на «тяжёлых» авторов подмешиваются при
+    чтении, - посты без колонок, кроме даты. Посты страницы затем
+    читаются запросом ``posts`` по первичному ключу, поэтому его
+    аннотации считаются только для страницы.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    hot = hot_authors_followed_by(user)
+    if hot:
+        page = paginate(Post.objects.filter(
+            Q(pk__in=user.timeline.values('post')) | Q(author__in=hot)
+        ).only('pub_date'))
+        ids = [post.pk for post in page.object_list]
+    else:
+        page = paginate(TimelineEntry.objects.filter(
+            user=user
+        ).only('post_id', 'pub_date'))
+        ids = [entry.post_id for entry in page.object_list]
+    by_pk = posts.in_bulk(ids)
+    page.object_list = [by_pk[pk] for pk in ids if pk in by_pk]
+    return page
@@ -0,0 +1,207 @@
+"""Приём картинок постов без лишней памяти и лишнего декодирования.
+
+Во views постов (``image_uploads``) загрузка пишется кусками во
+временный файл, а не в память; файл больше ``POST_IMAGE_MAX_BYTES``
+пропускается целиком, и форма сообщает об ошибке. ``check_image``
+читает только заголовок картинки: формат и размеры известны до
+декодирования пикселей, поэтому огромные и «бомбовые» картинки
+отклоняются, не попав в Pillow целиком. ``strip_metadata`` убирает
+метаданные: из JPEG - вырезая сегменты без декодирования, остальное
+поворачивает по EXIF и перекодирует за одно декодирование.
+"""
+import os
+import shutil
+import struct
+import tempfile
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (SkipFile,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+ORIENTATION = 0x0112
+# Сегменты JPEG с метаданными: EXIF/XMP (APP1), IPTC (APP13), комментарий.
+JPEG_METADATA = (0xE1, 0xED, 0xFE)
+# Маркеры JPEG без длины: SOI, EOI, RSTn, TEM.
+JPEG_STANDALONE = (0xD8, 0xD9, *range(0xD0, 0xD8), 0x01)
+JPEG_SOS = 0xDA
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоковая запись загрузки на диск с ограничением размера.
+
+    Файл больше лимита пропускается (``SkipFile``), имя его поля
+    попадает в ``request.oversized_uploads``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        if request is not None:
+            request.oversized_uploads = set()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.POST_IMAGE_MAX_BYTES:
+            if self.request is not None:
+                self.request.oversized_uploads.add(self.field_name)
+            raise SkipFile()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def image_uploads(view):
+    """Ставит ``ImageUploadHandler`` первым обработчиком загрузок view.
+
+    Обработчики меняются до разбора тела, а CSRF-проверка его читает,
+    поэтому она выполняется внутри, после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, ImageUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def too_large_error():
+    limit = settings.POST_IMAGE_MAX_BYTES
+    return ValidationError(
+        'Файл больше %(limit)s.',
+        code='file_too_large',
+        params={'limit': filesizeformat(limit)},
+    )
+
+
+def check_image(file):
+    """Проверяет размер, формат и число пикселей по заголовку файла."""
+    if file.size > settings.POST_IMAGE_MAX_BYTES:
+        raise too_large_error()
+    file.seek(0)
+    try:
+        # Image.open читает только заголовок, пиксели не декодируются.
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image'
+        )
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(
+            'Формат %(format)s не поддерживается.',
+            code='invalid_format',
+            params={'format': image_format},
+        )
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+    return image_format, (width, height)
+
+
+def _copy_jpeg_without_metadata(source, output):
+    """Копирует JPEG без сегментов ``JPEG_METADATA``, не декодируя его.
+
+    После начала скана (SOS) остаток файла копируется как есть.
+    Для повреждённой структуры сегментов - ValueError.
+    """
+    if source.read(2) != b'\xff\xd8':
+        raise ValueError('Нет маркера SOI')
+    output.write(b'\xff\xd8')
+    while True:
+        header = source.read(2)
+        if len(header) < 2 or header[0] != 0xFF:
+            raise ValueError('Повреждён маркер JPEG')
+        marker = header[1]
+        if marker == 0xFF:
+            # Байты-заполнители перед маркером.
+            source.seek(-1, os.SEEK_CUR)
+            continue
+        if marker in JPEG_STANDALONE:
+            output.write(header)
+            continue
+        raw_length = source.read(2)
+        if len(raw_length) < 2:
+            raise ValueError('Обрезан сегмент JPEG')
+        length, = struct.unpack('>H', raw_length)
+        body = source.read(length - 2)
+        if len(body) < length - 2:
+            raise ValueError('Обрезан сегмент JPEG')
+        if marker not in JPEG_METADATA:
+            output.write(header + raw_length + body)
+        if marker == JPEG_SOS:
+            shutil.copyfileobj(source, output)
+            return
+
+
+def _spooled_file():
+    return tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+
+
+def _uploaded(output, file):
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, os.path.basename(file.name),
+        getattr(file, 'content_type', None), size,
+    )
+
+
+def strip_metadata(file):
+    """Возвращает картинку без EXIF и других метаданных.
+
+    JPEG без поворота копируется без сегментов метаданных, пиксели
+    не декодируются и не пережимаются; остальные картинки
+    перекодируются. Новый файл с тем же именем и типом до
+    ``FILE_UPLOAD_MAX_MEMORY_SIZE`` держится в памяти, дальше на диске.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        lossless = (image.format == 'JPEG'
+                    and image.getexif().get(ORIENTATION, 1) == 1)
+    if lossless:
+        file.seek(0)
+        output = _spooled_file()
+        try:
+            _copy_jpeg_without_metadata(file, output)
+        except ValueError:
+            output.close()
+        else:
+            return _uploaded(output, file)
+    file.seek(0)
+    with Image.open(file) as image:
+        # Без явной загрузки пик памяти в save() вдвое выше
+        # (см. команду bench_uploads).
+        image.load()
+        options = {'format': image.format}
+        if image.info.get('icc_profile'):
+            options['icc_profile'] = image.info['icc_profile']
+        if getattr(image, 'is_animated', False):
+            options['save_all'] = True
+            if 'loop' in image.info:
+                options['loop'] = image.info['loop']
+            result = image
+        elif image.getexif().get(ORIENTATION, 1) != 1:
+            result = ImageOps.exif_transpose(image)
+            if image.format == 'JPEG':
+                options['quality'] = 90
+        else:
+            result = image
+            if image.format == 'JPEG':
+                # Таблицы квантования оригинала: качество не падает.
+                options.update(quality='keep', subsampling='keep')
+        output = _spooled_file()
+        result.save(output, **options)
+    return _uploaded(output, file)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -20,6 +20,7 @@ urlpatterns = [
         views.post_detail,
         name='post_detail'
     ),
+    path('search/', views.post_search, name='search'),
     path('create/', views.post_create, name='create'),
     path(
         'posts/<int:post_id>/edit/',
@@ -31,6 +32,16 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/',
+        views.comment_thread,
+        name='comment_thread'
+    ),
     path(
         'follow/', views.follow_index,
         name='follow_index'
@@ -45,4 +56,24 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post_detail'),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='api_post_comments'
+    ),
+    path(
+        'api/posts/<int:post_id>/comments/<int:comment_id>/',
+        api.comment_thread,
+        name='api_comment_thread'
+    ),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_list'),
+    path(
+        'api/profile/<str:username>/',
+        api.profile,
+        name='api_profile'
+    ),
+    path('api/follow/', api.follow_index, name='api_follow_index'),
+    path('api/search/', api.post_search, name='api_search'),
 ]
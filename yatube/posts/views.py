@@ -1,89 +1,174 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.db.replicas import replica_reads
+
+from . import (cards, comment_queue, follow_graph, search, threads,
+               thumbnails, timeline, uploads)
+from .caching import (cache_feed, follow_feeds, post_feeds, set_last_modified,
+                      viewer_feeds)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Group, Post, ProfileStats, User
+from .paginators import KeysetPaginator
 
 SUM_POSTS = 10
 
 
-@cache_page(20)
-def index_page(request):
-    paginator = Paginator(
-        Post.objects.all(),
-        SUM_POSTS
-    )
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    template = 'posts/index.html'
-    context = {
-        'page_obj': page_obj,
-    }
-    return render(request, template, context)
-
+def page_context(request, queryset, page_posts=None):
+    """Страница ленты; ``page_posts`` дополняет запрос постов страницы.
 
-def page_context(request, queryset):
+    Так аннотации (``for_viewer``) считаются только для строк страницы,
+    а ``COUNT`` пагинатора идёт по самой ленте.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.POSTS_KEYSET_PAGINATION or after or before:
+        # Курсорная страница строк не считает: лимит уже в запросе.
+        if page_posts is not None:
+            queryset = page_posts(queryset)
+        paginator = KeysetPaginator(queryset, SUM_POSTS)
+        return paginator.get_page(after=after, before=before)
     paginator = Paginator(queryset, SUM_POSTS)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    page = paginator.get_page(page_number)
+    if page_posts is not None:
+        page.object_list = page_posts(page.object_list)
+    return page
 
 
+@cache_feed(lambda request: ['global', *viewer_feeds(request)])
+@replica_reads
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = page_context(request, post_list)
+    page_obj = page_context(
+        request, Post.objects.for_feed(),
+        lambda posts: posts.for_viewer(request.user),
+    )
+    cards.attach(page_obj)
+    thumbnails.prefetch(page_obj, 'card')
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    return set_last_modified(
+        render(request, 'posts/index.html', context),
+        [post.pub_date for post in page_obj],
+    )
 
 
+@cache_feed(lambda request, slug: [f'group:{slug}', *viewer_feeds(request)])
+@replica_reads
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = page_context(request, post_list)
+    # Число постов автора меняют и его посты в других группах: они
+    # сбрасывают и эту группу (caching.feeds_of_post).
+    page_obj = page_context(
+        request, group.posts.for_feed(),
+        lambda posts: posts.for_viewer(request.user),
+    )
+    cards.attach(page_obj)
+    thumbnails.prefetch(page_obj, 'card')
     context = {
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/group_list.html', context)
+    return set_last_modified(
+        render(request, 'posts/group_list.html', context),
+        [post.pub_date for post in page_obj],
+    )
 
 
+@cache_feed(lambda request, username: [f'author:{username}'])
+@replica_reads
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    posts = author.posts.for_feed()
     page_obj = page_context(request, posts)
-    following = request.user.is_authenticated
-    if following:
-        following = author.following.filter(user=request.user).exists()
+    cards.attach(page_obj)
+    thumbnails.prefetch(page_obj, 'card_upscale')
+    following = (request.user.is_authenticated
+                 and follow_graph.is_following(request.user.pk, author.pk))
     context = {
         'author': author,
+        'stats': ProfileStats.objects.for_user(author),
         'page_obj': page_obj,
         'following': following,
     }
-    return render(request, 'posts/profile.html', context)
+    return set_last_modified(
+        render(request, 'posts/profile.html', context),
+        [post.pub_date for post in page_obj],
+    )
 
 
+@cache_feed(post_feeds, anonymous_only=True)
+@replica_reads
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.for_detail(), pk=post_id)
+    comments = threads.root_page(post.pk)
     form = CommentForm()
+    reply_to = request.GET.get('reply_to', '')
     context = {
         'post': post,
+        'author_posts_count': ProfileStats.objects.for_user(
+            post.author
+        ).posts_count,
         'form': form,
         'comments': comments,
+        'reply_to': reply_to if reply_to.isdigit() else None,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return set_last_modified(
+        render(request, 'posts/post_detail.html', context),
+        [post.pub_date] + [
+            comment.created for comment in threads.walk(comments.tree)
+        ],
+    )
+
+
+def comments_response(request, page, more_url):
+    """Фрагмент HTML со страницей комментариев для подгрузки."""
+    return set_last_modified(
+        render(request, 'posts/includes/comment_list.html', {
+            'page': page,
+            'more_url': more_url,
+        }),
+        [comment.created for comment in threads.walk(page.tree)],
+    )
+
+
+@cache_feed(lambda request, post_id: [f'post:{post_id}'])
+@replica_reads
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    page = threads.root_page(
+        post.pk,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    )
+    return comments_response(request, page, request.path)
+
+
+@cache_feed(lambda request, post_id, comment_id: [f'post:{post_id}'])
+@replica_reads
+def comment_thread(request, post_id, comment_id):
+    root = get_object_or_404(
+        Comment, post=post_id, thread=None, pk=comment_id
+    )
+    page = threads.thread_page(
+        root,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    )
+    return comments_response(request, page, request.path)
 
 
 @login_required
+@uploads.image_uploads
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None, files=request.FILES or None,
+                    oversized=request.oversized_uploads)
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        thumbnails.schedule(new_post)
         return redirect('posts:profile', new_post.author)
     context = {
         'form': form,
@@ -93,6 +178,7 @@ def post_create(request):
 
 
 @login_required
+@uploads.image_uploads
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     if post.author != request.user:
@@ -100,10 +186,13 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        oversized=request.oversized_uploads,
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -115,37 +204,69 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        parent = request.POST.get('parent', '')
+        if settings.COMMENT_WRITE_BEHIND:
+            # Родитель проверяется при записи пачки.
+            comment.parent_id = int(parent) if parent.isdigit() else None
+            comment_queue.get_queue().submit(comment)
+        else:
+            if parent.isdigit():
+                comment.parent = Comment.objects.filter(
+                    post=post, pk=parent
+                ).first()
+            comment.save()
     return redirect('posts:post_detail', post_id=post.id)
 
 
 @login_required
+@cache_feed(follow_feeds)
+@replica_reads
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = page_context(request, post_list)
+    page_obj = timeline.follow_page(
+        request.user,
+        lambda feed: page_context(request, feed),
+        Post.objects.for_feed().for_viewer(request.user),
+    )
+    cards.attach(page_obj)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/follow.html', context)
+    return set_last_modified(
+        render(request, 'posts/follow.html', context),
+        [post.pub_date for post in page_obj],
+    )
 
 
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    user = request.user
-    if author != user:
-        Follow.objects.get_or_create(user=user, author=author)
+    follow_graph.follow(request.user, [author.pk])
     return redirect("posts:profile", author)
 
 
 @login_required
 def profile_unfollow(request, username):
-    user = request.user
-    Follow.objects.filter(user=user, author__username=username).delete()
+    follow_graph.unfollow(
+        request.user, User.objects.filter(username=username).values('pk')
+    )
     return redirect("posts:profile", username=username)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = search.SearchPaginator(query, SUM_POSTS)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    cards.attach(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
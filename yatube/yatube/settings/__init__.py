@@ -0,0 +1,33 @@
+"""Настройки проекта по профилям.
+
+Профиль выбирает переменная окружения ``YATUBE_ENV``:
+  ``dev`` - разработка (по умолчанию): DEBUG, кеш в памяти процесса,
+  письма в файлах;
+  ``test`` - тесты;
+  ``prod`` - работа под нагрузкой: постоянные подключения к базе,
+  общий кеш, кеширующий загрузчик шаблонов, сжатие ответов.
+
+Профиль можно задать и модулем: ``DJANGO_SETTINGS_MODULE`` вида
+``yatube.settings.test``. Так выбирают профиль тестов ``manage.py test``
+и pytest (pytest.ini).
+
+Какие настройки производительности действуют, показывает команда
+``python manage.py perfcheck``.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+YATUBE_ENV = os.environ.get('YATUBE_ENV') or 'dev'
+
+if YATUBE_ENV == 'prod':
+    from .prod import *  # noqa: F401,F403
+elif YATUBE_ENV == 'test':
+    from .test import *  # noqa: F401,F403
+elif YATUBE_ENV == 'dev':
+    from .dev import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(
+        f'Неизвестный профиль YATUBE_ENV={YATUBE_ENV!r}: '
+        f'ожидается dev, test или prod.'
+    )
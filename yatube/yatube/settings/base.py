@@ -0,0 +1,259 @@
+"""Настройки, общие для всех профилей (см. yatube/settings/__init__.py)."""
+import os
+
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+SECRET_KEY = 'c%6z*(er!ratdrx4ve3129p-hz2!s%d^4at2*&sp%51qs0yy8y'
+
+DEBUG = False
+
+ALLOWED_HOSTS: list = [
+    'localhost',
+    '127.0.0.1',
+    '[::1]',
+    'testserver',
+]
+
+
+INSTALLED_APPS = [
+    'about.apps.AboutConfig',
+    'core.apps.CoreConfig',
+    'users.apps.UsersConfig',
+    'posts.apps.PostsConfig',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'sorl.thumbnail',
+]
+
+MIDDLEWARE = [
+    'core.perf.PerfMiddleware',
+    'core.querylog.QueryLogMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db.replicas.ReplicaMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATES = [
+    {
+        # Стандартный бэкенд с замером времени рендера (core/perf.py).
+        'BACKEND': 'core.templates.DjangoTemplates',
+        'NAME': 'django',
+        'DIRS': [TEMPLATES_DIR],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'core.context_processors.year.year',
+            ],
+        },
+    },
+]
+
+# Компилировать все шаблоны при старте воркера (core/templates.py).
+TEMPLATE_WARMUP = False
+
+# Замеры запросов (core/perf.py): доля запросов, попадающих целиком
+# в кольцевой буфер, его размер и заголовок Server-Timing.
+PERF_ENABLED = True
+PERF_SAMPLE_RATE = 1.0
+PERF_RING_SIZE = 1000
+PERF_SERVER_TIMING = True
+# Токен для сбора /metrics без входа в админку: Authorization: Bearer.
+PERF_METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
+# Журнал запросов (core/querylog.py): доля проверяемых запросов, с
+# какого числа одинаковых запросов это N+1 и какой запрос медленный.
+QUERYLOG_SAMPLE_RATE = 0.0
+NPLUSONE_THRESHOLD = 3
+SLOW_QUERY_MS = 100
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': os.environ.get(
+            'YATUBE_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+    }
+}
+
+# PRAGMA для каждого нового подключения к SQLite и очередь записи
+# процесса (core/db/sqlite3/base.py).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - в КиБ: 64 МБ страниц на подключение.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+SQLITE_SERIALIZE_WRITES = True
+
+# Реплики только для чтения: YATUBE_REPLICAS - пути к копиям базы через
+# запятую. Ленты читаются с реплик, но в течение REPLICA_PIN_SECONDS
+# после записи - с основной базы (core/db/replicas.py); окно должно
+# быть больше отставания реплик.
+DATABASE_REPLICAS = []
+for _number, _name in enumerate(
+    filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{_number}'] = dict(DATABASES['default'], NAME=_name)
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.'
+        'UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.'
+        'MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.'
+        'CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.'
+        'NumericPasswordValidator',
+    },
+]
+
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+
+STATIC_URL = '/static/'
+
+STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+
+LOGIN_URL = 'users:login'
+LOGIN_REDIRECT_URL = 'posts:home'
+# LOGOUT_REDIRECT_URL = 'posts:index'
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/2.2/howto/static-files/
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Курсорная пагинация лент (?after=/?before=) вместо ?page=N.
+# Ссылки с токенами работают и при выключенной настройке.
+POSTS_KEYSET_PAGINATION = False
+
+# Авторы с таким числом подписчиков не раздаются по лентам при публикации,
+# а подмешиваются в ленту подписок при чтении. None отключает гибридный режим.
+TIMELINE_FANOUT_LIMIT = 5000
+# Потоки, которые раздают в фоне посты авторов, опустившихся ниже порога.
+# 0 - раздавать сразу после коммита транзакции.
+TIMELINE_WORKERS = 1
+
+# Страницы лент живут в кеше долго: при изменениях сигналы сменяют
+# поколение ленты, и старые копии больше не читаются (posts/caching.py).
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Карточки постов кешируются по версии содержимого (posts/cards.py).
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Множества подписок и подписчиков (posts/follow_graph.py) версионируются
+# поколениями лент, как страницы.
+FOLLOW_GRAPH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько секунд CDN может отдавать анонимную страницу ленты без
+# перепроверки (s-maxage); браузеры перепроверяют всегда.
+FEED_PUBLIC_MAX_AGE = 60
+
+# Поиск: 'fts5' - FTS5 в SQLite, 'terms' - обратный индекс в таблице
+# SearchTerm для других баз, 'auto' - FTS5, если таблица есть (posts/search.py).
+SEARCH_BACKEND = 'auto'
+
+# Картинки постов ограничены по размеру файла и по числу пикселей;
+# во views постов загрузка пишется на диск кусками (posts/uploads.py).
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40_000_000
+
+# Число потоков, которые строят миниатюры картинок постов в фоне.
+# 0 - строить сразу после коммита транзакции.
+THUMBNAIL_WORKERS = 2
+
+# Отложенная запись комментариев (posts/comment_queue.py): пачка
+# пишется раз в COMMENT_FLUSH_INTERVAL_MS или по COMMENT_FLUSH_SIZE
+# штук, до записи комментарии лежат в журналах COMMENT_JOURNAL_DIR.
+COMMENT_WRITE_BEHIND = os.environ.get('YATUBE_COMMENT_WRITE_BEHIND') == '1'
+COMMENT_FLUSH_INTERVAL_MS = 200
+COMMENT_FLUSH_SIZE = 100
+COMMENT_JOURNAL_DIR = os.environ.get(
+    'YATUBE_COMMENT_JOURNAL_DIR', os.path.join(BASE_DIR, 'journal')
+)
+
+# Кеш выбирается переменной окружения YATUBE_CACHE:
+#   locmem - память процесса (разработка, один процесс);
+#   file, sqlite - общий кеш процессов одной машины;
+#   redis - общий кеш кластера, адрес в YATUBE_CACHE_LOCATION.
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+    },
+    'redis': {
+        'BACKEND': 'core.cache_backends.RedisCache',
+        'LOCATION': 'localhost:6379/0',
+    },
+}
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'locmem')
+
+
+def cache_config(prefix, backend=CACHE_BACKEND):
+    """Настройки кеша с пространством ключей отдельного приложения."""
+    config = dict(CACHE_BACKENDS[backend], KEY_PREFIX=prefix)
+    config['LOCATION'] = os.environ.get(
+        'YATUBE_CACHE_LOCATION', config['LOCATION']
+    )
+    config['OPTIONS'] = {'MAX_ENTRIES': 10000}
+    return config
+
+
+# Все псевдонимы смотрят в одно хранилище, но с разными префиксами.
+CACHES = {
+    'default': cache_config('yatube'),
+    'posts': cache_config('posts'),
+}
@@ -0,0 +1,17 @@
+"""Разработка: DEBUG и письма в файлах вместо SMTP."""
+import os
+
+from .base import *  # noqa: F401,F403
+from .base import BASE_DIR
+
+YATUBE_ENV = 'dev'
+
+DEBUG = True
+
+#  подключаем движок filebased.EmailBackend
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# указываем директорию, в которую будут складываться файлы писем
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+# Каждый запрос проверяется на N+1 и медленные запросы (core/querylog.py).
+QUERYLOG_SAMPLE_RATE = 1.0
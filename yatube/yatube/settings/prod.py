@@ -0,0 +1,96 @@
+"""Работа под нагрузкой: несколько воркеров за обратным прокси.
+
+Секреты и адреса берутся из окружения: ``YATUBE_SECRET_KEY``,
+``YATUBE_ALLOWED_HOSTS`` (через запятую), ``YATUBE_CACHE`` и
+``YATUBE_CACHE_LOCATION``, ``YATUBE_STATIC_ROOT``.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+from .base import (ALLOWED_HOSTS, BASE_DIR, DATABASES, MIDDLEWARE, TEMPLATES,
+                   cache_config)
+
+YATUBE_ENV = 'prod'
+
+DEBUG = False
+
+# Ключ из репозитория в проде недопустим: он публичный.
+SECRET_KEY = os.environ.get('YATUBE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Не задан YATUBE_SECRET_KEY.')
+
+if os.environ.get('YATUBE_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['YATUBE_ALLOWED_HOSTS'].split(',')
+
+# Подключение к базе живёт между запросами воркера, а не открывается
+# на каждый запрос.
+DATABASES = {
+    alias: dict(
+        config, CONN_MAX_AGE=int(os.environ.get('YATUBE_CONN_MAX_AGE', 60))
+    )
+    for alias, config in DATABASES.items()
+}
+
+# Общий кеш всех воркеров: смена поколения ленты в одном процессе
+# сразу видна остальным (posts/caching.py).
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'redis')
+CACHES = {
+    'default': cache_config('yatube', CACHE_BACKEND),
+    'posts': cache_config('posts', CACHE_BACKEND),
+}
+
+# Сессия читается из кеша, база - только при промахе.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Шаблоны разбираются один раз на процесс, а при старте воркера
+# прогреваются все сразу (core/templates.py). Контекст-процессор debug
+# при выключенном DEBUG ничего не добавляет.
+TEMPLATES = [
+    dict(
+        TEMPLATES[0],
+        APP_DIRS=False,
+        OPTIONS=dict(
+            TEMPLATES[0]['OPTIONS'],
+            context_processors=[
+                processor
+                for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+                if processor != 'django.template.context_processors.debug'
+            ],
+            loaders=[
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        ),
+    ),
+]
+TEMPLATE_WARMUP = True
+
+# Внутренние замеры не уходят клиентам в заголовках.
+PERF_SERVER_TIMING = False
+
+# Имена статики с хешем содержимого: прокси отдаёт её с вечным
+# Cache-Control. Перед стартом нужен collectstatic.
+STATIC_ROOT = os.environ.get(
+    'YATUBE_STATIC_ROOT', os.path.join(BASE_DIR, 'collected_static')
+)
+STATICFILES_STORAGE = (
+    'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+)
+
+# Сжатие первым, чтобы сжимать готовый ответ. Замеры запросов и поиск
+# N+1 (core/perf.py, core/querylog.py) - инструменты разработки, в проде
+# их нет. Остальной стек минимален: сессии, CSRF и аутентификация нужны
+# сайту, сообщения - админке, а Security и X-Frame-Options ставят
+# защитные заголовки.
+INSTRUMENTATION = (
+    'core.perf.PerfMiddleware',
+    'core.querylog.QueryLogMiddleware',
+)
+MIDDLEWARE = ['django.middleware.gzip.GZipMiddleware'] + [
+    middleware for middleware in MIDDLEWARE
+    if middleware not in INSTRUMENTATION
+]
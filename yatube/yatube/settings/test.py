@@ -0,0 +1,22 @@
+"""Тесты: всё в памяти процесса и без фоновых потоков."""
+from .base import *  # noqa: F401,F403
+from .base import DATABASES
+
+YATUBE_ENV = 'test'
+
+# Вторая база для тестов чтения с реплик; включается в тесте через
+# override_settings(DATABASE_REPLICAS=['replica']).
+DATABASES = dict(DATABASES, replica=dict(DATABASES['default']))
+
+# Миниатюры и раздача лент идут сразу после коммита: тесты не должны
+# гоняться с потоками за временной MEDIA_ROOT и базой.
+THUMBNAIL_WORKERS = 0
+TIMELINE_WORKERS = 0
+
+# Стойкий хеш паролей в тестах только замедляет create_user и логин.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Комментарии пишутся сразу; очередь тесты включают сами.
+COMMENT_WRITE_BEHIND = False
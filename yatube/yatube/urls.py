@@ -3,6 +3,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics, perf_dashboard
+
 handler403 = 'core.views.permission_denied'
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
@@ -10,6 +12,8 @@ handler500 = 'core.views.server_error'
 urlpatterns = [
     path('auth/', include('users.urls')),
     path('', include('posts.urls', namespace='posts')),
+    path('admin/perf/', perf_dashboard, name='perf'),
+    path('metrics', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),